@@ -0,0 +1,157 @@
+"""Adaptive admission control: per route class concurrency limits with fast 503 load shedding"""
+import asyncio
+import time
+from collections import defaultdict, deque
+from typing import Dict, Optional
+
+from encoding import encode_json
+from metrics import PROBE_ROUTES, route_template
+
+class Overloaded(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+class AdaptiveLimiter:
+    """Concurrency limit for one class of routes, adjusted AIMD-style from observed latency.
+
+    While requests finish within `target` seconds and at least half the limit
+    is in use, the limit grows by about one per limit's worth of completions.
+    A slower or failed request cuts it by `backoff`, at most once per `target`
+    seconds so a burst of slow completions counts as one signal. Requests over
+    the limit wait in FIFO order, at most `max_queue` of them for up to
+    `max_wait` seconds; past either bound they raise Overloaded.
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, target: float,
+                 max_queue: int = 100, max_wait: Optional[float] = None, backoff: float = 0.9):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target = target
+        self.max_queue = max_queue
+        self.max_wait = target if max_wait is None else max_wait
+        self.backoff = backoff
+        self.in_flight = 0
+        self.waiters: deque = deque()
+        self.shed: Dict[str, int] = defaultdict(int)
+        self._last_decrease = float("-inf")
+
+    async def acquire(self):
+        if self.in_flight < int(self.limit) and not self.waiters:
+            self.in_flight += 1
+            return
+        if len(self.waiters) >= self.max_queue:
+            self.shed["queue_full"] += 1
+            raise Overloaded("queue_full")
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait((waiter,), timeout=self.max_wait)
+        except asyncio.CancelledError:
+            # The client went away while queued; pass on a slot that was already handed over
+            if waiter.done():
+                self._release_slot()
+            else:
+                self.waiters.remove(waiter)
+            raise
+        if not waiter.done():
+            waiter.cancel()
+            self.waiters.remove(waiter)
+            self.shed["timeout"] += 1
+            raise Overloaded("timeout")
+
+    def release(self, latency: float, failed: bool):
+        now = time.monotonic()
+        if failed or latency > self.target:
+            if now - self._last_decrease >= self.target:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+        elif self.in_flight * 2 >= self.limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._release_slot()
+
+    def _release_slot(self):
+        self.in_flight -= 1
+        while self.waiters and self.in_flight < int(self.limit):
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+# Routes never limited: probes must keep answering under overload, and event streams are held open.
+# Uploads last as long as the client takes to send the file, which says nothing about load; they are
+# bounded by UPLOAD_MAX_BYTES and the derivative queue instead.
+ADMISSION_EXEMPT_ROUTES = PROBE_ROUTES | {
+    "/api/messages/events", "/api/metrics/profile", "/api/profiles/{profile_id}/images",
+}
+# GETs that scan, sort or aggregate, limited apart from the cheap lookups
+ADMISSION_LIST_ROUTES = frozenset({
+    "/api/profiles", "/api/status", "/api/messages/conversations", "/api/bookings/stats/overview",
+    "/api/profiles/{profile_id}/slots",
+})
+# Routes that wait on a bcrypt hash, limited apart so their latency doesn't cut the write limit
+ADMISSION_AUTH_ROUTES = frozenset({"/api/auth/register", "/api/auth/login"})
+# Route class -> (initial limit, maximum limit, latency target in seconds)
+ADMISSION_CLASSES = {
+    "read": (64, 512, 0.25),
+    "list": (16, 256, 0.5),
+    "write": (32, 256, 0.5),
+    "auth": (8, 64, 1.0),
+}
+
+def admission_class(method: str, template: str) -> Optional[str]:
+    if template in ADMISSION_EXEMPT_ROUTES:
+        return None
+    if template in ADMISSION_AUTH_ROUTES:
+        return "auth"
+    if method not in ("GET", "HEAD"):
+        return "write"
+    return "list" if template in ADMISSION_LIST_ROUTES else "read"
+
+class AdmissionMiddleware:
+    """ASGI middleware holding each route class to its adaptive concurrency limit.
+
+    What the limit and queue can't take is answered at once with a 503 and
+    Retry-After instead of waiting on the Motor pool until the client gives
+    up, which keeps latency bounded for the requests that are accepted.
+    """
+
+    def __init__(self, app, limiters: Dict[str, AdaptiveLimiter]):
+        self.app = app
+        self.limiters = limiters
+
+    async def __call__(self, scope, receive, send):
+        limiter = None
+        if scope["type"] == "http":
+            limiter = self.limiters.get(admission_class(scope["method"], route_template(scope)))
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await limiter.acquire()
+        except Overloaded:
+            body = encode_json({"detail": "Servidor ocupado, inténtalo de nuevo"})
+            await send({"type": "http.response.start", "status": 503, "headers": [
+                (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), (b"retry-after", b"1"),
+            ]})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        status = 500
+        latency = None
+
+        # Latency runs to the response start: a streamed body takes as long as the client reads it
+        async def send_with_status(message):
+            nonlocal status, latency
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                latency = time.perf_counter() - start
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            limiter.release(time.perf_counter() - start if latency is None else latency, status >= 500)
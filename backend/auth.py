@@ -0,0 +1,126 @@
+"""Password hashing off the event loop, and caches of verified tokens and users"""
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+import bcrypt
+from bson import ObjectId
+
+class AuthCache:
+    """Verified bearer-token claims and the users behind them, both LRU-bounded.
+
+    Claims are reused until the token's exp, so a repeat token costs a dict
+    lookup instead of a signature check. Users are kept for `user_ttl` seconds
+    for /auth/me; logins here refresh them, while edits made through the Node
+    API show up once the entry expires.
+    """
+
+    def __init__(self, max_tokens: int = 10000, max_users: int = 10000, user_ttl: float = 30.0):
+        self.max_tokens = max_tokens
+        self.max_users = max_users
+        self.user_ttl = user_ttl
+        # token -> (claims, exp as a unix time)
+        self.tokens: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        # user id -> (public user, monotonic expiry)
+        self.users: "OrderedDict[ObjectId, Tuple[dict, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, entries: OrderedDict, key, now: float):
+        entry = entries.get(key)
+        if entry is None or entry[1] <= now:
+            if entry is not None:
+                del entries[key]
+            self.misses += 1
+            return None
+        entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    @staticmethod
+    def _put(entries: OrderedDict, key, value, expires: float, limit: int):
+        entries[key] = (value, expires)
+        entries.move_to_end(key)
+        while len(entries) > limit:
+            entries.popitem(last=False)
+
+    def claims(self, token: str) -> Optional[dict]:
+        return self._get(self.tokens, token, time.time())
+
+    def put_claims(self, token: str, claims: dict):
+        self._put(self.tokens, token, claims, claims.get("exp", math.inf), self.max_tokens)
+
+    def user(self, user_id: ObjectId) -> Optional[dict]:
+        return self._get(self.users, user_id, time.monotonic())
+
+    def put_user(self, user: dict):
+        self._put(self.users, user["_id"], user, time.monotonic() + self.user_ttl, self.max_users)
+
+# Checked when no account matches, at the cost models/User.js hashes with, so a login for an
+# unknown email takes as long as one with a wrong password
+DUMMY_PASSWORD_HASH = "$2a$12$6Wkb0s7V4cgoqu9ot1cuXOscR0EJiewz.fY58yf6upXVYPD8te4fK"
+
+class PasswordQueueFull(Exception):
+    pass
+
+class PasswordHasher:
+    """bcrypt off the event loop, in a bounded thread pool.
+
+    bcrypt releases the GIL, so `workers` threads hash in parallel while the
+    loop keeps serving other requests. At most `max_queue` further calls wait
+    for a thread; past that callers get PasswordQueueFull instead of queueing
+    for seconds behind a burst of logins.
+    """
+
+    def __init__(self, workers: int = 4, max_queue: int = 64, rounds: int = 12):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.rounds = rounds
+        self.pending = 0
+        self.rejected = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @staticmethod
+    def _secret(password: str) -> bytes:
+        # bcryptjs only uses the first 72 bytes; the bcrypt package refuses longer input
+        return password.encode("utf-8")[:72]
+
+    async def _run(self, function, *args):
+        if self.pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise PasswordQueueFull()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="password-hash")
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        future = self._executor.submit(function, *args)
+        # Released when the work ends, not when a disconnected caller stops waiting for it
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        return await asyncio.wrap_future(future)
+
+    def _release(self):
+        self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        """A $2a$ hash, the format bcryptjs writes for the Node API"""
+        hashed = await self._run(bcrypt.hashpw, self._secret(password), bcrypt.gensalt(self.rounds, prefix=b"2a"))
+        return hashed.decode()
+
+    async def verify(self, password: str, hashed: Optional[str]) -> bool:
+        """Whether `password` matches `hashed`; without a hash it still spends a bcrypt check and is False"""
+        if not hashed:
+            await self._run(bcrypt.checkpw, self._secret(password), DUMMY_PASSWORD_HASH.encode())
+            return False
+        try:
+            return await self._run(bcrypt.checkpw, self._secret(password), hashed.encode())
+        except ValueError:
+            # Not a bcrypt hash
+            return False
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,329 @@
+"""Benchmarks of the API, its storage engines and the multi-worker launcher"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import time
+import timeit
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from bson import ObjectId
+from pydantic import TypeAdapter
+
+from encoding import encode_json, orjson
+from launcher import load_server
+from search import ProfileIndex
+from storage import MotorStorage, create_storage
+from storage.documents import EPOCH, INBOX_PAGE_MAX
+
+def bench_serialization(sizes=(1, 100, 1000), repeat=5):
+    """Per-row cost of the old validate-twice list path vs. direct encoding of DB rows"""
+    StatusCheck = load_server().StatusCheck
+    adapter = TypeAdapter(List[StatusCheck])
+
+    def validated_path(rows):
+        # What the handler used to do: build models, then FastAPI dumps and re-validates
+        # them against response_model before JSONResponse encodes the result
+        status_checks = [StatusCheck(**row) for row in rows]
+        content = adapter.validate_python([status_check.model_dump() for status_check in status_checks])
+        return json.dumps(
+            adapter.dump_python(content, mode="json"), ensure_ascii=False, separators=(",", ":")
+        ).encode()
+
+    encoder = "orjson" if orjson is not None else "json"
+    print(f"{'rows':>6} {'validated µs/row':>18} {f'{encoder} µs/row':>16} {'speedup':>8}")
+    for size in sizes:
+        rows = [
+            {"id": str(uuid.uuid4()), "client_name": f"client_{i}", "timestamp": datetime.utcnow().replace(microsecond=i % 1000 * 1000)}
+            for i in range(size)
+        ]
+        assert json.loads(validated_path(rows)) == json.loads(encode_json(rows))
+        number = max(1, 20000 // size)
+        before = min(timeit.repeat(lambda: validated_path(rows), number=number, repeat=repeat)) / number / size
+        after = min(timeit.repeat(lambda: encode_json(rows), number=number, repeat=repeat)) / number / size
+        print(f"{size:>6} {before * 1e6:>18.2f} {after * 1e6:>16.2f} {before / after:>7.1f}x")
+
+async def _bench_scenario(client, method: str, url: str, body, requests: int, concurrency: int) -> List[float]:
+    latencies = []
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await client.request(method, url, json=body)
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return sorted(latencies)
+
+async def bench_api(engines=("memory", "motor"), requests=2000, concurrency=16, rows=1000):
+    """The same requests through the in-process ASGI app on each storage engine.
+
+    The memory engine's latency is the framework and serialization floor; the
+    gap up to the Motor engine is what storage costs. The response cache is
+    disabled so every list request reaches the repository. Motor runs against
+    a scratch `<DB_NAME>_bench` database that is dropped afterwards.
+    """
+    import httpx
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    scenarios = {
+        "GET /api/health": ("GET", "/api/health", None),
+        "POST /api/status": ("POST", "/api/status", {"client_name": "bench"}),
+        "GET /api/status?limit=100": ("GET", "/api/status?limit=100", None),
+        "GET /api/status?limit=1000": ("GET", "/api/status?limit=1000", None),
+    }
+    server = load_server()
+    results: Dict[Tuple[str, str], List[float]] = {}
+    for engine in engines:
+        server.configure_storage(engine, db_name=f"{os.environ['DB_NAME']}_bench")
+        server.response_cache.ttl = 0
+        storage = server.storage
+        try:
+            async with server.lifespan(server.app):
+                transport = httpx.ASGITransport(app=server.app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                    for offset in range(0, rows, server.STATUS_BATCH_MAX):
+                        seed = [{"client_name": f"seed_{i}"} for i in range(offset, min(offset + server.STATUS_BATCH_MAX, rows))]
+                        (await client.post("/api/status/batch", json=seed)).raise_for_status()
+                    for name, (method, url, body) in scenarios.items():
+                        await _bench_scenario(client, method, url, body, min(100, requests), concurrency)
+                        results[engine, name] = await _bench_scenario(client, method, url, body, requests, concurrency)
+                if isinstance(storage, MotorStorage):
+                    await storage.client.drop_database(storage.db.name)
+        except Exception as e:
+            print(f"{engine}: skipped ({e})")
+
+    def percentile(latencies: List[float], q: float) -> float:
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    print(f"{'scenario':<28} {'engine':<8} {'p50 ms':>8} {'p99 ms':>8} {'storage share':>14}")
+    for name in scenarios:
+        floor = results.get(("memory", name))
+        for engine in engines:
+            latencies = results.get((engine, name))
+            if latencies is None:
+                continue
+            p50 = percentile(latencies, 0.5)
+            share = f"{1 - percentile(floor, 0.5) / p50:>13.0%}" if floor is not None and engine != "memory" else ""
+            print(f"{name:<28} {engine:<8} {p50 * 1e3:>8.3f} {percentile(latencies, 0.99) * 1e3:>8.3f} {share:>14}")
+
+async def bench_inbox(sizes=(1000, 10000, 100000), conversations=200, repeat=20):
+    """First inbox page from the summaries vs. the aggregation routes/messages.js runs, per history size.
+
+    Runs against a scratch `<DB_NAME>_bench` database that is dropped afterwards.
+    """
+    storage = create_storage("motor", db_name=f"{os.environ['DB_NAME']}_bench")
+    user_id = ObjectId()
+    counterparts = [(ObjectId(), ObjectId()) for _ in range(conversations)]
+    rng = random.Random(0)
+
+    async def timed(operation) -> float:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            await operation()
+            timings.append(time.perf_counter() - started)
+        return sorted(timings)[len(timings) // 2]
+
+    def aggregate():
+        return storage.messages.collection.aggregate([
+            {"$match": {"$or": [{"senderId": user_id}, {"receiverId": user_id}], "isDeleted": False}},
+            {"$sort": {"createdAt": -1}},
+            {"$group": {
+                "_id": {"profileId": "$profileId", "otherUserId": {
+                    "$cond": [{"$eq": ["$senderId", user_id]}, "$receiverId", "$senderId"]}},
+                "lastMessage": {"$first": "$content"},
+                "lastMessageDate": {"$first": "$createdAt"},
+                "unreadCount": {"$sum": {"$cond": [{"$and": [
+                    {"$eq": ["$receiverId", user_id]}, {"$eq": ["$isRead", False]}]}, 1, 0]}},
+            }},
+            {"$sort": {"lastMessageDate": -1}},
+            {"$limit": INBOX_PAGE_MAX},
+        ]).to_list(INBOX_PAGE_MAX)
+
+    try:
+        await storage.ensure_indexes()
+        await storage.messages.collection.create_index([("senderId", 1), ("receiverId", 1), ("createdAt", -1)])
+        print(f"{'messages':>9} {'aggregate ms':>13} {'summaries ms':>13}")
+        seeded = 0
+        started = datetime.utcnow().replace(microsecond=0) - timedelta(days=365)
+        for size in sizes:
+            batch = []
+            for i in range(seeded, size):
+                other_user_id, profile_id = rng.choice(counterparts)
+                outgoing = rng.random() < 0.5
+                batch.append({
+                    "_id": ObjectId(), "senderId": user_id if outgoing else other_user_id,
+                    "receiverId": other_user_id if outgoing else user_id, "profileId": profile_id,
+                    "content": f"Mensaje {i}", "messageType": "text", "isRead": outgoing or rng.random() < 0.8,
+                    "isDeleted": False, "attachments": [], "createdAt": started + timedelta(seconds=i),
+                })
+            if batch:
+                await storage.messages.collection.insert_many(batch, ordered=False)
+            seeded = size
+            await storage.conversations.rebuild(storage.messages.summaries())
+            full = await timed(aggregate)
+            summaries = await timed(lambda: storage.conversations.page(user_id, None, INBOX_PAGE_MAX))
+            print(f"{size:>9} {full * 1e3:>13.2f} {summaries * 1e3:>13.2f}")
+    finally:
+        await storage.client.drop_database(storage.db.name)
+        storage.close()
+
+async def _drive_connection(host: str, port: int, request: bytes, until: float, latencies: List[float]) -> int:
+    """Send `request` back to back on one keep-alive connection until `until`; returns how many weren't 2xx"""
+    errors = 0
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.time() < until:
+            start = time.perf_counter()
+            writer.write(request)
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = re.search(rb"(?i)\r\ncontent-length: *(\d+)", head)
+            await reader.readexactly(int(length.group(1)) if length else 0)
+            latencies.append(time.perf_counter() - start)
+            errors += not head.startswith(b"HTTP/1.1 2")
+    finally:
+        writer.close()
+    return errors
+
+def _load_client(host: str, port: int, request: bytes, connections: int, start_at: float, seconds: float):
+    """One load generator process; returns (latencies, errors)"""
+    async def drive():
+        await asyncio.sleep(max(0.0, start_at - time.time()))
+        latencies: List[float] = []
+        errors = await asyncio.gather(*(
+            _drive_connection(host, port, request, start_at + seconds, latencies) for _ in range(connections)
+        ))
+        return latencies, sum(errors)
+    return asyncio.run(drive())
+
+def bench_workers(counts=(1, 2, 4, 8), seconds=10.0, connections=64, clients=None):
+    """Requests per second through `serve` at each worker count.
+
+    Each count gets a fresh launcher on a free local port with the memory
+    engine, so the numbers are the service's own CPU cost rather than
+    MongoDB's, and admission control off, so nothing is shed. Load comes from
+    `clients` separate processes over `connections` keep-alive connections in
+    total; on a machine with fewer cores than workers plus clients they
+    compete with the workers and the numbers stop scaling.
+    """
+    from urllib.request import urlopen
+
+    clients = clients or max(1, (os.cpu_count() or 1) // 2)
+    body = json.dumps({"client_name": "bench"}).encode()
+    scenarios = {
+        "GET /api/health": b"GET /api/health HTTP/1.1\r\nHost: bench\r\n\r\n",
+        "POST /api/status": (b"POST /api/status HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body),
+    }
+
+    def percentile(latencies: List[float], q: float) -> float:
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else float("nan")
+
+    baseline: Dict[str, float] = {}
+    print(f"cores: {os.cpu_count()}, load generators: {clients}, connections: {connections}")
+    print(f"{'workers':>7} {'scenario':<18} {'req/s':>9} {'vs 1':>6} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    with ProcessPoolExecutor(clients, mp_context=multiprocessing.get_context("spawn")) as pool:
+        for count in counts:
+            with socket.socket() as probe:
+                probe.bind(("127.0.0.1", 0))
+                port = probe.getsockname()[1]
+            launcher = subprocess.Popen(
+                [sys.executable, str(Path(__file__).with_name("manage.py")), "serve", "--workers", str(count),
+                 "--host", "127.0.0.1", "--port", str(port)],
+                env={**os.environ, "STORAGE_ENGINE": "memory", "ADMISSION_CONTROL": "0"},
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            try:
+                deadline = time.monotonic() + 120
+                while True:
+                    try:
+                        with urlopen(f"http://127.0.0.1:{port}/api/metrics", timeout=1) as response:
+                            if f"worker_processes {count}\n" in response.read().decode():
+                                break
+                    except OSError:
+                        pass
+                    if time.monotonic() > deadline or launcher.poll() is not None:
+                        raise RuntimeError(f"{count} workers did not start")
+                    time.sleep(0.2)
+                for name, request in scenarios.items():
+                    results = []
+                    for run_seconds in (1.0, seconds):  # warm-up, then measured
+                        start_at = time.time() + 1
+                        shares = [connections // clients + (i < connections % clients) for i in range(clients)]
+                        results = list(pool.map(_load_client, *zip(*[
+                            ("127.0.0.1", port, request, share, start_at, run_seconds) for share in shares if share
+                        ])))
+                    latencies = sorted(latency for client, _ in results for latency in client)
+                    errors = sum(errors for _, errors in results)
+                    rate = len(latencies) / seconds
+                    baseline.setdefault(name, rate)
+                    print(f"{count:>7} {name:<18} {rate:>9.0f} {rate / baseline[name]:>5.2f}x "
+                          f"{percentile(latencies, 0.5) * 1e3:>8.2f} {percentile(latencies, 0.99) * 1e3:>8.2f} {errors:>7}")
+            finally:
+                launcher.send_signal(signal.SIGTERM)
+                try:
+                    launcher.wait(60)
+                except subprocess.TimeoutExpired:
+                    launcher.kill()
+
+def bench_profile_index(profiles=100000, repeat=5):
+    """Query, rebuild and upsert cost of the profile index at catalogue scale"""
+    rng = random.Random(0)
+    locations = ["Madrid", "Barcelona", "Valencia", "Sevilla", "Zaragoza", "Málaga", "Bilbao", "Alicante"]
+    ethnicities = ["Europea", "Asiática", "Latina", "Africana", "Mixta", "Árabe", "India"]
+    docs = [
+        {
+            "_id": ObjectId(), "name": f"Perfil {i}", "age": rng.randint(18, 60), "location": rng.choice(locations),
+            "ethnicity": rng.choice(ethnicities), "category": rng.choice(["Independiente", "Agencia"]),
+            "rates": {"incall": f"{rng.randint(60, 300)}€", "outcall": f"{rng.randint(100, 400)}€"},
+            "isFeatured": rng.random() < 0.1, "views": {"total": rng.randint(0, 5000)},
+            "services": rng.sample(["Masaje relajante", "Cena", "Acompañamiento", "Viajes", "Fiestas"], 2),
+            "description": f"Chica {rng.choice(ethnicities).lower()} en {rng.choice(locations)}, "
+                           + " ".join(rng.sample(["simpática", "elegante", "discreta", "cariñosa", "divertida", "culta",
+                                                  "alta", "morena", "rubia", "deportista"], rng.randint(1, 6))),
+            "createdAt": EPOCH + timedelta(days=20000, seconds=rng.randint(0, 10 ** 7)), "isActive": True,
+        }
+        for i in range(profiles)
+    ]
+    index = ProfileIndex()
+    started = time.perf_counter()
+    index.rebuild(docs)
+    print(f"rebuild {profiles} profiles: {time.perf_counter() - started:.2f}s")
+    number = 200
+    upsert = min(timeit.repeat(lambda: index.upsert({**rng.choice(docs), "views": {"total": rng.randint(0, 5000)}}),
+                               number=number, repeat=repeat)) / number
+    print(f"upsert: {upsert * 1e6:.1f} µs")
+
+    queries = {
+        "no filter, featured": {},
+        "location": {"location": "Madrid"},
+        "location + ethnicity + category": {"location": "Madrid", "ethnicity": "Latina", "category": "Agencia"},
+        "all facets + age 25-30, price-high": {
+            "location": "Madrid", "ethnicity": "Latina", "category": "Agencia", "min_age": 25, "max_age": 30, "sort": "price-high",
+        },
+        "age 25-30, page 50, newest": {"min_age": 25, "max_age": 30, "sort": "newest", "skip": 49 * 20},
+        "search 'mad', relevance": {"search": "mad", "sort": "relevance"},
+        "search 'latina valen', relevance": {"search": "latina valen", "sort": "relevance"},
+        "search 'perfil 123', featured": {"search": "perfil 123"},
+        "price 100-150 €/h, price-low": {"min_price": 10000, "max_price": 15000, "sort": "price-low"},
+        "location + price from 99.50 €/h, price-high": {"location": "Madrid", "min_price": 9950, "sort": "price-high"},
+    }
+    print(f"{'query':<38} {'total':>7} {'µs/query':>10}")
+    for name, query in queries.items():
+        total, _ = index.query(**query)
+        elapsed = min(timeit.repeat(lambda: index.query(**query), number=number, repeat=repeat)) / number
+        print(f"{name:<38} {total:>7} {elapsed * 1e6:>10.1f}")
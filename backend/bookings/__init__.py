@@ -0,0 +1,11 @@
+"""Booking slots: availability windows, and the bookings holding time in them"""
+from .intervals import IntervalTree
+from .slots import (
+    BOOKING_TIMEZONE, WEEKDAYS, BookingSlots, SlotTaken, SlotUnavailable, availability_windows, booking_interval,
+    parse_time_of_day, to_local, to_utc,
+)
+
+__all__ = [
+    "BOOKING_TIMEZONE", "BookingSlots", "IntervalTree", "SlotTaken", "SlotUnavailable", "WEEKDAYS",
+    "availability_windows", "booking_interval", "parse_time_of_day", "to_local", "to_utc",
+]
@@ -0,0 +1,116 @@
+"""Interval tree over booked time"""
+import random
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+class IntervalNode:
+    __slots__ = ("start", "end", "key", "priority", "left", "right", "max_end")
+
+    def __init__(self, start: datetime, end: datetime, key):
+        self.start, self.end, self.key = start, end, key
+        self.priority = random.random()
+        self.left: Optional["IntervalNode"] = None
+        self.right: Optional["IntervalNode"] = None
+        self.max_end = end
+
+    def update(self):
+        self.max_end = self.end
+        if self.left is not None and self.left.max_end > self.max_end:
+            self.max_end = self.left.max_end
+        if self.right is not None and self.right.max_end > self.max_end:
+            self.max_end = self.right.max_end
+
+class IntervalTree:
+    """Half-open intervals in a treap ordered by (start, key).
+
+    Every node carries the latest end in its subtree, so overlap queries skip
+    whole subtrees that finish before the query starts: O(log n) expected to
+    find an overlap, O(log n + k) to list k of them. Intervals may overlap
+    each other.
+    """
+
+    def __init__(self):
+        self.root: Optional[IntervalNode] = None
+        self.size = 0
+
+    @staticmethod
+    def _split(node: Optional[IntervalNode], key) -> Tuple[Optional[IntervalNode], Optional[IntervalNode]]:
+        """(nodes ordered before `key`, the rest)"""
+        if node is None:
+            return None, None
+        if (node.start, node.key) < key:
+            node.right, right = IntervalTree._split(node.right, key)
+            node.update()
+            return node, right
+        left, node.left = IntervalTree._split(node.left, key)
+        node.update()
+        return left, node
+
+    @staticmethod
+    def _merge(left: Optional[IntervalNode], right: Optional[IntervalNode]) -> Optional[IntervalNode]:
+        if left is None or right is None:
+            return left or right
+        if left.priority > right.priority:
+            left.right = IntervalTree._merge(left.right, right)
+            left.update()
+            return left
+        right.left = IntervalTree._merge(left, right.left)
+        right.update()
+        return right
+
+    def add(self, start: datetime, end: datetime, key):
+        left, right = self._split(self.root, (start, key))
+        self.root = self._merge(self._merge(left, IntervalNode(start, end, key)), right)
+        self.size += 1
+
+    def remove(self, start: datetime, key) -> bool:
+        left, right = self._split(self.root, (start, key))
+        node = right
+        while node is not None and node.left is not None:
+            node = node.left
+        if node is None or (node.start, node.key) != (start, key):
+            self.root = self._merge(left, right)
+            return False
+        # Take the leftmost node off `right`
+        middle, right = self._split(right, (start, key, 1))
+        self.root = self._merge(left, right)
+        self.size -= 1
+        return True
+
+    def overlapping(self, start: datetime, end: datetime) -> List[Tuple[datetime, datetime, Any]]:
+        """Intervals overlapping [start, end), in start order"""
+        found: List[Tuple[datetime, datetime, Any]] = []
+        stack: List[IntervalNode] = []
+        node = self.root
+        while stack or node is not None:
+            # Left spine first, pruning subtrees that end before the query starts
+            while node is not None and node.max_end > start:
+                stack.append(node)
+                node = node.left
+            if not stack:
+                break
+            node = stack.pop()
+            if node.start >= end:
+                break
+            if node.end > start:
+                found.append((node.start, node.end, node.key))
+            node = node.right
+        return found
+
+    def overlaps(self, start: datetime, end: datetime) -> bool:
+        node = self.root
+        while node is not None and node.max_end > start:
+            if node.start < end and node.end > start:
+                return True
+            # An overlap on the left is possible whenever its latest end reaches past `start`;
+            # otherwise only nodes right of this one can still start before `end`
+            if node.left is not None and node.left.max_end > start:
+                node = node.left
+            elif node.start < end:
+                node = node.right
+            else:
+                return False
+        return False
+
+    def __len__(self):
+        return self.size
@@ -0,0 +1,170 @@
+"""Booking slots: weekly availability windows and the bookings holding time in them
+
+Intervals are naive UTC like every stored date; the weekly availability
+windows and a booking's date and time are wall-clock in BOOKING_TIMEZONE.
+"""
+import asyncio
+import os
+import re
+import weakref
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from bson import ObjectId
+
+from .intervals import IntervalTree
+
+BOOKING_TIMEZONE = ZoneInfo(os.environ.get('BOOKING_TIMEZONE', 'Europe/Madrid'))
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+TIME_OF_DAY = re.compile(r"(\d{1,2})(?:[:.h](\d{2}))?h?")
+
+class SlotUnavailable(Exception):
+    pass
+
+class SlotTaken(Exception):
+    pass
+
+def parse_time_of_day(value) -> Optional[timedelta]:
+    """Offset from midnight of "20:00", "9.30", "21h" and the like"""
+    match = TIME_OF_DAY.fullmatch(value.strip().lower()) if isinstance(value, str) else None
+    if match is None:
+        return None
+    offset = timedelta(hours=int(match.group(1)), minutes=int(match.group(2) or 0))
+    return offset if offset <= timedelta(days=1) and int(match.group(2) or 0) < 60 else None
+
+def to_utc(local: datetime) -> datetime:
+    return local.replace(tzinfo=BOOKING_TIMEZONE).astimezone(timezone.utc).replace(tzinfo=None)
+
+def to_local(utc: datetime) -> datetime:
+    return utc.replace(tzinfo=timezone.utc).astimezone(BOOKING_TIMEZONE)
+
+def booking_interval(booking: dict) -> Optional[Tuple[datetime, datetime]]:
+    """When a booking holds its slot; bookings made through the Node API only have date, time and duration"""
+    if booking.get("startsAt") and booking.get("endsAt"):
+        return booking["startsAt"], booking["endsAt"]
+    offset = parse_time_of_day(booking.get("time"))
+    if offset is None or not booking.get("date") or not booking.get("duration"):
+        return None
+    start = to_utc(datetime.combine(to_local(booking["date"]).date(), datetime.min.time()) + offset)
+    return start, start + timedelta(hours=booking["duration"])
+
+def availability_windows(profile: dict, first: date, last: date) -> List[Tuple[datetime, datetime]]:
+    """The profile's open intervals on the days `first` to `last`, merged and in start order.
+
+    Windows ending at or before their start run past midnight, so the evening
+    before `first` is included too. Missing hours default like models/Profile.js:
+    open all day except on Sundays.
+    """
+    availability = profile.get("availability") or {}
+    merged: List[Tuple[datetime, datetime]] = []
+    day = first - timedelta(days=1)
+    while day <= last:
+        name = WEEKDAYS[day.weekday()]
+        hours = availability.get(name) or {}
+        if hours.get("available", name != "sunday"):
+            opens, closes = parse_time_of_day(hours.get("start")), parse_time_of_day(hours.get("end"))
+            if opens is None or closes is None:
+                opens, closes = timedelta(0), timedelta(days=1)
+            elif closes <= opens:
+                closes += timedelta(days=1)
+            midnight = datetime.combine(day, datetime.min.time())
+            start, end = to_utc(midnight + opens), to_utc(midnight + closes)
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+            else:
+                merged.append((start, end))
+        day += timedelta(days=1)
+    return merged
+
+class BookingSlots:
+    """Per-profile interval trees of the bookings holding a slot, built lazily and kept current.
+
+    reserve() checks and inserts under a per-profile lock, so requests on one
+    worker can't both take a slot. Trees are per worker, so after inserting it
+    also re-reads the profile's bookings around the slot and backs out if an
+    overlapping one got in through another worker: racing requests may both
+    be refused, never both accepted.
+    """
+
+    def __init__(self, bookings, max_profiles: int = 10000):
+        self.bookings = bookings
+        self.max_profiles = max_profiles
+        self.trees: "OrderedDict[ObjectId, IntervalTree]" = OrderedDict()
+        self._locks: "weakref.WeakValueDictionary[ObjectId, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def _lock(self, profile_id: ObjectId) -> asyncio.Lock:
+        lock = self._locks.get(profile_id)
+        if lock is None:
+            lock = self._locks[profile_id] = asyncio.Lock()
+        return lock
+
+    async def _tree(self, profile_id: ObjectId) -> IntervalTree:
+        """The profile's tree, loaded on first use; call with the profile's lock held"""
+        tree = self.trees.get(profile_id)
+        if tree is not None:
+            self.trees.move_to_end(profile_id)
+            return tree
+        tree = IntervalTree()
+        # Durations are at most a day, so bookings dated before the day before yesterday have ended
+        for booking in await self.bookings.holding(profile_id, datetime.utcnow() - timedelta(days=2)):
+            interval = booking_interval(booking)
+            if interval is not None:
+                tree.add(*interval, booking["_id"])
+        self.trees[profile_id] = tree
+        if len(self.trees) > self.max_profiles:
+            self.trees.popitem(last=False)
+        return tree
+
+    async def reserve(self, booking: dict, windows: List[Tuple[datetime, datetime]]):
+        """Insert `booking` if its slot is inside `windows` and free; SlotUnavailable or SlotTaken otherwise"""
+        start, end = booking["startsAt"], booking["endsAt"]
+        if not any(opens <= start and end <= closes for opens, closes in windows):
+            raise SlotUnavailable()
+        profile_id = booking["profileId"]
+        lock = self._lock(profile_id)
+        async with lock:
+            tree = await self._tree(profile_id)
+            if tree.overlaps(start, end):
+                raise SlotTaken()
+            await self.bookings.insert(booking)
+            tree.add(start, end, booking["_id"])
+
+            nearby = await self.bookings.holding(profile_id, booking["date"] - timedelta(days=2), booking["date"] + timedelta(days=2))
+            for other in nearby:
+                interval = booking_interval(other) if other["_id"] != booking["_id"] else None
+                if interval is not None and interval[0] < end and interval[1] > start:
+                    await self.bookings.delete(booking["_id"])
+                    # Reloaded with the other worker's booking on next use
+                    self.trees.pop(profile_id, None)
+                    raise SlotTaken()
+
+    def hold(self, booking: dict):
+        """A booking moved back into a holding status"""
+        tree, interval = self.trees.get(booking["profileId"]), booking_interval(booking)
+        if tree is not None and interval is not None:
+            tree.add(*interval, booking["_id"])
+
+    def release(self, booking: dict):
+        """A booking was cancelled, completed or marked no-show"""
+        tree, interval = self.trees.get(booking["profileId"]), booking_interval(booking)
+        if tree is not None and interval is not None:
+            tree.remove(interval[0], booking["_id"])
+
+    async def free_slots(self, profile_id: ObjectId, windows: List[Tuple[datetime, datetime]],
+                         min_length: timedelta) -> List[Tuple[datetime, datetime]]:
+        """`windows` minus the profile's bookings, keeping gaps of at least `min_length`"""
+        lock = self._lock(profile_id)
+        async with lock:
+            tree = await self._tree(profile_id)
+        free = []
+        for opens, closes in windows:
+            cursor = opens
+            for start, end, _ in tree.overlapping(opens, closes):
+                if start > cursor:
+                    free.append((cursor, start))
+                cursor = max(cursor, end)
+            if cursor < closes:
+                free.append((cursor, closes))
+        return [(start, end) for start, end in free if end - start >= min_length]
@@ -0,0 +1,122 @@
+"""Read-through cache of encoded API responses, invalidated per collection across workers"""
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import Response
+
+logger = logging.getLogger(__name__)
+
+class CacheEntry:
+    __slots__ = ("body", "etag", "headers", "expires", "version")
+
+    def __init__(self, body: bytes, headers: Dict[str, str], expires: float, version: Tuple[int, int]):
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        self.headers = headers
+        self.expires = expires
+        self.version = version
+
+class ResponseCache:
+    """Read-through cache of encoded API responses with TTL and LRU eviction by entries and bytes.
+
+    Entries are grouped by namespace (one per collection). A write calls
+    invalidate(), which drops the namespace locally at once and bumps its
+    generation in the shared `cache_generations` collection in the background,
+    one bump for all the writes made while the previous one was in flight.
+    Other workers re-read that generation at most every `sync_interval` seconds
+    and ignore entries built under an older one.
+    """
+
+    def __init__(self, generations, ttl: float = 30.0, max_entries: int = 1024,
+                 max_bytes: int = 32 * 1024 * 1024, sync_interval: float = 1.0):
+        self.generations = generations
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sync_interval = sync_interval
+        self.entries: "OrderedDict[Tuple[str, str], CacheEntry]" = OrderedDict()
+        self.size = 0
+        self._shared: Dict[str, int] = {}
+        self._local: Dict[str, int] = {}
+        self._synced_at: Dict[str, float] = {}
+        self._dirty: set = set()
+        self._publishing: Dict[str, asyncio.Task] = {}
+
+    async def _version(self, namespace: str) -> Tuple[int, int]:
+        now = time.monotonic()
+        if now - self._synced_at.get(namespace, float("-inf")) >= self.sync_interval:
+            self._synced_at[namespace] = now
+            self._shared[namespace] = await self.generations.get(namespace)
+        return self._shared.get(namespace, 0), self._local.get(namespace, 0)
+
+    async def fetch(self, namespace: str, key: str,
+                    build: Callable[[], Awaitable[Tuple[bytes, Dict[str, str]]]]) -> CacheEntry:
+        """Cached response for `key`, calling build() for (body, headers) on a miss"""
+        version = await self._version(namespace)
+        entry = self.entries.get((namespace, key))
+        if entry is not None and entry.version == version and entry.expires > time.monotonic():
+            self.entries.move_to_end((namespace, key))
+            return entry
+
+        body, headers = await build()
+        entry = CacheEntry(body, headers, time.monotonic() + self.ttl, version)
+        if self.ttl > 0 and len(body) <= self.max_bytes:
+            self._store((namespace, key), entry)
+        return entry
+
+    def _store(self, key, entry: CacheEntry):
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous.body)
+        self.entries[key] = entry
+        self.size += len(entry.body)
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted.body)
+
+    def invalidate(self, namespace: str):
+        # Entries being built right now captured the old local epoch and won't be served
+        self._local[namespace] = self._local.get(namespace, 0) + 1
+        for key in [key for key in self.entries if key[0] == namespace]:
+            self.size -= len(self.entries.pop(key).body)
+
+        self._dirty.add(namespace)
+        if namespace not in self._publishing:
+            self._publishing[namespace] = asyncio.create_task(self._publish(namespace))
+
+    async def _publish(self, namespace: str):
+        try:
+            while namespace in self._dirty:
+                self._dirty.discard(namespace)
+                try:
+                    self._shared[namespace] = await self.generations.bump(namespace)
+                except Exception:
+                    # Left dirty, so the next write or close() tries again
+                    self._dirty.add(namespace)
+                    logger.exception("Bumping the %s cache generation failed", namespace)
+                    return
+        finally:
+            del self._publishing[namespace]
+
+    async def close(self):
+        """Publish the generation of every namespace written since its last bump"""
+        for namespace in self._dirty.difference(self._publishing):
+            self._publishing[namespace] = asyncio.create_task(self._publish(namespace))
+        await asyncio.gather(*self._publishing.values())
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    # If-None-Match uses weak comparison
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+def cached_response(entry: CacheEntry, if_none_match: Optional[str]) -> Response:
+    headers = {**entry.headers, "ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
@@ -0,0 +1,276 @@
+"""Integer counters keyed by short byte strings, per process or shared by the workers of `manage.py serve`"""
+import struct
+import threading
+import time
+import zlib
+from collections import defaultdict
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Dict, Iterator, List, Tuple
+
+class CountersFull(Exception):
+    pass
+
+class LocalCounters:
+    """The counters of a single process. A counter that reaches zero is dropped."""
+
+    def __init__(self):
+        self.values: Dict[bytes, int] = {}
+
+    def add(self, key: bytes, delta: int) -> int:
+        value = self.values.get(key, 0) + delta
+        if value:
+            self.values[key] = value
+        else:
+            self.values.pop(key, None)
+        return value
+
+    def get(self, key: bytes) -> int:
+        return self.values.get(key, 0)
+
+    def move(self, source: bytes, target: bytes) -> int:
+        """Add the value of `source` onto `target` and zero it; returns the value moved"""
+        value = self.values.pop(source, 0)
+        if value:
+            self.add(target, value)
+        return value
+
+    def take(self, key: bytes) -> int:
+        """Zero `key`; returns the value it had"""
+        return self.values.pop(key, 0)
+
+    def items(self, prefix: bytes = b"") -> List[Tuple[bytes, int]]:
+        return [(key, value) for key, value in self.values.items() if key.startswith(prefix)]
+
+    def own_items(self, prefix: bytes = b"") -> List[Tuple[bytes, int]]:
+        # A single process owns all of them
+        return self.items(prefix)
+
+    def __len__(self):
+        return len(self.values)
+
+class SharedCounters:
+    """Counters in a shared memory segment, with one stripe of the table per worker.
+
+    Each process writes only to its own stripe and reads sum every stripe,
+    so counting takes no lock shared between processes. A stripe is an
+    open-addressing table with linear probing: each slot holds a key of up
+    to KEY_SIZE bytes and a signed 64-bit value. Counters that reach zero
+    are deleted by shifting the rest of their probe run back, so a stripe
+    only holds live keys. Like a WorkerSegment slot, a stripe has a sequence
+    number that is odd while its writer is changing it, and readers retry
+    rather than see a half-shifted probe run. A stripe outlives its worker:
+    the replacement given the same slot keeps counting in it.
+    """
+
+    KEY_SIZE = 87
+    HEADER = struct.Struct("<QQ")  # capacity per stripe, stripes
+    STRIPE_HEADER = struct.Struct("<QQ")  # sequence, used slots
+    SLOT = struct.Struct(f"<B{KEY_SIZE}sq")  # key length, key, value
+    VALUE = struct.Struct("<q")
+    # Past this share of used slots, new keys raise CountersFull instead of slowing every probe
+    MAX_LOAD = 0.9
+
+    def __init__(self, memory: shared_memory.SharedMemory, stripe: int):
+        self.memory = memory
+        self.capacity, self.stripes = self.HEADER.unpack_from(memory.buf, 0)
+        self.stripe = stripe
+        # The stripe headers sit together after HEADER, so one unpack reads them all
+        self._headers = struct.Struct(f"<{2 * self.stripes}Q")
+        self._header = self._header_offset(stripe)
+        self._table = self._table_offset(stripe)
+        # Writes from several threads of this process would otherwise interleave in the stripe
+        self._thread_lock = threading.Lock()
+
+    @classmethod
+    def create(cls, capacity: int, stripes: int, stripe: int = 0) -> "SharedCounters":
+        """A zeroed table of `stripes` stripes of `capacity` keys, written through `stripe`"""
+        size = cls.HEADER.size + stripes * (cls.STRIPE_HEADER.size + capacity * cls.SLOT.size)
+        memory = shared_memory.SharedMemory(create=True, size=size)
+        cls.HEADER.pack_into(memory.buf, 0, capacity, stripes)
+        return cls(memory, stripe)
+
+    @classmethod
+    def attach(cls, name: str, stripe: int) -> "SharedCounters":
+        return cls(shared_memory.SharedMemory(name=name), stripe)
+
+    def _header_offset(self, stripe: int) -> int:
+        return self.HEADER.size + stripe * self.STRIPE_HEADER.size
+
+    def _table_offset(self, stripe: int) -> int:
+        return self._header_offset(self.stripes) + stripe * self.capacity * self.SLOT.size
+
+    @contextmanager
+    def _writing(self):
+        buffer = self.memory.buf
+        with self._thread_lock:
+            sequence = self.STRIPE_HEADER.unpack_from(buffer, self._header)[0]
+            struct.pack_into("<Q", buffer, self._header, sequence + 1)
+            try:
+                yield
+            finally:
+                struct.pack_into("<Q", buffer, self._header, sequence + 2)
+
+    def _read(self, stripe: int, read):
+        """`read(table offset)` of `stripe` at a moment its writer wasn't changing it"""
+        buffer = self.memory.buf
+        header, table = self._header_offset(stripe), self._table_offset(stripe)
+        while True:
+            sequence = self.STRIPE_HEADER.unpack_from(buffer, header)[0]
+            if sequence % 2 == 0:
+                result = read(table)
+                if self.STRIPE_HEADER.unpack_from(buffer, header)[0] == sequence:
+                    return result
+            time.sleep(0)
+
+    def _used_stripes(self) -> List[int]:
+        headers = self._headers.unpack_from(self.memory.buf, self.HEADER.size)
+        return [stripe for stripe in range(self.stripes) if headers[2 * stripe + 1]]
+
+    def recover(self, stripe: int):
+        """Let readers back into `stripe` after its writer died in the middle of a change"""
+        sequence = self.STRIPE_HEADER.unpack_from(self.memory.buf, self._header_offset(stripe))[0]
+        if sequence % 2:
+            struct.pack_into("<Q", self.memory.buf, self._header_offset(stripe), sequence + 1)
+
+    def _offset(self, index: int) -> int:
+        return self._table + index * self.SLOT.size
+
+    def _home(self, key: bytes) -> int:
+        # crc32 rather than hash(), which differs between processes
+        return zlib.crc32(key) % self.capacity
+
+    def _find(self, key: bytes) -> Tuple[int, bool]:
+        """(slot holding `key` or the empty slot ending its probe run, whether it was found)"""
+        buffer = self.memory.buf
+        index = self._home(key)
+        for _ in range(self.capacity):
+            length, stored, _ = self.SLOT.unpack_from(buffer, self._offset(index))
+            if length == 0:
+                return index, False
+            if stored[:length] == key:
+                return index, True
+            index = (index + 1) % self.capacity
+        return -1, False
+
+    def _value(self, index: int) -> int:
+        return self.SLOT.unpack_from(self.memory.buf, self._offset(index))[2]
+
+    def _write(self, index: int, key: bytes, value: int):
+        self.SLOT.pack_into(self.memory.buf, self._offset(index), len(key), key, value)
+
+    def _used(self, delta: int = 0) -> int:
+        sequence, used = self.STRIPE_HEADER.unpack_from(self.memory.buf, self._header)
+        if delta:
+            self.STRIPE_HEADER.pack_into(self.memory.buf, self._header, sequence, used + delta)
+        return used + delta
+
+    def _delete(self, index: int):
+        """Empty `index`, moving later keys of its probe run back so none is cut off from its home slot"""
+        buffer = self.memory.buf
+        empty = index
+        while True:
+            index = (index + 1) % self.capacity
+            length, stored, value = self.SLOT.unpack_from(buffer, self._offset(index))
+            if length == 0:
+                break
+            home = self._home(stored[:length])
+            # A key whose home lies cyclically in (empty, index] would be unreachable from it at `empty`
+            if (empty < home <= index) if empty < index else (home > empty or home <= index):
+                continue
+            self._write(empty, stored[:length], value)
+            empty = index
+        self.SLOT.pack_into(buffer, self._offset(empty), 0, b"", 0)
+        self._used(-1)
+
+    def _add(self, key: bytes, delta: int) -> int:
+        index, found = self._find(key)
+        if not found:
+            if not delta:
+                return 0
+            if index < 0 or self._used() + 1 > self.MAX_LOAD * self.capacity:
+                raise CountersFull()
+            self._write(index, key, delta)
+            self._used(1)
+            return delta
+        value = self._value(index) + delta
+        if value:
+            self._write(index, key, value)
+        else:
+            self._delete(index)
+        return value
+
+    def add(self, key: bytes, delta: int) -> int:
+        """Add `delta` to this process's count of `key`; returns that count"""
+        if len(key) > self.KEY_SIZE:
+            raise ValueError(f"Counter keys are at most {self.KEY_SIZE} bytes")
+        with self._writing():
+            return self._add(key, delta)
+
+    def get(self, key: bytes) -> int:
+        """The count of `key` summed over every stripe"""
+        home, length, size = self._home(key), len(key), self.SLOT.size
+        buffer, value_offset = self.memory.buf, 1 + self.KEY_SIZE
+
+        def read(table):
+            # Only the length byte and key bytes of each slot, as this runs per stripe on every profile view
+            for index in range(home, home + self.capacity):
+                offset = table + index % self.capacity * size
+                stored_length = buffer[offset]
+                if stored_length == 0:
+                    return 0
+                if stored_length == length and buffer[offset + 1:offset + 1 + length] == key:
+                    return self.VALUE.unpack_from(buffer, offset + value_offset)[0]
+            return 0
+
+        return sum(self._read(stripe, read) for stripe in self._used_stripes())
+
+    def move(self, source: bytes, target: bytes) -> int:
+        """Add this process's count of `source` onto `target` and zero it; returns the value moved"""
+        with self._writing():
+            index, found = self._find(source)
+            if not found:
+                return 0
+            value = self._value(index)
+            self._add(target, value)
+            # Looked up again, as a target brought to zero is deleted and that shifts slots
+            self._add(source, -value)
+            return value
+
+    def take(self, key: bytes) -> int:
+        """Zero this process's count of `key`; returns the value it had"""
+        with self._writing():
+            index, found = self._find(key)
+            if not found:
+                return 0
+            value = self._value(index)
+            self._delete(index)
+            return value
+
+    def _slots(self, stripe: int) -> Iterator[Tuple[bytes, int]]:
+        # One copy of the stripe and a C-level unpack rather than a struct call per slot
+        end = self.capacity * self.SLOT.size
+        table = self._read(stripe, lambda table: bytes(self.memory.buf[table:table + end]))
+        for length, stored, value in self.SLOT.iter_unpack(table):
+            if length:
+                yield stored[:length], value
+
+    def own_items(self, prefix: bytes = b"") -> List[Tuple[bytes, int]]:
+        """This process's counts, the ones add(), move() and take() change"""
+        return [(key, value) for key, value in self._slots(self.stripe) if key.startswith(prefix)]
+
+    def items(self, prefix: bytes = b"") -> List[Tuple[bytes, int]]:
+        """Every key with its count summed over the stripes"""
+        totals: Dict[bytes, int] = defaultdict(int)
+        for stripe in self._used_stripes():
+            for key, value in self._slots(stripe):
+                if key.startswith(prefix):
+                    totals[key] += value
+        return [(key, value) for key, value in totals.items() if value]
+
+    def __len__(self):
+        # Keys in this process's stripe
+        return self._used()
+
+    def close(self):
+        self.memory.close()
@@ -0,0 +1,31 @@
+"""JSON encoding of trusted database rows, for responses built without pydantic"""
+import json
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+try:
+    import orjson
+except ImportError:  # falls back to the stdlib encoder
+    orjson = None
+
+
+def to_iso_string(value: datetime) -> str:
+    """`value` as UTC with millisecond precision and a Z suffix, like JavaScript's Date.toISOString"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(timespec="milliseconds") + "Z"
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return to_iso_string(value)
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def encode_json(content) -> bytes:
+    """Encode trusted DB rows straight to JSON bytes (datetimes as toISOString does; ObjectIds as hex)"""
+    if orjson is not None:
+        # orjson would write datetimes itself, with microseconds and no Z
+        return orjson.dumps(content, default=_json_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(content, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode()
@@ -0,0 +1,228 @@
+"""Uploaded images: streamed multipart receipt and resized derivatives rendered in a process pool
+
+Uploads are served at /api/uploads like express.static('uploads') in server.js.
+Originals are named by content hash, so the same file uploaded twice is stored once.
+"""
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import multipart
+from fastapi import HTTPException, Request
+from multipart.multipart import parse_options_header
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).parent
+
+UPLOAD_DIR = Path(os.environ.get('UPLOAD_DIR', str(ROOT_DIR / 'uploads')))
+UPLOAD_URL = "/api/uploads"
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', str(10 * 1024 * 1024)))
+PROFILE_IMAGES_MAX = 20
+# Derivative name -> (width, height, crop); "card" fills the ProfileCard grid cell, "large" fits the detail view
+IMAGE_SIZES = {"card": (400, 500, True), "large": (1200, 1500, False)}
+
+def image_format(head: bytes) -> Optional[str]:
+    """File extension for the leading bytes of a JPEG, PNG or WebP image"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+def derivative_name(filename: str, size: str) -> str:
+    return f"{filename.rsplit('.', 1)[0]}-{size}.jpg"
+
+def render_derivatives(source: str) -> List[str]:
+    """Write every IMAGE_SIZES derivative of `source` next to it; runs in the image worker processes"""
+    written = []
+    with Image.open(source) as image:
+        # Lets JPEG decode at a fraction of full resolution when that still covers the largest size
+        image.draft("RGB", max((width, height) for width, height, _ in IMAGE_SIZES.values()))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        for size, (width, height, crop) in IMAGE_SIZES.items():
+            if crop:
+                derivative = ImageOps.fit(image, (width, height), Image.LANCZOS)
+            else:
+                derivative = image.copy()
+                derivative.thumbnail((width, height), Image.LANCZOS)
+            target = os.path.join(os.path.dirname(source), derivative_name(os.path.basename(source), size))
+            derivative.save(target + ".tmp", "JPEG", quality=82, optimize=True, progressive=True)
+            os.replace(target + ".tmp", target)
+            written.append(size)
+    return written
+
+class ImageDerivatives:
+    """Resized copies of uploaded images, rendered in a process pool.
+
+    Uploads only enqueue a job, so their latency doesn't depend on decoding
+    and resizing. `workers` processes render at once and up to `max_queue`
+    files wait; past that a job is dropped and the image is served at its
+    original size. Jobs for a file already queued share one render.
+    """
+
+    def __init__(self, directory: Path, workers: int = 2, max_queue: int = 256):
+        self.directory = directory
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        # filename -> callbacks waiting for its derivatives
+        self.waiting: Dict[str, List[Callable[[Dict[str, str]], Awaitable]]] = {}
+        self.rendered = 0
+        self.failed = 0
+        self.dropped = 0
+        self._tasks: List[asyncio.Task] = []
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def existing(self, filename: str) -> Optional[Dict[str, str]]:
+        """URLs of the derivatives of `filename` if all of them are on disk"""
+        names = {size: derivative_name(filename, size) for size in IMAGE_SIZES}
+        if all((self.directory / name).exists() for name in names.values()):
+            return {size: f"{UPLOAD_URL}/{name}" for size, name in names.items()}
+        return None
+
+    def submit(self, filename: str, done: Callable[[Dict[str, str]], Awaitable]) -> bool:
+        """Render `filename` in the background and await done(urls) when it's ready"""
+        if filename in self.waiting:
+            self.waiting[filename].append(done)
+            return True
+        try:
+            self.queue.put_nowait(filename)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning("Image derivative queue is full, serving %s at its original size", filename)
+            return False
+        self.waiting[filename] = [done]
+        if not self._tasks:
+            # Spawned rather than forked, so workers don't inherit the loop and its threads
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        return True
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            filename = await self.queue.get()
+            try:
+                await loop.run_in_executor(self._executor, render_derivatives, str(self.directory / filename))
+            except Exception:
+                self.failed += 1
+                logger.exception("Rendering derivatives of %s failed", filename)
+                self.waiting.pop(filename, None)
+                continue
+            finally:
+                self.queue.task_done()
+            self.rendered += 1
+            urls = {size: f"{UPLOAD_URL}/{derivative_name(filename, size)}" for size in IMAGE_SIZES}
+            for done in self.waiting.pop(filename, []):
+                try:
+                    await done(urls)
+                except Exception:
+                    logger.exception("Recording derivatives of %s failed", filename)
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+async def receive_image(request: Request, field: str = "image") -> str:
+    """Stream the `field` file of a multipart body to UPLOAD_DIR; returns its stored file name.
+
+    The body is parsed as it arrives and written chunk by chunk while being
+    hashed, so memory stays flat whatever the file size. The file is then
+    renamed to its SHA-256, and dropped if that content is already stored.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise HTTPException(status_code=400, detail="Se esperaba un formulario multipart")
+    if int(request.headers.get("content-length") or 0) > UPLOAD_MAX_BYTES + 64 * 1024:
+        raise HTTPException(status_code=413, detail="Imagen demasiado grande")
+
+    events: List[Tuple[str, bytes]] = []
+    def collect(kind):
+        return lambda data=b"", start=0, end=0: events.append((kind, data[start:end]))
+    parser = multipart.MultipartParser(options[b"boundary"], {
+        "on_part_begin": collect("begin"), "on_header_field": collect("field"), "on_header_value": collect("value"),
+        "on_header_end": collect("header"), "on_headers_finished": collect("headers"),
+        "on_part_data": collect("data"), "on_part_end": collect("end"),
+    })
+
+    incoming = UPLOAD_DIR / ".incoming"
+    await asyncio.to_thread(incoming.mkdir, parents=True, exist_ok=True)
+    temporary = incoming / uuid.uuid4().hex
+    handle = None
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    extension = None
+    header_field = header_value = b""
+    headers: Dict[bytes, bytes] = {}
+    receiving = found = False
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            data = bytearray()
+            for kind, value in events:
+                if kind == "begin":
+                    headers, header_field, header_value = {}, b"", b""
+                elif kind == "field":
+                    header_field += value
+                elif kind == "value":
+                    header_value += value
+                elif kind == "header":
+                    headers[header_field.lower()] = header_value
+                    header_field = header_value = b""
+                elif kind == "headers":
+                    _, disposition = parse_options_header(headers.get(b"content-disposition", b""))
+                    receiving = not found and disposition.get(b"name") == field.encode() and b"filename" in disposition
+                    found = found or receiving
+                elif kind == "data" and receiving:
+                    data += value
+                elif kind == "end":
+                    receiving = False
+            events.clear()
+            if not data:
+                continue
+            size += len(data)
+            if size > UPLOAD_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="Imagen demasiado grande")
+            digest.update(data)
+            if extension is None:
+                # Sniff the format from the content rather than trusting the declared type
+                head += data[:12 - len(head)]
+                if len(head) >= 12:
+                    extension = image_format(head)
+                    if extension is None:
+                        raise HTTPException(status_code=400, detail="Solo se permiten imágenes JPEG, PNG o WebP")
+            if handle is None:
+                handle = await asyncio.to_thread(open, temporary, "wb")
+            await asyncio.to_thread(handle.write, data)
+        parser.finalize()
+        if handle is None:
+            raise HTTPException(status_code=400, detail="Imagen requerida")
+        if extension is None:
+            raise HTTPException(status_code=400, detail="Solo se permiten imágenes JPEG, PNG o WebP")
+        await asyncio.to_thread(handle.close)
+        filename = f"{digest.hexdigest()}.{extension}"
+        target = UPLOAD_DIR / filename
+        if await asyncio.to_thread(target.exists):
+            await asyncio.to_thread(temporary.unlink)
+        else:
+            await asyncio.to_thread(os.replace, temporary, target)
+        return filename
+    finally:
+        if handle is not None and not handle.closed:
+            await asyncio.to_thread(handle.close)
+        if await asyncio.to_thread(temporary.exists):
+            await asyncio.to_thread(temporary.unlink)
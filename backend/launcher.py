@@ -0,0 +1,256 @@
+"""Pre-fork launcher for `manage.py serve` and the shared memory its workers publish metrics through"""
+import importlib.util
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import struct
+import sys
+import tempfile
+import time
+from importlib.machinery import SourceFileLoader
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from counters import SharedCounters
+from metrics import merge_metrics
+
+logger = logging.getLogger(__name__)
+
+def load_server():
+    """The FastAPI service module: server.py, or server.py.backup when there is no server.py"""
+    try:
+        return importlib.import_module("server")
+    except ModuleNotFoundError as e:
+        if e.name != "server":
+            raise
+    path = Path(__file__).with_name("server.py.backup")
+    loader = SourceFileLoader("server", str(path))
+    spec = importlib.util.spec_from_loader("server", loader)
+    module = importlib.util.module_from_spec(spec)
+    # Registered before running, like an import, so modules importing it during setup get this one
+    sys.modules["server"] = module
+    try:
+        loader.exec_module(module)
+    except BaseException:
+        del sys.modules["server"]
+        raise
+    return module
+
+WORKER_EMPTY, WORKER_STARTING, WORKER_READY, WORKER_STOPPING = range(4)
+
+class WorkerSegment:
+    """Shared memory through which `manage.py serve` workers pool their metrics.
+
+    One slot per worker holds its latest metrics render, rewritten every
+    second and on shutdown; slot 0 holds the counters of workers that have
+    exited, folded in by the launcher so global counters never go backwards.
+    Each slot has a single writer and a sequence number that is odd while a
+    write is in progress, so readers retry instead of seeing a torn render.
+    """
+
+    HEADER = struct.Struct("<QIIdI4x")  # sequence, pid, state, published, payload length
+
+    def __init__(self, memory: shared_memory.SharedMemory, slots: int, slot: Optional[int] = None):
+        self.memory = memory
+        self.slots = slots
+        self.slot_size = memory.size // slots
+        self.slot = slot
+
+    @classmethod
+    def create(cls, slots: int, slot_size: int) -> "WorkerSegment":
+        return cls(shared_memory.SharedMemory(create=True, size=slots * slot_size), slots)
+
+    @classmethod
+    def attach(cls, name: str, slots: int, slot: int) -> "WorkerSegment":
+        return cls(shared_memory.SharedMemory(name=name), slots, slot)
+
+    def write(self, slot: int, payload: bytes, state: int):
+        buffer = self.memory.buf
+        offset = slot * self.slot_size
+        capacity = self.slot_size - self.HEADER.size
+        if len(payload) > capacity:
+            logger.warning("Worker metrics render is %d bytes, truncated to the %d byte slot", len(payload), capacity)
+            payload = payload[:payload.rfind(b"\n", 0, capacity) + 1]
+        sequence = self.HEADER.unpack_from(buffer, offset)[0]
+        self.HEADER.pack_into(buffer, offset, sequence + 1, os.getpid(), state, time.time(), len(payload))
+        start = offset + self.HEADER.size
+        buffer[start:start + len(payload)] = payload
+        self.HEADER.pack_into(buffer, offset, sequence + 2, os.getpid(), state, time.time(), len(payload))
+
+    def read(self, slot: int) -> Tuple[int, bytes]:
+        """(state, payload) of `slot`"""
+        buffer = self.memory.buf
+        offset = slot * self.slot_size
+        while True:
+            sequence, _, state, _, length = self.HEADER.unpack_from(buffer, offset)
+            start = offset + self.HEADER.size
+            payload = bytes(buffer[start:start + length])
+            if sequence % 2 == 0 and self.HEADER.unpack_from(buffer, offset)[0] == sequence:
+                return state, payload
+            time.sleep(0)
+
+    def publish(self, text: str, state: int = WORKER_READY):
+        self.write(self.slot, text.encode(), state)
+
+    def snapshots(self) -> List[Tuple[str, str]]:
+        """(worker, render) of the retired counters and the latest render of every live worker"""
+        texts = []
+        for slot in range(self.slots):
+            state, payload = self.read(slot)
+            if payload and (slot == 0 or state in (WORKER_READY, WORKER_STOPPING)):
+                texts.append(("retired" if slot == 0 else str(slot), payload.decode()))
+        return texts
+
+    def ready(self) -> int:
+        return sum(self.read(slot)[0] == WORKER_READY for slot in range(1, self.slots))
+
+    def close(self):
+        self.memory.close()
+
+def run_worker(host: str, port: int, graceful_timeout: float):
+    """One `serve` worker process: its own SO_REUSEPORT listener in front of a uvicorn loop"""
+    import uvicorn
+
+    # Restarts are the launcher's to make; a SIGHUP to the whole process group shouldn't kill workers
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    listener = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    # Every worker binds the same port and the kernel spreads new connections across them
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    listener.bind((host, port))
+    listener.listen(2048)
+    config = uvicorn.Config(load_server().app, host=host, port=port, lifespan="on", timeout_graceful_shutdown=graceful_timeout)
+    uvicorn.Server(config).run(sockets=[listener])
+
+class WorkerLauncher:
+    """Pre-fork master for `manage.py serve`.
+
+    Starts `workers` uvicorn processes that each listen on the port through
+    SO_REUSEPORT and replaces any that die. SIGHUP replaces them one at a
+    time: a new worker has to report ready before an old one gets SIGTERM
+    and up to `graceful_timeout` seconds to finish its requests and flush.
+    SIGTERM and SIGINT stop every worker the same way. Request and view
+    counts live in a SharedCounters table with a stripe of `counters` keys
+    per slot, which outlives the workers.
+    """
+
+    def __init__(self, workers: int, host: str, port: int, graceful_timeout: float = 30.0,
+                 slot_size: int = 512 * 1024, counters: int = 8192):
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.graceful_timeout = graceful_timeout
+        # Slot 0 holds retired counters; the spare slots let each worker overlap its replacement
+        self.segment = WorkerSegment.create(2 * workers + 1, slot_size)
+        self.run_dir = Path(tempfile.mkdtemp(prefix="vivastreet-workers-"))
+        self.counters = SharedCounters.create(counters, self.segment.slots)
+        self.context = multiprocessing.get_context("spawn")
+        self.processes: Dict[int, multiprocessing.Process] = {}
+        self.started: Dict[int, float] = {}
+        self.stopping = False
+        self.restarting = False
+
+    def _spawn(self) -> int:
+        slot = next(slot for slot in range(1, self.segment.slots) if slot not in self.processes)
+        self.segment.write(slot, b"", WORKER_STARTING)
+        # A spawned worker starts with the environment as it is at start()
+        os.environ.update(
+            WORKER_SEGMENT=self.segment.memory.name, WORKER_SLOTS=str(self.segment.slots),
+            WORKER_SLOT=str(slot), WORKER_RUN_DIR=str(self.run_dir), WORKER_COUNTERS=self.counters.memory.name,
+        )
+        process = self.context.Process(
+            target=run_worker, args=(self.host, self.port, self.graceful_timeout), name=f"worker-{slot}",
+        )
+        process.start()
+        self.processes[slot] = process
+        self.started[slot] = time.monotonic()
+        return slot
+
+    def _retire(self, slot: int):
+        """Fold an exited worker's counters into slot 0 and free its slot"""
+        self.processes.pop(slot).join()
+        self.started.pop(slot)
+        _, payload = self.segment.read(slot)
+        if payload:
+            _, retired = self.segment.read(0)
+            merged = merge_metrics(
+                [("retired", retired.decode()), (str(slot), payload.decode())], kinds=("counter", "histogram")
+            )
+            self.segment.write(0, merged.encode(), WORKER_READY)
+        self.segment.write(slot, b"", WORKER_EMPTY)
+        self.counters.recover(slot)
+        (self.run_dir / f"worker-{slot}.sock").unlink(missing_ok=True)
+
+    def _stop(self, slot: int):
+        process = self.processes[slot]
+        # SIGTERM: uvicorn stops accepting, drains open requests and runs the lifespan shutdown
+        process.terminate()
+        process.join(self.graceful_timeout + 10)
+        if process.is_alive():
+            logger.warning("Worker %d (pid %d) ignored SIGTERM, killing it", slot, process.pid)
+            process.kill()
+        self._retire(slot)
+
+    def _wait_ready(self, slot: int, timeout: float = 60.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and not self.stopping:
+            if self.segment.read(slot)[0] == WORKER_READY:
+                return True
+            if not self.processes[slot].is_alive():
+                return False
+            time.sleep(0.1)
+        return False
+
+    def _restart(self):
+        logger.info("Rolling restart of %d workers", len(self.processes))
+        for old in list(self.processes):
+            if self.stopping:
+                return
+            new = self._spawn()
+            if not self._wait_ready(new):
+                logger.error("Replacement worker %d did not become ready, keeping the remaining workers", new)
+                self._stop(new)
+                return
+            self._stop(old)
+
+    def _request(self, flag: str):
+        def handler(signum, frame):
+            setattr(self, flag, True)
+        return handler
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._request("stopping"))
+        signal.signal(signal.SIGINT, self._request("stopping"))
+        signal.signal(signal.SIGHUP, self._request("restarting"))
+        logger.info("Starting %d workers on %s:%d", self.workers, self.host, self.port)
+        try:
+            for _ in range(self.workers):
+                self._spawn()
+            while not self.stopping:
+                time.sleep(0.2)
+                for slot, process in list(self.processes.items()):
+                    if not process.is_alive() and not self.stopping:
+                        logger.warning("Worker %d (pid %d) exited with %s, replacing it", slot, process.pid, process.exitcode)
+                        crashed_on_start = time.monotonic() - self.started[slot] < 5
+                        self._retire(slot)
+                        if crashed_on_start:
+                            # Don't spin on a worker that can't start, e.g. while the port is taken
+                            time.sleep(1)
+                        self._spawn()
+                if self.restarting:
+                    self.restarting = False
+                    self._restart()
+        finally:
+            for process in self.processes.values():
+                process.terminate()
+            for slot in list(self.processes):
+                self._stop(slot)
+            self.segment.close()
+            self.segment.memory.unlink()
+            self.counters.close()
+            self.counters.memory.unlink()
+            shutil.rmtree(self.run_dir, ignore_errors=True)
@@ -0,0 +1,91 @@
+"""Command line tools for the FastAPI service: `serve`, data maintenance and benchmarks"""
+import argparse
+import asyncio
+import os
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# Before the local imports, which read their settings from the environment
+load_dotenv(Path(__file__).parent / '.env')
+
+from bench import bench_api, bench_inbox, bench_profile_index, bench_serialization, bench_workers  # noqa: E402
+from launcher import WorkerLauncher  # noqa: E402
+from storage import create_storage  # noqa: E402
+
+async def backfill_rates(storage, batch_size=1000):
+    """Parse every profile's rate strings into the numeric fields, in unordered bulk batches"""
+    started = time.perf_counter()
+    scanned, updated = await storage.profiles.normalize_rates(batch_size)
+    print(f"scanned {scanned} profiles, updated {updated} in {time.perf_counter() - started:.2f}s")
+    storage.close()
+
+async def rebuild_inbox(storage, batch_size=1000):
+    """Recompute every conversation summary from the messages collection"""
+    started = time.perf_counter()
+    await storage.conversations.ensure_indexes()
+    written = await storage.conversations.rebuild(storage.messages.summaries(), batch_size)
+    print(f"rebuilt {written} conversation summaries in {time.perf_counter() - started:.2f}s")
+    storage.close()
+
+async def rebuild_booking_stats(storage, batch_size=1000):
+    """Recompute every daily booking stats bucket from the bookings collection"""
+    started = time.perf_counter()
+    await storage.booking_rollups.ensure_indexes()
+    written = await storage.booking_rollups.rebuild(storage.bookings.rollups(), batch_size)
+    print(f"rebuilt {written} booking stats buckets in {time.perf_counter() - started:.2f}s")
+    storage.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vivastreet FastAPI service tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("bench-serialization", help="microbenchmark the status list encoding paths")
+    index_bench = commands.add_parser("bench-profile-index", help="microbenchmark the in-memory profile index")
+    index_bench.add_argument("--profiles", type=int, default=100000, help="synthetic profiles to index (default: 100000)")
+    backfill = commands.add_parser("backfill-rates", help="store parsed numeric rates on every profile")
+    backfill.add_argument("--batch-size", type=int, default=1000, help="updates per bulk write (default: 1000)")
+    rebuild = commands.add_parser("rebuild-inbox", help="recompute conversation summaries from the messages")
+    rebuild.add_argument("--batch-size", type=int, default=1000, help="summaries per bulk write (default: 1000)")
+    rollups = commands.add_parser("rebuild-booking-stats", help="recompute daily booking stats from the bookings")
+    rollups.add_argument("--batch-size", type=int, default=1000, help="buckets per bulk write (default: 1000)")
+    inbox_bench = commands.add_parser("bench-inbox", help="benchmark the inbox summaries against the aggregation")
+    inbox_bench.add_argument("--messages", default="1000,10000,100000",
+                             help="comma separated message history sizes (default: 1000,10000,100000)")
+    serve = commands.add_parser("serve", help="run the API in pre-forked uvicorn workers sharing one port")
+    serve.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes (default: one per core)")
+    serve.add_argument("--host", default="0.0.0.0", help="address to listen on (default: 0.0.0.0)")
+    serve.add_argument("--port", type=int, default=8001, help="port to listen on (default: 8001)")
+    serve.add_argument("--graceful-timeout", type=float, default=30.0,
+                       help="seconds a stopping worker gets to finish its requests (default: 30)")
+    workers_bench = commands.add_parser("bench-workers", help="benchmark requests/sec of `serve` at several worker counts")
+    workers_bench.add_argument("--workers", default="1,2,4,8", help="comma separated worker counts (default: 1,2,4,8)")
+    workers_bench.add_argument("--seconds", type=float, default=10.0, help="measured seconds per scenario (default: 10)")
+    workers_bench.add_argument("--connections", type=int, default=64, help="keep-alive connections in total (default: 64)")
+    workers_bench.add_argument("--clients", type=int, default=None,
+                               help="load generator processes (default: half the cores)")
+    bench = commands.add_parser("bench-api", help="benchmark the in-process ASGI app on each storage engine")
+    bench.add_argument("--engines", default="memory,motor", help="comma separated storage engines (default: memory,motor)")
+    bench.add_argument("--requests", type=int, default=2000, help="requests per scenario (default: 2000)")
+    bench.add_argument("--concurrency", type=int, default=16, help="concurrent in-flight requests (default: 16)")
+    bench.add_argument("--rows", type=int, default=1000, help="status checks seeded before measuring (default: 1000)")
+    args = parser.parse_args()
+
+    if args.command == "bench-serialization":
+        bench_serialization()
+    elif args.command == "bench-profile-index":
+        bench_profile_index(args.profiles)
+    elif args.command == "backfill-rates":
+        asyncio.run(backfill_rates(create_storage("motor"), args.batch_size))
+    elif args.command == "rebuild-inbox":
+        asyncio.run(rebuild_inbox(create_storage("motor"), args.batch_size))
+    elif args.command == "rebuild-booking-stats":
+        asyncio.run(rebuild_booking_stats(create_storage("motor"), args.batch_size))
+    elif args.command == "bench-inbox":
+        asyncio.run(bench_inbox(tuple(int(size) for size in args.messages.split(","))))
+    elif args.command == "serve":
+        WorkerLauncher(args.workers, args.host, args.port, args.graceful_timeout).run()
+    elif args.command == "bench-workers":
+        bench_workers(tuple(int(count) for count in args.workers.split(",")), args.seconds, args.connections, args.clients)
+    elif args.command == "bench-api":
+        asyncio.run(bench_api(tuple(args.engines.split(",")), args.requests, args.concurrency, args.rows))
@@ -0,0 +1,320 @@
+"""Metrics exported at /api/metrics in the Prometheus text format, and the middleware and probes feeding them"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo.monitoring import ConnectionPoolListener
+from starlette.routing import Match
+
+from counters import CountersFull, LocalCounters, SharedCounters
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+PROCESS_STARTED = time.monotonic()
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: Dict[str, str]) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{name}_bucket{format_labels({**labels, 'le': le})} {cumulative}")
+        lines.append(f"{name}_sum{format_labels(labels)} {self.sum}")
+        lines.append(f"{name}_count{format_labels(labels)} {self.count}")
+        return lines
+
+class PoolMetrics(ConnectionPoolListener):
+    """Motor connection pool size and checkout wait, fed by pymongo's pool events.
+
+    Events fire on Motor's executor threads, so updates take a lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.open = 0
+        self.checked_out = 0
+        self.checkout_failures = 0
+        self.checkout_wait = Histogram(LAG_BUCKETS)
+        self._started = threading.local()
+
+    def connection_created(self, event):
+        with self.lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self.lock:
+            self.open -= 1
+
+    def connection_check_out_started(self, event):
+        self._started.at = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait = time.perf_counter() - getattr(self._started, "at", time.perf_counter())
+        with self.lock:
+            self.checked_out += 1
+            self.checkout_wait.observe(wait)
+
+    def connection_check_out_failed(self, event):
+        with self.lock:
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            self.checked_out -= 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def render(self) -> List[str]:
+        with self.lock:
+            return [
+                "# TYPE mongo_pool_connections gauge",
+                f"mongo_pool_connections {self.open}",
+                "# TYPE mongo_pool_checked_out gauge",
+                f"mongo_pool_checked_out {self.checked_out}",
+                "# TYPE mongo_pool_checkout_failures_total counter",
+                f"mongo_pool_checkout_failures_total {self.checkout_failures}",
+                "# TYPE mongo_pool_checkout_wait_seconds histogram",
+                *self.checkout_wait.render("mongo_pool_checkout_wait_seconds", {}),
+            ]
+
+class RequestMetrics:
+    """Per-route request counts, latency histograms and in-flight gauges, plus event-loop lag.
+
+    Request counts go to `counters`, which under `manage.py serve` is the
+    table shared by every worker; render_shared() renders them once for all.
+    """
+
+    REQUESTS = b"requests:"
+
+    def __init__(self, counters=None):
+        self.counters = LocalCounters() if counters is None else counters
+        self.latency: Dict[Tuple[str, str], Histogram] = defaultdict(Histogram)
+        self.in_flight: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.loop_lag = Histogram(LAG_BUCKETS)
+        self.loop_lag_last = 0.0
+        self.warmup_seconds: Optional[float] = None
+        self.first_request_seconds: Optional[float] = None
+
+    def count(self, method: str, route: str, status: int):
+        key = self.REQUESTS + f"{method} {status} {route}".encode()
+        try:
+            self.counters.add(key[:SharedCounters.KEY_SIZE], 1)
+        except CountersFull:
+            logger.warning("Shared counter table is full, request to %s %s not counted", method, route)
+
+    def render_shared(self) -> List[str]:
+        lines = ["# TYPE http_requests_total counter"]
+        requests = []
+        for key, count in self.counters.items(self.REQUESTS):
+            method, status, route = key[len(self.REQUESTS):].decode(errors="replace").split(" ", 2)
+            requests.append(((method, route, int(status)), count))
+        for (method, route, status), count in sorted(requests):
+            lines.append(f"http_requests_total{format_labels({'method': method, 'route': route, 'status': status})} {count}")
+        return lines
+
+    def render(self) -> List[str]:
+        """This process's own series; the request counts are in render_shared()"""
+        lines = ["# TYPE http_request_duration_seconds histogram"]
+        for (method, route), histogram in sorted(self.latency.items()):
+            lines.extend(histogram.render("http_request_duration_seconds", {"method": method, "route": route}))
+        lines.append("# TYPE http_requests_in_flight gauge")
+        for (method, route), count in sorted(self.in_flight.items()):
+            lines.append(f"http_requests_in_flight{format_labels({'method': method, 'route': route})} {count}")
+        lines.append("# TYPE event_loop_lag_last_seconds gauge")
+        lines.append(f"event_loop_lag_last_seconds {self.loop_lag_last}")
+        lines.append("# TYPE event_loop_lag_seconds histogram")
+        lines.extend(self.loop_lag.render("event_loop_lag_seconds", {}))
+        if self.warmup_seconds is not None:
+            lines.append("# TYPE app_warmup_seconds gauge")
+            lines.append(f"app_warmup_seconds {self.warmup_seconds}")
+        if self.first_request_seconds is not None:
+            lines.append("# TYPE app_time_to_first_request_seconds gauge")
+            lines.append(f"app_time_to_first_request_seconds {self.first_request_seconds}")
+        return lines
+
+# Families that add up across workers; anything else is kept per worker under a `worker` label
+SUMMED_KINDS = frozenset({"counter", "histogram"})
+
+def with_label(key: str, name: str, value: str) -> str:
+    """A series key such as `name{a="b"}` with one more label"""
+    label = format_labels({name: value})[1:-1]
+    return f"{key[:-1]},{label}}}" if key.endswith("}") else f"{key}{{{label}}}"
+
+def merge_metrics(renders: Iterable[Tuple[str, str]], kinds: Optional[Iterable[str]] = None) -> str:
+    """Combine (worker, Prometheus text) renders into one, optionally keeping only `kinds` of family.
+
+    Counters and histograms are summed. Gauges like an in-flight count or a
+    limit say nothing once added up, so each worker's series stays separate
+    with a `worker` label.
+    """
+    kinds = set(kinds) if kinds is not None else None
+    families: Dict[str, str] = {}
+    series: Dict[str, float] = {}
+    order: Dict[str, List[str]] = defaultdict(list)
+    for worker, text in renders:
+        family = None
+        for line in text.splitlines():
+            if line.startswith("# TYPE "):
+                _, _, family, kind = line.split(" ", 3)
+                families.setdefault(family, kind)
+                continue
+            if not line or line.startswith("#") or family is None:
+                continue
+            if kinds is not None and families[family] not in kinds:
+                continue
+            key, value = line.rsplit(" ", 1)
+            value = float(value)
+            if families[family] not in SUMMED_KINDS:
+                key = with_label(key, "worker", worker)
+            if key in series:
+                value += series[key]
+            else:
+                order[family].append(key)
+            series[key] = value
+    lines = []
+    for family, keys in order.items():
+        lines.append(f"# TYPE {family} {families[family]}")
+        for key in keys:
+            value = series[key]
+            lines.append(f"{key} {int(value) if value.is_integer() and abs(value) < 2 ** 53 else repr(value)}")
+    return "\n".join(lines) + "\n" if lines else ""
+
+# Probes and scrapes don't count as served traffic for time-to-first-request
+PROBE_ROUTES = frozenset({"/api/health", "/api/ready", "/api/metrics"})
+
+_route_templates: Dict[str, str] = {}
+
+def route_template(scope) -> str:
+    """The path template of the route serving `scope`, e.g. /api/profiles/{profile_id}"""
+    path = scope["path"]
+    template = _route_templates.get(path)
+    if template is None:
+        template = "unmatched"
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match != Match.NONE:
+                template = route.path
+                break
+        # Paths carry ids, so keep the lookup cache bounded
+        if len(_route_templates) >= 4096:
+            _route_templates.clear()
+        _route_templates[path] = template
+    return template
+
+class MetricsMiddleware:
+    """ASGI middleware recording every HTTP request under its route template"""
+
+    def __init__(self, app, metrics: RequestMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = self.metrics
+        key = (scope["method"], route_template(scope))
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics.in_flight[key] += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.in_flight[key] -= 1
+            metrics.latency[key].observe(time.perf_counter() - start)
+            metrics.count(*key, status)
+            if metrics.first_request_seconds is None and key[1] not in PROBE_ROUTES and status < 500:
+                metrics.first_request_seconds = time.monotonic() - PROCESS_STARTED
+                logger.info("First request served %.3fs after process start", metrics.first_request_seconds)
+
+async def monitor_event_loop_lag(metrics: RequestMetrics, interval: float = 0.5):
+    """Sample how late the loop wakes a sleeping task; blocking work shows up as lag"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - start - interval, 0.0)
+        metrics.loop_lag_last = lag
+        metrics.loop_lag.observe(lag)
+
+class SamplingProfiler:
+    """Samples all thread stacks from a background thread into collapsed-stack counts.
+
+    The output ("frame;frame;frame count" per line) loads directly into
+    flamegraph.pl or speedscope. Nothing runs between captures, and a capture
+    only costs one stack walk per interval.
+    """
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.running = False
+
+    def capture(self, seconds: float, interval: float) -> Dict[str, int]:
+        stacks: Dict[str, int] = defaultdict(int)
+        own_thread = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                frames.append(names.get(thread_id, str(thread_id)))
+                stacks[";".join(reversed(frames))] += 1
+            time.sleep(interval)
+        return stacks
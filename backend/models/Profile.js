@@ -1,4 +1,5 @@
 const mongoose = require('mongoose');
+const { parseRate, hourlyPrice } = require('../utils/rates');
 
 const profileSchema = new mongoose.Schema({
   userId: {
@@ -60,7 +61,17 @@ const profileSchema = new mongoose.Schema({
     outcall: {
       type: String,
       required: true
-    }
+    },
+    // Parsed from the strings above on save
+    incallCents: Number,
+    incallHours: Number,
+    outcallCents: Number,
+    outcallHours: Number
+  },
+  // Incall price per hour in cents, for numeric sorting and price filters
+  priceCents: {
+    type: Number,
+    default: null
   },
   availability: {
     monday: { start: String, end: String, available: { type: Boolean, default: true } },
@@ -137,13 +148,26 @@ profileSchema.pre('save', function(next) {
   next();
 });
 
+// Keep the numeric rate fields in step with the rate strings
+profileSchema.pre('save', function(next) {
+  if (this.isNew || this.isModified('rates.incall') || this.isModified('rates.outcall')) {
+    ['incall', 'outcall'].forEach(kind => {
+      const parsed = parseRate(this.rates[kind]);
+      this.rates[`${kind}Cents`] = parsed ? parsed.cents : null;
+      this.rates[`${kind}Hours`] = parsed ? parsed.hours : null;
+    });
+    this.priceCents = hourlyPrice(this.rates.incall);
+  }
+  next();
+});
+
 // Index for better search performance
 profileSchema.index({ location: 1, isActive: 1 });
 profileSchema.index({ age: 1, isActive: 1 });
 profileSchema.index({ ethnicity: 1, isActive: 1 });
 profileSchema.index({ category: 1, isActive: 1 });
 profileSchema.index({ isFeatured: 1, isActive: 1 });
-profileSchema.index({ 'rates.incall': 1, isActive: 1 });
+profileSchema.index({ priceCents: 1, isActive: 1 });
 
 // Virtual for profile URL
 profileSchema.virtual('profileUrl').get(function() {
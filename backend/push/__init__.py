@@ -0,0 +1,5 @@
+"""Push delivery of message and read events over WebSocket and SSE"""
+from .broker import LocalBroker, WorkerBroker
+from .hub import MessageHub, Subscriber
+
+__all__ = ["LocalBroker", "MessageHub", "Subscriber", "WorkerBroker"]
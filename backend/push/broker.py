@@ -0,0 +1,97 @@
+"""Pub/sub for push events, within one process or between the workers of `manage.py serve`
+
+Handlers publish message and read events to a broker; every worker's
+MessageHub consumes them and fans out to its own WebSocket and SSE connections.
+"""
+import asyncio
+import logging
+import socket
+import time
+from pathlib import Path
+from typing import AsyncIterator, Callable, List, Optional
+
+import bson
+
+logger = logging.getLogger(__name__)
+
+class LocalBroker:
+    """In-process pub/sub with the publish/listen interface an external broker would offer.
+
+    Enough for a single worker and for tests; every listener sees every event.
+    """
+
+    def __init__(self):
+        self.listeners: List[asyncio.Queue] = []
+
+    async def publish(self, event: dict):
+        self._fan_out(event)
+
+    def _fan_out(self, event: dict):
+        for listener in self.listeners:
+            listener.put_nowait(event)
+
+    async def listen(self) -> AsyncIterator[dict]:
+        listener: asyncio.Queue = asyncio.Queue()
+        self.listeners.append(listener)
+        try:
+            while True:
+                yield await listener.get()
+        finally:
+            self.listeners.remove(listener)
+
+class DatagramReceiver(asyncio.DatagramProtocol):
+    def __init__(self, received: Callable[[bytes], None]):
+        self.received = received
+
+    def datagram_received(self, data: bytes, address):
+        self.received(data)
+
+    def error_received(self, exc: Exception):
+        # A sibling that exited between listing its socket and sending to it
+        pass
+
+class WorkerBroker(LocalBroker):
+    """LocalBroker shared with the sibling workers of `manage.py serve`.
+
+    Each worker binds worker-<slot>.sock in the launcher's run directory. A
+    publish is delivered locally and sent as one BSON datagram to every other
+    worker's socket, so push connections get events whichever worker handled
+    the request that produced them.
+    """
+
+    def __init__(self, directory: Path, slot: int):
+        super().__init__()
+        self.directory = directory
+        self.path = directory / f"worker-{slot}.sock"
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._peers: List[str] = []
+        self._peers_listed = float("-inf")
+
+    async def _bind(self):
+        if self._transport is None:
+            if self.path.exists():
+                self.path.unlink()
+            self._transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                lambda: DatagramReceiver(lambda data: self._fan_out(bson.decode(data))),
+                local_addr=str(self.path), family=socket.AF_UNIX,
+            )
+
+    def _siblings(self) -> List[str]:
+        # Workers come and go on restarts, so the listing is refreshed every second
+        now = time.monotonic()
+        if now - self._peers_listed > 1.0:
+            self._peers = [str(path) for path in self.directory.glob("worker-*.sock") if path != self.path]
+            self._peers_listed = now
+        return self._peers
+
+    async def publish(self, event: dict):
+        await self._bind()
+        self._fan_out(event)
+        data = bson.encode(event)
+        for peer in self._siblings():
+            self._transport.sendto(data, peer)
+
+    async def listen(self) -> AsyncIterator[dict]:
+        await self._bind()
+        async for event in super().listen():
+            yield event
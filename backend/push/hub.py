@@ -0,0 +1,159 @@
+"""Per-worker fan-out of push events to WebSocket and SSE subscribers"""
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+
+from encoding import encode_json
+
+logger = logging.getLogger(__name__)
+
+class Subscriber:
+    """One push connection's outbox.
+
+    Message events queue up to `max_pending`; past that the backlog is dropped
+    for a single resync event, telling the client to refetch. Unread counts are
+    coalesced, so a slow consumer only ever gets the latest one.
+    """
+
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self.pending: List[bytes] = []
+        self.unread: Optional[int] = None
+        self.overflowed = False
+        self.closed = False
+        self._wakeup = asyncio.Event()
+
+    def push(self, event: bytes) -> bool:
+        """Queue a message event; True when it overflowed the backlog"""
+        self._wakeup.set()
+        if self.overflowed:
+            return False
+        if len(self.pending) >= self.max_pending:
+            self.pending.clear()
+            self.overflowed = True
+            return True
+        self.pending.append(event)
+        return False
+
+    def set_unread(self, count: int):
+        self.unread = count
+        self._wakeup.set()
+
+    def close(self):
+        self.closed = True
+        self._wakeup.set()
+
+    async def next_batch(self, timeout: Optional[float] = None) -> List[bytes]:
+        """Everything queued since the last call; empty after `timeout` idle seconds or once closed"""
+        if not self.closed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        self._wakeup.clear()
+        events = [encode_json({"type": "resync"})] if self.overflowed else []
+        events.extend(self.pending)
+        if self.unread is not None:
+            events.append(encode_json({"type": "unread", "unreadCount": self.unread}))
+        self.pending, self.unread, self.overflowed = [], None, False
+        return events
+
+class MessageHub:
+    """Fans broker events out to this worker's subscribers and keeps their unread counters.
+
+    A user's counter is seeded from the messages collection when their first
+    connection opens, moved by published deltas while any stays open, and
+    dropped with the last one. Deltas that land while the seed query runs are
+    applied on top of it.
+    """
+
+    def __init__(self, messages, broker, max_pending: int = 256):
+        self.messages = messages
+        self.broker = broker
+        self.max_pending = max_pending
+        self.subscribers: Dict[ObjectId, set] = defaultdict(set)
+        self.unread: Dict[ObjectId, int] = {}
+        self.resyncs = 0
+        self._seeding: Dict[ObjectId, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._consume())
+        # Let the consumer register with the broker before anything is published
+        await asyncio.sleep(0)
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        for subscribers in self.subscribers.values():
+            for subscriber in subscribers:
+                subscriber.close()
+
+    async def subscribe(self, user_id: ObjectId) -> Subscriber:
+        subscriber = Subscriber(self.max_pending)
+        self.subscribers[user_id].add(subscriber)
+        if user_id not in self.unread:
+            if user_id not in self._seeding:
+                self._seeding[user_id] = 0
+                try:
+                    count = await self.messages.unread_count(user_id)
+                except BaseException:
+                    self.unsubscribe(user_id, subscriber)
+                    raise
+                finally:
+                    delta = self._seeding.pop(user_id)
+                if self.subscribers.get(user_id):
+                    self.unread[user_id] = max(count + delta, 0)
+                    for waiting in self.subscribers[user_id]:
+                        waiting.set_unread(self.unread[user_id])
+            return subscriber
+        subscriber.set_unread(self.unread[user_id])
+        return subscriber
+
+    def unsubscribe(self, user_id: ObjectId, subscriber: Subscriber):
+        subscribers = self.subscribers.get(user_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self.subscribers[user_id]
+            self.unread.pop(user_id, None)
+
+    def _add_unread(self, user_id: ObjectId, delta: int):
+        if user_id in self._seeding:
+            self._seeding[user_id] += delta
+        elif user_id in self.unread:
+            self.unread[user_id] = max(self.unread[user_id] + delta, 0)
+            for subscriber in self.subscribers[user_id]:
+                subscriber.set_unread(self.unread[user_id])
+
+    def deliver(self, event: dict):
+        if event["type"] == "message":
+            # Encoded once for every connection of both participants
+            encoded = None
+            for user_id in (event["senderId"], event["receiverId"]):
+                for subscriber in self.subscribers.get(user_id, ()):
+                    if encoded is None:
+                        encoded = encode_json({"type": "message", "message": event["message"]})
+                    if subscriber.push(encoded):
+                        self.resyncs += 1
+            self._add_unread(event["receiverId"], 1)
+        elif event["type"] == "read":
+            self._add_unread(event["userId"], -event["count"])
+
+    async def _consume(self):
+        while True:
+            try:
+                async for event in self.broker.listen():
+                    self.deliver(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Message broker subscription failed, resubscribing")
+                await asyncio.sleep(1)
+
+    def __len__(self):
+        return sum(len(subscribers) for subscribers in self.subscribers.values())
@@ -5,6 +5,28 @@ const User = require('../models/User');
 
 const router = express.Router();
 
+const findProfiles = (filter, sort, skip, limit) => Profile.find(filter)
+  .sort(sort)
+  .skip(skip)
+  .limit(limit)
+  .populate('userId', 'name email isVerified')
+  .lean();
+
+// Cheapest first, with profiles whose rate has no readable price last. An ascending
+// sort alone would put a null or missing priceCents first, unlike the Python index.
+const findCheapest = async (filter, skip, limit) => {
+  const priced = { ...filter, priceCents: { $ne: null } };
+  const pricedTotal = await Profile.countDocuments(priced);
+  const profiles = skip < pricedTotal
+    ? await findProfiles(priced, { priceCents: 1 }, skip, limit)
+    : [];
+  if (profiles.length < limit) {
+    const unpriced = { ...filter, priceCents: null };
+    profiles.push(...await findProfiles(unpriced, {}, Math.max(skip - pricedTotal, 0), limit - profiles.length));
+  }
+  return profiles;
+};
+
 // Get all profiles with filtering and pagination
 router.get('/', [
   query('page').optional().isInt({ min: 1 }),
@@ -77,10 +99,10 @@ router.get('/', [
         sort = { createdAt: -1 };
         break;
       case 'price-low':
-        sort = { 'rates.incall': 1 };
+        sort = { priceCents: 1 };
         break;
       case 'price-high':
-        sort = { 'rates.incall': -1 };
+        sort = { priceCents: -1 };
         break;
       case 'popular':
         sort = { 'views.total': -1 };
@@ -90,12 +112,9 @@ router.get('/', [
     }
 
     // Execute query
-    const profiles = await Profile.find(filter)
-      .sort(sort)
-      .skip(skip)
-      .limit(limit)
-      .populate('userId', 'name email isVerified')
-      .lean();
+    const profiles = req.query.sortBy === 'price-low'
+      ? await findCheapest(filter, skip, limit)
+      : await findProfiles(filter, sort, skip, limit);
 
     // Get total count for pagination
     const total = await Profile.countDocuments(filter);
@@ -0,0 +1,10 @@
+"""Profile listing and full-text search, answered from memory"""
+from .bitmaps import bitmap_of, bitmap_slots
+from .profiles import PROFILE_SORTS, ProfileEntry, ProfileIndex, ProfileIndexSync, profile_images
+from .rates import hourly_price, parse_rate, rate_fields
+from .text import SearchIndex, fold, tokenize
+
+__all__ = [
+    "PROFILE_SORTS", "ProfileEntry", "ProfileIndex", "ProfileIndexSync", "SearchIndex", "bitmap_of", "bitmap_slots",
+    "fold", "hourly_price", "parse_rate", "profile_images", "rate_fields", "tokenize",
+]
@@ -0,0 +1,19 @@
+"""Python ints as bitsets over index slots"""
+from typing import Iterable, List
+
+def bitmap_of(slots: Iterable[int], size: int) -> int:
+    bits = bytearray((size + 7) // 8)
+    for slot in slots:
+        bits[slot >> 3] |= 1 << (slot & 7)
+    return int.from_bytes(bits, "little")
+
+def bitmap_slots(bitmap: int) -> List[int]:
+    """Set bit positions, found with str.find over bin() rather than a Python loop per bit"""
+    bits = bin(bitmap)
+    top = len(bits) - 1
+    slots = []
+    position = bits.find("1", 2)
+    while position != -1:
+        slots.append(top - position)
+        position = bits.find("1", position + 1)
+    return slots
@@ -0,0 +1,381 @@
+"""The in-memory profile index answering GET /api/profiles, and its sync with the profiles collection"""
+import asyncio
+import heapq
+import logging
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote
+
+from encoding import encode_json
+from .bitmaps import bitmap_of, bitmap_slots
+from .rates import hourly_price
+from .text import SEARCH_FIELDS, SearchIndex, tokenize
+
+logger = logging.getLogger(__name__)
+
+# sortBy value -> index order; every order is kept ascending on its own key
+PROFILE_SORTS = {
+    "featured": "featured",
+    "newest": "newest",
+    "price-low": "price",
+    "price-high": "price_desc",
+    "popular": "popular",
+}
+PROFILE_FACETS = ("location", "ethnicity", "category")
+# Hourly prices are bucketed per euro for range filters
+PRICE_BUCKET_CENTS = 100
+
+def profile_images(profile: dict, size: str) -> List[str]:
+    """Image URLs at `size` where rendered, or the placeholder routes/profiles.js shows when there are none"""
+    images = [(image.get("sizes") or {}).get(size) or image["url"] for image in profile.get("images") or [] if image.get("url")]
+    # encodeURIComponent leaves these unescaped
+    placeholder = quote(profile.get("name", ""), safe="-_.!~*'()")
+    return images or [f"https://via.placeholder.com/400x500/e5e7eb/6b7280?text={placeholder}"]
+
+class ProfileEntry:
+    __slots__ = ("active", "facets", "age", "price", "keys", "terms", "length", "encoded")
+
+    def __init__(self, profile: dict):
+        created = profile.get("createdAt")
+        created = created.replace(tzinfo=timezone.utc).timestamp() if created else float("-inf")
+        rates = profile.get("rates") or {}
+        rating = profile.get("rating") or {}
+        views = (profile.get("views") or {}).get("total", 0)
+        self.active = profile.get("isActive", True)
+        self.facets = {field: profile.get(field) for field in PROFILE_FACETS}
+        self.age = profile.get("age")
+        # Parsed here rather than read from priceCents, so profiles not yet backfilled sort right too
+        self.price = hourly_price(rates.get("incall"))
+        # Ascending sort keys; missing createdAt sorts last like null under a descending Mongo sort,
+        # and profiles without a readable price come last both cheapest and dearest first
+        self.keys = {
+            "featured": (0 if profile.get("isFeatured") else 1, -created),
+            "newest": (-created,),
+            "price": (0, self.price) if self.price is not None else (1, 0),
+            "price_desc": (0, -self.price) if self.price is not None else (1, 0),
+            "popular": (-views,),
+        }
+        self.terms: Dict[str, float] = defaultdict(float)
+        for field, weight in SEARCH_FIELDS.items():
+            value = profile.get(field) or ""
+            for token in tokenize(" ".join(value) if isinstance(value, list) else str(value)):
+                self.terms[token] += weight
+        self.length = sum(self.terms.values())
+        # The listing row exactly as routes/profiles.js shapes it
+        self.encoded = encode_json({
+            "id": str(profile["_id"]),
+            "name": profile.get("name", ""),
+            "age": self.age,
+            "location": profile.get("location"),
+            "description": profile.get("description"),
+            "images": profile_images(profile, "card"),
+            "verified": profile.get("isVerified", False),
+            "featured": profile.get("isFeatured", False),
+            "online": profile.get("isOnline", False),
+            "incall": rates.get("incall"),
+            "outcall": rates.get("outcall"),
+            "services": profile.get("services") or [],
+            "ethnicity": profile.get("ethnicity"),
+            "category": profile.get("category"),
+            "rating": rating.get("average", 0),
+            "views": views,
+        })
+
+class ProfileIndex:
+    """In-memory faceted index over the active profiles.
+
+    Each profile gets a slot. Every location, ethnicity and category value has
+    a bitmap of the slots holding it, stored as a Python int so intersections
+    and exact totals (popcount) run in C over whole machine words. Ages are
+    bitmaps per age plus a sorted array of the distinct ages, so a range is a
+    bisect and an OR of the few ages inside it. Each sort order is a sorted
+    list of (key, slot) maintained with bisect, and listing rows are kept
+    pre-encoded, so a page costs no database round trip at all. Text search
+    goes through a SearchIndex over the same slots.
+    """
+
+    def __init__(self):
+        self.rebuild([])
+
+    def rebuild(self, profiles: Iterable[dict]):
+        """Replace the whole index; much cheaper than upserting profiles one by one"""
+        self.slots: Dict[Any, int] = {}
+        self.entries: Dict[int, ProfileEntry] = {}
+        self.free: List[int] = []
+        for profile in profiles:
+            entry = ProfileEntry(profile)
+            if entry.active:
+                slot = self.slots[profile["_id"]] = len(self.entries)
+                self.entries[slot] = entry
+        self.size = len(self.entries)
+
+        members: Dict[Tuple[str, Any], List[int]] = defaultdict(list)
+        ages: Dict[Any, List[int]] = defaultdict(list)
+        prices: Dict[int, List[int]] = defaultdict(list)
+        for slot, entry in self.entries.items():
+            for field, value in entry.facets.items():
+                members[field, value].append(slot)
+            ages[entry.age].append(slot)
+            if entry.price is not None:
+                prices[entry.price // PRICE_BUCKET_CENTS].append(slot)
+        self.all = (1 << self.size) - 1
+        self.facets: Dict[str, Dict[Any, int]] = {field: {} for field in PROFILE_FACETS}
+        for (field, value), slots in members.items():
+            self.facets[field][value] = bitmap_of(slots, self.size)
+        self.ages = {age: bitmap_of(slots, self.size) for age, slots in ages.items() if age is not None}
+        self.age_values = sorted(self.ages)
+        self.prices = {bucket: bitmap_of(slots, self.size) for bucket, slots in prices.items()}
+        self.price_buckets = sorted(self.prices)
+        # (key, slot) per slot for each order, and each order as a sorted list of those
+        self.sort_keys = {
+            order: {slot: (entry.keys[order], slot) for slot, entry in self.entries.items()}
+            for order in PROFILE_SORTS.values()
+        }
+        self.orders = {order: sorted(items.values()) for order, items in self.sort_keys.items()}
+        self.search = SearchIndex()
+        self.search.rebuild(self.entries, self.size)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def upsert(self, profile: dict):
+        entry = ProfileEntry(profile)
+        slot = self.slots.get(profile["_id"])
+        # Most saves only bump counters; leave the text postings alone for those
+        same_text = slot is not None and entry.active and self.entries[slot].terms == entry.terms
+        if slot is not None:
+            self._clear(slot, search=not same_text)
+        if not entry.active:
+            # Deactivation is how profiles are taken down; they stop being listed
+            if slot is not None:
+                del self.slots[profile["_id"]]
+                self.free.append(slot)
+            return
+        if slot is None:
+            slot = self.free.pop() if self.free else self.size
+            self.size = max(self.size, slot + 1)
+            self.slots[profile["_id"]] = slot
+
+        bit = 1 << slot
+        self.entries[slot] = entry
+        self.all |= bit
+        for field, value in entry.facets.items():
+            self.facets[field][value] = self.facets[field].get(value, 0) | bit
+        if entry.age is not None:
+            if entry.age not in self.ages:
+                insort(self.age_values, entry.age)
+            self.ages[entry.age] = self.ages.get(entry.age, 0) | bit
+        if entry.price is not None:
+            bucket = entry.price // PRICE_BUCKET_CENTS
+            if bucket not in self.prices:
+                insort(self.price_buckets, bucket)
+            self.prices[bucket] = self.prices.get(bucket, 0) | bit
+        for order, key in entry.keys.items():
+            self.sort_keys[order][slot] = (key, slot)
+            insort(self.orders[order], (key, slot))
+        if not same_text:
+            self.search.add(slot, entry)
+
+    def remove(self, profile_id):
+        slot = self.slots.pop(profile_id, None)
+        if slot is not None:
+            self._clear(slot)
+            self.free.append(slot)
+
+    def _clear(self, slot: int, search: bool = True):
+        entry = self.entries.pop(slot)
+        mask = ~(1 << slot)
+        self.all &= mask
+        for field, value in entry.facets.items():
+            bitmap = self.facets[field][value] & mask
+            if bitmap:
+                self.facets[field][value] = bitmap
+            else:
+                del self.facets[field][value]
+        if entry.age is not None:
+            bitmap = self.ages[entry.age] & mask
+            if bitmap:
+                self.ages[entry.age] = bitmap
+            else:
+                del self.ages[entry.age]
+                self.age_values.remove(entry.age)
+        if entry.price is not None:
+            bucket = entry.price // PRICE_BUCKET_CENTS
+            bitmap = self.prices[bucket] & mask
+            if bitmap:
+                self.prices[bucket] = bitmap
+            else:
+                del self.prices[bucket]
+                self.price_buckets.remove(bucket)
+        for order in entry.keys:
+            item = self.sort_keys[order].pop(slot)
+            del self.orders[order][bisect_left(self.orders[order], item)]
+        if search:
+            self.search.remove(slot, entry)
+
+    def query(self, location: Optional[str] = None, ethnicity: Optional[str] = None,
+              category: Optional[str] = None, min_age: Optional[int] = None, max_age: Optional[int] = None,
+              min_price: Optional[int] = None, max_price: Optional[int] = None, search: Optional[str] = None,
+              sort: str = "featured", skip: int = 0, limit: int = 20) -> Tuple[int, List[bytes]]:
+        """(exact total, encoded rows of the requested page)
+
+        Every search token must prefix-match a word of the name, location,
+        services or description. The "relevance" sort ranks by BM25 and falls
+        back to "featured" when there is nothing to rank by. Prices are hourly
+        incall cents; a price filter leaves out profiles without a readable rate.
+        """
+        matched = self.all
+        expansions = [self.search.expand(token) for token in tokenize(search or "")]
+        if expansions:
+            matched &= self.search.match(expansions)
+        for field, value in (("location", location), ("ethnicity", ethnicity), ("category", category)):
+            if value is not None:
+                matched &= self.facets[field].get(value, 0)
+        if min_age is not None or max_age is not None:
+            low = 0 if min_age is None else bisect_left(self.age_values, min_age)
+            high = len(self.age_values) if max_age is None else bisect_right(self.age_values, max_age)
+            in_range = 0
+            for age in self.age_values[low:high]:
+                in_range |= self.ages[age]
+            matched &= in_range
+        if min_price is not None or max_price is not None:
+            matched &= self._price_range(min_price, max_price)
+        total = matched.bit_count()
+        if skip >= total:
+            return total, []
+        if sort == "relevance" and expansions:
+            page = self.search.top(expansions, matched, total, self.size, skip + limit)[skip:]
+        else:
+            order = PROFILE_SORTS["featured" if sort == "relevance" else sort]
+            # A price range is contiguous in the price orders, so walks start at its bound
+            start = 0
+            if order == "price" and min_price is not None:
+                start = bisect_left(self.orders[order], ((0, min_price),))
+            elif order == "price_desc" and max_price is not None:
+                start = bisect_left(self.orders[order], ((0, -max_price),))
+            page = self._page(matched, total, order, start, skip, limit)
+        return total, [self.entries[slot].encoded for slot in page]
+
+    def _price_range(self, low: Optional[int], high: Optional[int]) -> int:
+        """Profiles with an hourly price in [low, high] cents.
+
+        Buckets wholly inside the range are OR-ed; a bucket cut by a bound is
+        resolved exactly from a bisect range of the sorted price order.
+        """
+        if not self.price_buckets:
+            return 0
+        low = 0 if low is None else low
+        high = (self.price_buckets[-1] + 1) * PRICE_BUCKET_CENTS if high is None else high
+        order = self.orders["price"]
+        matched = 0
+        first = bisect_left(self.price_buckets, low // PRICE_BUCKET_CENTS)
+        last = bisect_right(self.price_buckets, high // PRICE_BUCKET_CENTS)
+        for bucket in self.price_buckets[first:last]:
+            start, end = bucket * PRICE_BUCKET_CENTS, (bucket + 1) * PRICE_BUCKET_CENTS - 1
+            if low <= start and end <= high:
+                matched |= self.prices[bucket]
+            else:
+                begin = bisect_left(order, ((0, max(start, low)),))
+                stop = bisect_left(order, ((0, min(end, high) + 1),))
+                matched |= bitmap_of((slot for _, slot in order[begin:stop]), self.size)
+        return matched
+
+    def _page(self, matched: int, total: int, order: str, start: int, skip: int, limit: int) -> List[int]:
+        entries = self.orders[order]
+        wanted = skip + limit
+        # Walking the sort order until the page fills visits about wanted * len / total
+        # entries; ranking the matched slots directly visits `total`. Take the cheaper.
+        if wanted * (len(entries) - start) < total * total:
+            bits = matched.to_bytes((self.size + 7) // 8, "little")
+            page = []
+            for _, slot in islice(entries, start, None):
+                if bits[slot >> 3] >> (slot & 7) & 1:
+                    page.append(slot)
+                    if len(page) == wanted:
+                        break
+            return page[skip:]
+        return heapq.nsmallest(wanted, bitmap_slots(matched), key=self.sort_keys[order].__getitem__)[skip:]
+
+class ProfileIndexSync:
+    """Keeps a ProfileIndex in step with the profiles collection.
+
+    On a replica set it follows a change stream opened at the cluster time
+    read before the initial load, so nothing written during the load is
+    missed. Without change streams, or for a repository with no `changes`
+    feed like the memory engine's, it polls for profiles whose updatedAt
+    moved, re-reading an `overlap` window to cover clock skew between Node
+    instances.
+    Polling cannot see hard deletes, but the API only ever deactivates profiles.
+    """
+
+    def __init__(self, repository, index: ProfileIndex, poll_interval: float = 1.0, overlap: float = 5.0):
+        self.repository = repository
+        self.index = index
+        self.poll_interval = poll_interval
+        self.overlap = timedelta(seconds=overlap)
+        self.high_water: Optional[datetime] = None
+        self._start_at = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _load(self, since: Optional[datetime] = None) -> int:
+        profiles = [profile async for profile in self.repository.find(since)]
+        if since is None:
+            self.index.rebuild(profiles)
+        else:
+            for profile in profiles:
+                self.index.upsert(profile)
+        for profile in profiles:
+            if profile.get("updatedAt") and (self.high_water is None or profile["updatedAt"] > self.high_water):
+                self.high_water = profile["updatedAt"]
+        return len(profiles)
+
+    async def _change_stream_start(self):
+        if not hasattr(self.repository, "changes"):
+            return None
+        return await self.repository.change_stream_start()
+
+    async def start(self):
+        """Initial full load, then follow changes in the background"""
+        started = time.perf_counter()
+        self._start_at = await self._change_stream_start()
+        loaded = await self._load()
+        logger.info(
+            "Profile index loaded %d profiles in %.3fs, following %s",
+            loaded, time.perf_counter() - started, "a change stream" if self._start_at else "updatedAt deltas",
+        )
+        self._task = asyncio.create_task(self._follow() if self._start_at else self._poll())
+
+    async def _follow(self):
+        while True:
+            try:
+                async for operation, value in self.repository.changes(self._start_at):
+                    if operation == "delete":
+                        self.index.remove(value)
+                    else:
+                        self.index.upsert(value)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Profile change stream failed, reloading the index")
+                await asyncio.sleep(self.poll_interval)
+                try:
+                    self._start_at = await self._change_stream_start()
+                    await self._load()
+                except Exception:
+                    logger.exception("Profile index reload failed")
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self._load(None if self.high_water is None else self.high_water - self.overlap)
+            except Exception:
+                logger.exception("Profile index delta sync failed")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
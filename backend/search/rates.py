@@ -0,0 +1,63 @@
+"""Parsing of the free-form rate strings on profiles into prices per hour.
+
+utils/rates.js parses the same strings for the Node API and must agree to
+the cent: both fold the same way, match only ASCII digits, letters and
+spaces as JavaScript regexes do, and round half up. utils/rate_vectors.json
+holds the cases both test suites check.
+"""
+import math
+import re
+import unicodedata
+from typing import Any, Dict, Optional, Tuple
+
+# Rate strings are free-form: "€180/h", "150 €", "1.200€ noche", "300€/2h", "180,50 EUR/hora"
+_AMOUNT = r"(\d{1,3}(?:[.\u00a0\u202f]\d{3})+|\d+)(?:[.,](\d{1,2}))?(?!\d)"
+RATE_PRICE = re.compile(rf"(?:€|eur\w*)\s*{_AMOUNT}|{_AMOUNT}\s*(?:€|eur)", re.ASCII)
+RATE_AMOUNT = re.compile(_AMOUNT, re.ASCII)
+RATE_DURATION = re.compile(r"(\d+(?:[.,]\d+)?)?\s*(media hora|horas?|hrs?|h|minutos?|mins?|noches?|dias?)\b", re.ASCII)
+COMBINING_ACCENTS = re.compile("[\u0300-\u036f]")
+RATE_UNIT_HOURS = {
+    "h": 1, "hr": 1, "hrs": 1, "hora": 1, "horas": 1, "min": 1 / 60, "mins": 1 / 60, "minuto": 1 / 60,
+    "minutos": 1 / 60, "noche": 12, "noches": 12, "dia": 24, "dias": 24,
+}
+
+def fold_rate(rate: str) -> str:
+    """Compatibility-decompose, drop accents and lowercase, in that order like rates.js"""
+    return COMBINING_ACCENTS.sub("", unicodedata.normalize("NFKD", rate)).lower()
+
+def parse_rate(rate) -> Optional[Tuple[int, float]]:
+    """(price in cents, hours it covers) from a rate string, one hour unless it says otherwise"""
+    if not isinstance(rate, str):
+        return None
+    text = fold_rate(rate)
+    # Prefer the number next to a currency mark, so "2h 300€" is 300 for two hours
+    price = RATE_PRICE.search(text) or RATE_AMOUNT.search(text)
+    if price is None:
+        return None
+    whole, fraction = (price.group(1), price.group(2)) if price.group(1) else (price.group(3), price.group(4))
+    cents = int(re.sub(r"\D", "", whole)) * 100 + int((fraction or "0").ljust(2, "0"))
+    hours = 1.0
+    duration = RATE_DURATION.search(text[:price.start()] + " " + text[price.end():])
+    if duration is not None:
+        if duration.group(2) == "media hora":
+            hours = 0.5
+        else:
+            hours = float((duration.group(1) or "1").replace(",", ".")) * RATE_UNIT_HOURS[duration.group(2)]
+    if hours <= 0:
+        return None
+    return cents, hours
+
+def hourly_price(rate) -> Optional[int]:
+    parsed = parse_rate(rate)
+    # Half a cent rounds up, as Math.round does; round() would round it to even
+    return math.floor(parsed[0] / parsed[1] + 0.5) if parsed else None
+
+def rate_fields(rates: dict) -> Dict[str, Any]:
+    """Normalised numeric rate fields as stored on profile documents"""
+    fields: Dict[str, Any] = {}
+    for kind in ("incall", "outcall"):
+        parsed = parse_rate(rates.get(kind))
+        fields[f"rates.{kind}Cents"], fields[f"rates.{kind}Hours"] = parsed if parsed else (None, None)
+    # The listing sorts and filters on the incall price per hour
+    fields["priceCents"] = hourly_price(rates.get("incall"))
+    return fields
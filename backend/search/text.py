@@ -0,0 +1,204 @@
+"""Folding, tokenizing and the BM25F-ranked inverted index behind profile search"""
+import heapq
+import math
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import TYPE_CHECKING, Dict, Iterator, List, Tuple
+
+from .bitmaps import bitmap_of, bitmap_slots
+
+if TYPE_CHECKING:
+    from .profiles import ProfileEntry
+
+# Full-text search: field weights for BM25F-style term frequencies
+SEARCH_FIELDS = {"name": 3.0, "location": 2.0, "services": 1.5, "description": 1.0}
+SPANISH_STOPWORDS = frozenset(
+    "a al ante con contra de del desde durante e el en entre es hacia hasta la las le les lo los mas mi mis muy "
+    "ni no o os para pero por que se si sin sobre su sus te tu tus u un una unas uno unos y ya".split()
+)
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Terms in more profiles than this also keep a bitmap; rarer ones are turned into one per query
+SEARCH_DENSE_POSTINGS = 256
+SEARCH_MIN_PREFIX = 2
+# Result sets up to this size are ranked by scoring every match
+SEARCH_RANK_ALL = 128
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents, so "Asiática", "ASIATICA" and "asiatica" agree (ñ folds to n too)"""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(fold(text)) if token not in SPANISH_STOPWORDS]
+
+class SearchIndex:
+    """Inverted index over profile text with prefix matching and BM25F ranking.
+
+    Postings map each folded term to {slot: weighted term frequency}. Terms in
+    many profiles also keep a bitmap so filtering by them is a single AND;
+    rare terms are turned into a bitmap from their short postings on demand.
+    The vocabulary is a sorted list, so a prefix is a bisect range of terms.
+
+    For ranking, each term lazily caches its postings in descending BM25 order.
+    The length normalisation uses an average document length that only moves
+    when the real one drifts by more than 5%, so those lists stay valid until
+    the term itself changes.
+    """
+
+    def __init__(self):
+        self.rebuild({}, 0)
+
+    def rebuild(self, entries: Dict[int, "ProfileEntry"], size: int):
+        self.size = size
+        self.postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self.lengths: Dict[int, float] = {}
+        for slot, entry in entries.items():
+            for term, frequency in entry.terms.items():
+                self.postings[term][slot] = frequency
+            self.lengths[slot] = entry.length
+        self.postings = dict(self.postings)
+        self.total_length = sum(self.lengths.values())
+        self.scoring_length = self.total_length / len(self.lengths) if self.lengths else 1.0
+        self.ranked: Dict[str, List[Tuple[float, int]]] = {}
+        self.vocabulary = sorted(self.postings)
+        self.bitmaps = {
+            term: bitmap_of(postings, size) for term, postings in self.postings.items() if len(postings) > SEARCH_DENSE_POSTINGS
+        }
+
+    def add(self, slot: int, entry: "ProfileEntry"):
+        self.size = max(self.size, slot + 1)
+        bit = 1 << slot
+        for term, frequency in entry.terms.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                insort(self.vocabulary, term)
+            postings[slot] = frequency
+            self.ranked.pop(term, None)
+            if term in self.bitmaps:
+                self.bitmaps[term] |= bit
+            elif len(postings) > SEARCH_DENSE_POSTINGS:
+                self.bitmaps[term] = bitmap_of(postings, self.size)
+        self.lengths[slot] = entry.length
+        self.total_length += entry.length
+
+    def remove(self, slot: int, entry: "ProfileEntry"):
+        mask = ~(1 << slot)
+        for term in entry.terms:
+            postings = self.postings[term]
+            del postings[slot]
+            self.ranked.pop(term, None)
+            if not postings:
+                del self.postings[term]
+                del self.vocabulary[bisect_left(self.vocabulary, term)]
+            # Half the threshold, so a term near it doesn't flip on every edit
+            if len(postings) <= SEARCH_DENSE_POSTINGS // 2:
+                self.bitmaps.pop(term, None)
+            elif term in self.bitmaps:
+                self.bitmaps[term] &= mask
+        del self.lengths[slot]
+        self.total_length -= entry.length
+
+    def expand(self, token: str) -> List[str]:
+        """Indexed terms a query token matches: itself, or every term it prefixes"""
+        if len(token) < SEARCH_MIN_PREFIX:
+            return [token] if token in self.postings else []
+        low = bisect_left(self.vocabulary, token)
+        high = bisect_left(self.vocabulary, token + "\U0010ffff", low)
+        return self.vocabulary[low:high]
+
+    def match(self, expansions: List[List[str]]) -> int:
+        """Profiles matching every query token through at least one of its expansions"""
+        matched = -1
+        for terms in expansions:
+            either = 0
+            # Rare expansions are collected into one bitmap instead of one each
+            rare = bytearray((self.size + 7) // 8)
+            for term in terms:
+                bitmap = self.bitmaps.get(term)
+                if bitmap is not None:
+                    either |= bitmap
+                    continue
+                for slot in self.postings[term]:
+                    rare[slot >> 3] |= 1 << (slot & 7)
+            matched &= either | int.from_bytes(rare, "little")
+        return matched
+
+    def idf(self, term: str) -> float:
+        profiles, matching = len(self.lengths), len(self.postings[term])
+        return math.log(1 + (profiles - matching + 0.5) / (matching + 0.5))
+
+    def _norm(self, frequency: float, slot: int) -> float:
+        length = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[slot] / self.scoring_length)
+        return frequency * (BM25_K1 + 1) / (frequency + length)
+
+    def _ranked(self, term: str) -> List[Tuple[float, int]]:
+        ranked = self.ranked.get(term)
+        if ranked is None:
+            postings = self.postings[term]
+            ranked = self.ranked[term] = sorted(
+                ((self._norm(frequency, slot), slot) for slot, frequency in postings.items()), reverse=True
+            )
+        return ranked
+
+    def _scaled(self, term: str) -> Iterator[Tuple[float, int]]:
+        idf = self.idf(term)
+        return ((idf * norm, slot) for norm, slot in self._ranked(term))
+
+    def token_score(self, terms: List[str], slot: int) -> float:
+        """A query token scores with its best-scoring expansion"""
+        best = 0.0
+        for term in terms:
+            frequency = self.postings[term].get(slot)
+            if frequency is not None:
+                best = max(best, self.idf(term) * self._norm(frequency, slot))
+        return best
+
+    def top(self, expansions: List[List[str]], matched: int, total: int, size: int, wanted: int) -> List[int]:
+        """The `wanted` best BM25 matches, best first.
+
+        Large result sets go through the threshold algorithm: walk every
+        token's postings in descending score order, fully score each newly
+        seen match, and stop once the k-th best beats the sum of the scores
+        last seen per token. The work follows the page depth and the filter
+        selectivity, not the number of profiles.
+        """
+        average = self.total_length / len(self.lengths) if self.lengths else 1.0
+        if abs(average - self.scoring_length) > 0.05 * self.scoring_length:
+            self.scoring_length = average
+            self.ranked.clear()
+
+        if total <= SEARCH_RANK_ALL:
+            scored = [
+                (sum(self.token_score(terms, slot) for terms in expansions), -slot) for slot in bitmap_slots(matched)
+            ]
+            return [-slot for _, slot in heapq.nlargest(wanted, scored)]
+
+        bits = matched.to_bytes((size + 7) // 8, "little")
+        streams = []
+        for terms in expansions:
+            streams.append(heapq.merge(*(self._scaled(term) for term in terms), key=lambda item: -item[0]))
+        last = [math.inf] * len(streams)
+        best: List[Tuple[float, int]] = []
+        seen = set()
+        while True:
+            for position, stream in enumerate(streams):
+                item = next(stream, None)
+                if item is None:
+                    # Every match contains every token, so one exhausted token means all were seen
+                    return [-slot for _, slot in sorted(best, reverse=True)]
+                last[position], slot = item
+                if slot in seen or not bits[slot >> 3] >> (slot & 7) & 1:
+                    continue
+                seen.add(slot)
+                score = (sum(self.token_score(terms, slot) for terms in expansions), -slot)
+                if len(best) < wanted:
+                    heapq.heappush(best, score)
+                elif score > best[0]:
+                    heapq.heapreplace(best, score)
+            if len(best) == wanted and best[0][0] > sum(last):
+                return [-slot for _, slot in sorted(best, reverse=True)]
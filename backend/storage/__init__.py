@@ -0,0 +1,36 @@
+"""Storage backends. Handlers only talk to repositories, so the Motor engine can
+be swapped for the in-memory one to benchmark the API layer without a database.
+Both engines keep the same keyset order and cursor semantics.
+"""
+import os
+from typing import Iterable, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from .memory import MemoryStorage
+from .mongo import MotorStorage
+from .writes import ViewCounter, WriteCoalescer, WriteQueueFull
+
+# MongoDB connection settings
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '10'))
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+
+def create_storage(engine: str, db_name: Optional[str] = None, event_listeners: Iterable = ()):
+    if engine == "memory":
+        return MemoryStorage()
+    if engine != "motor":
+        raise ValueError(f"Unknown storage engine {engine!r}, expected 'motor' or 'memory'")
+    client = AsyncIOMotorClient(
+        os.environ['MONGO_URL'],
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        maxIdleTimeMS=int(os.environ.get('MONGO_MAX_IDLE_MS', '300000')),
+        waitQueueTimeoutMS=int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000')),
+        event_listeners=list(event_listeners),
+    )
+    return MotorStorage(client, client[db_name or os.environ['DB_NAME']])
+
+__all__ = [
+    "MONGO_MAX_POOL_SIZE", "MONGO_MIN_POOL_SIZE", "MemoryStorage", "MotorStorage", "ViewCounter", "WriteCoalescer",
+    "WriteQueueFull", "create_storage",
+]
@@ -0,0 +1,112 @@
+"""Document shapes, sort orders and aggregation pipelines shared by both storage engines"""
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from bson import ObjectId
+
+EPOCH = datetime(1970, 1, 1)
+
+# Status checks are listed newest first; (timestamp, id) is the keyset
+STATUS_SORT = [("timestamp", -1), ("id", -1)]
+# Rows read with this projection already have the StatusCheck shape, so they are encoded without validation
+STATUS_PROJECTION = {"_id": 0, "id": 1, "client_name": 1, "timestamp": 1}
+
+# Everything the profile listing returns, filters or sorts on
+PROFILE_INDEX_PROJECTION = {
+    "name": 1, "age": 1, "location": 1, "description": 1, "images.url": 1, "images.sizes": 1, "services": 1,
+    "ethnicity": 1, "category": 1, "rates": 1, "isVerified": 1, "isFeatured": 1, "isOnline": 1,
+    "rating.average": 1, "views.total": 1, "isActive": 1, "createdAt": 1, "updatedAt": 1,
+}
+
+# Inbox. Every send and read updates one summary row per (owner, counterpart, profile),
+# so the inbox is a keyset page over an index instead of an aggregation over all messages.
+
+def conversation_key(user_id: ObjectId, other_user_id: ObjectId, profile_id: ObjectId) -> dict:
+    return {"userId": user_id, "otherUserId": other_user_id, "profileId": profile_id}
+
+def conversation_sides(message: dict) -> List[Tuple[dict, int]]:
+    """The summary key of each participant and how many unread messages `message` adds to it"""
+    sender, receiver, profile_id = message["senderId"], message["receiverId"], message["profileId"]
+    return [(conversation_key(sender, receiver, profile_id), 0), (conversation_key(receiver, sender, profile_id), 1)]
+
+def conversation_last(message: dict) -> dict:
+    return {
+        "lastMessage": message["content"],
+        "lastMessageDate": message["createdAt"],
+        "lastMessageId": message["_id"],
+        "lastSenderId": message["senderId"],
+    }
+
+INBOX_SORT = [("lastMessageDate", -1), ("_id", -1)]
+INBOX_PAGE_MAX = 50
+
+# Summaries rebuilt from scratch, grouped the way GET /messages/conversations in routes/messages.js does
+INBOX_REBUILD_PIPELINE = [
+    {"$match": {"isDeleted": False}},
+    {"$sort": {"createdAt": 1, "_id": 1}},
+    {"$project": {
+        "profileId": 1, "content": 1, "createdAt": 1, "senderId": 1,
+        "sides": [
+            {"userId": "$senderId", "otherUserId": "$receiverId", "unread": {"$literal": 0}},
+            {"userId": "$receiverId", "otherUserId": "$senderId", "unread": {"$cond": ["$isRead", 0, 1]}},
+        ],
+    }},
+    {"$unwind": "$sides"},
+    {"$group": {
+        "_id": {"userId": "$sides.userId", "otherUserId": "$sides.otherUserId", "profileId": "$profileId"},
+        "lastMessage": {"$last": "$content"},
+        "lastMessageDate": {"$last": "$createdAt"},
+        "lastMessageId": {"$last": "$_id"},
+        "lastSenderId": {"$last": "$senderId"},
+        "unreadCount": {"$sum": "$sides.unread"},
+    }},
+]
+
+# Booking stats. Every create and status transition moves per-day counters for both
+# the model and the customer, so stats sum daily buckets instead of every booking.
+
+BOOKING_STATUSES = ("pending", "confirmed", "cancelled", "completed", "no-show")
+# (rollup role, booking field holding that user)
+BOOKING_ROLES = (("model", "modelId"), ("customer", "customerId"))
+# Statuses that keep a slot taken
+BOOKING_HOLDING_STATUSES = ("pending", "confirmed")
+BOOKING_SLOT_PROJECTION = {"date": 1, "time": 1, "duration": 1, "startsAt": 1, "endsAt": 1, "status": 1}
+
+def booking_day(booking: dict) -> datetime:
+    """The UTC day a booking is counted under, the day it was created"""
+    created = booking["createdAt"]
+    return datetime(created.year, created.month, created.day)
+
+def booking_deltas(booking: dict, changes: Dict[str, int]) -> Dict[str, float]:
+    """$inc fields for adding `changes` (status -> count) of `booking` to a bucket"""
+    amount = (booking.get("pricing") or {}).get("totalAmount") or 0
+    deltas: Dict[str, float] = {}
+    for status, count in changes.items():
+        if count:
+            deltas[f"counts.{status}"] = count
+            deltas[f"revenue.{status}"] = count * amount
+    return deltas
+
+# Buckets rebuilt from scratch out of the raw bookings
+BOOKING_ROLLUP_PIPELINE = [
+    {"$project": {
+        "status": 1,
+        "amount": {"$ifNull": ["$pricing.totalAmount", 0]},
+        "day": {"$dateFromParts": {
+            "year": {"$year": "$createdAt"}, "month": {"$month": "$createdAt"}, "day": {"$dayOfMonth": "$createdAt"},
+        }},
+        "sides": [{"role": "model", "userId": "$modelId"}, {"role": "customer", "userId": "$customerId"}],
+    }},
+    {"$unwind": "$sides"},
+    {"$group": {
+        "_id": {"role": "$sides.role", "userId": "$sides.userId", "day": "$day", "status": "$status"},
+        "count": {"$sum": 1},
+        "revenue": {"$sum": "$amount"},
+    }},
+    {"$group": {
+        "_id": {"role": "$_id.role", "userId": "$_id.userId", "day": "$_id.day"},
+        "counts": {"$push": {"k": "$_id.status", "v": "$count"}},
+        "revenue": {"$push": {"k": "$_id.status", "v": "$revenue"}},
+    }},
+    {"$project": {"counts": {"$arrayToObject": "$counts"}, "revenue": {"$arrayToObject": "$revenue"}}},
+]
@@ -0,0 +1,426 @@
+"""In-process repositories with the same keyset order and cursor semantics as the Motor ones"""
+import asyncio
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from search.rates import rate_fields
+from .documents import (
+    BOOKING_HOLDING_STATUSES, BOOKING_ROLES, BOOKING_SLOT_PROJECTION, EPOCH, booking_day, booking_deltas,
+    conversation_last, conversation_sides,
+)
+
+class MemoryStatusRepository:
+    """status_checks held in process.
+
+    `keys` is the ascending sorted list of (timestamp, id); reads walk it
+    backwards from the cursor position, which is the order of the Mongo index.
+    """
+
+    def __init__(self):
+        self.rows: Dict[str, dict] = {}
+        self.keys: List[Tuple[datetime, str]] = []
+
+    async def ensure_indexes(self):
+        pass
+
+    def _add(self, document: dict):
+        if document["id"] in self.rows:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: status_checks index: id_unique dup key: {{ id: {document['id']!r} }}")
+        # BSON datetimes have millisecond precision
+        timestamp = document["timestamp"].replace(microsecond=document["timestamp"].microsecond // 1000 * 1000)
+        self.rows[document["id"]] = {"id": document["id"], "client_name": document["client_name"], "timestamp": timestamp}
+        insort(self.keys, (timestamp, document["id"]))
+
+    async def insert(self, document: dict):
+        self._add(document)
+
+    async def insert_many(self, documents: List[dict]) -> Dict[int, str]:
+        failures = {}
+        for index, document in enumerate(documents):
+            try:
+                self._add(document)
+            except DuplicateKeyError as e:
+                failures[index] = str(e)
+        return failures
+
+    async def page(self, after: Optional[Tuple[datetime, str]], limit: int) -> List[dict]:
+        end = len(self.keys) if after is None else bisect_left(self.keys, after)
+        return [dict(self.rows[row_id]) for _, row_id in reversed(self.keys[max(end - limit, 0):end])]
+
+    async def stream(self, after: Optional[Tuple[datetime, str]], limit: Optional[int], batch_size: int):
+        # Batch by batch like a Mongo cursor's getMore, so concurrent inserts don't shift the scan
+        sent = 0
+        while limit is None or sent < limit:
+            batch = await self.page(after, batch_size if limit is None else min(batch_size, limit - sent))
+            if not batch:
+                return
+            for row in batch:
+                yield row
+            sent += len(batch)
+            after = (batch[-1]["timestamp"], batch[-1]["id"])
+
+class MemoryGenerationRepository:
+    def __init__(self):
+        self.generations: Dict[str, int] = {}
+
+    async def get(self, namespace: str) -> int:
+        return self.generations.get(namespace, 0)
+
+    async def bump(self, namespace: str) -> int:
+        self.generations[namespace] = self.generations.get(namespace, 0) + 1
+        return self.generations[namespace]
+
+class MemoryProfileRepository:
+    def __init__(self):
+        self.profiles: Dict[ObjectId, dict] = {}
+
+    async def ensure_indexes(self):
+        pass
+
+    async def find(self, since: Optional[datetime] = None):
+        for profile in list(self.profiles.values()):
+            if since is None or profile["updatedAt"] >= since:
+                yield dict(profile)
+
+    async def normalize_rates(self, batch_size: int = 1000) -> Tuple[int, int]:
+        updated = 0
+        for profile in self.profiles.values():
+            rates = profile.setdefault("rates", {})
+            fields = rate_fields(rates)
+            price = fields.pop("priceCents")
+            fields = {name.split(".", 1)[1]: value for name, value in fields.items()}
+            if profile.get("priceCents") != price or any(rates.get(name) != value for name, value in fields.items()):
+                profile["priceCents"] = price
+                rates.update(fields)
+                updated += 1
+        return len(self.profiles), updated
+
+    async def find_many(self, ids: Iterable[ObjectId], projection: dict) -> Dict[ObjectId, dict]:
+        return {profile_id: project(self.profiles[profile_id], projection) for profile_id in set(ids) if profile_id in self.profiles}
+
+    async def add_views(self, views: Dict[ObjectId, int]):
+        now = datetime.utcnow()
+        for profile_id, count in views.items():
+            profile = self.profiles.get(profile_id)
+            if profile is not None:
+                counts = profile.setdefault("views", {})
+                for period in ("total", "thisWeek", "thisMonth"):
+                    counts[period] = counts.get(period, 0) + count
+                profile["updatedAt"] = now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+    async def insert(self, profile: dict):
+        await self.save(profile)
+
+    async def add_image(self, profile_id: ObjectId, image: dict) -> Optional[dict]:
+        profile = self.profiles.get(profile_id)
+        if profile is None:
+            return None
+        images = profile.setdefault("images", [])
+        existing = next((entry for entry in images if entry.get("filename") == image["filename"]), None)
+        if existing is not None:
+            return dict(existing)
+        images.append(dict(image))
+        await self.save(profile)
+        return dict(image)
+
+    async def set_image_sizes(self, profile_id: ObjectId, filename: str, sizes: Dict[str, str]):
+        profile = self.profiles.get(profile_id)
+        for image in (profile or {}).get("images") or []:
+            if image.get("filename") == filename:
+                image["sizes"] = dict(sizes)
+                await self.save(profile)
+                break
+
+    async def save(self, profile: dict) -> dict:
+        """Insert or replace a profile, bumping updatedAt like mongoose's pre-save hook"""
+        now = datetime.utcnow()
+        profile = {"createdAt": now, **profile, "updatedAt": now.replace(microsecond=now.microsecond // 1000 * 1000)}
+        profile.setdefault("_id", ObjectId())
+        self.profiles[profile["_id"]] = profile
+        return profile
+
+def project(document: dict, projection: dict) -> dict:
+    """Top-level inclusion projection, the subset of Mongo's the memory engine needs"""
+    return {"_id": document["_id"], **{field: document[field] for field in projection if field in document}}
+
+class MemoryUserRepository:
+    def __init__(self):
+        self.users: Dict[ObjectId, dict] = {}
+        # The unique {email: 1} index of the users collection
+        self.by_email: Dict[str, ObjectId] = {}
+
+    async def find_many(self, ids: Iterable[ObjectId], projection: dict) -> Dict[ObjectId, dict]:
+        return {user_id: project(self.users[user_id], projection) for user_id in set(ids) if user_id in self.users}
+
+    async def save(self, user: dict) -> dict:
+        user = {"_id": ObjectId(), **user}
+        self.users[user["_id"]] = user
+        if "email" in user:
+            self.by_email[user["email"]] = user["_id"]
+        return user
+
+    async def get(self, user_id: ObjectId) -> Optional[dict]:
+        user = self.users.get(user_id)
+        return dict(user) if user is not None else None
+
+    async def find_by_email(self, email: str) -> Optional[dict]:
+        user_id = self.by_email.get(email.lower())
+        return None if user_id is None else dict(self.users[user_id])
+
+    async def insert(self, user: dict):
+        if user["email"] in self.by_email:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: users index: email_1 dup key: {{ email: {user['email']!r} }}")
+        self.users[user["_id"]] = dict(user)
+        self.by_email[user["email"]] = user["_id"]
+
+    async def record_login(self, user_id: ObjectId, when: datetime) -> Optional[dict]:
+        user = self.users.get(user_id)
+        if user is None:
+            return None
+        user.update(lastLogin=when, updatedAt=when)
+        return dict(user)
+
+class MemoryMessageRepository:
+    """Messages held in process.
+
+    `threads` holds each conversation's ascending sorted (createdAt, _id)
+    keys, under (profileId, lower participant, higher participant), and
+    `unread` each receiver's unread messages: the {receiverId, isRead} index.
+    """
+
+    def __init__(self):
+        self.messages: Dict[ObjectId, dict] = {}
+        self.threads: Dict[Tuple[ObjectId, ObjectId, ObjectId], List[Tuple[datetime, ObjectId]]] = defaultdict(list)
+        self.unread: Dict[ObjectId, Dict[ObjectId, dict]] = defaultdict(dict)
+
+    @staticmethod
+    def _thread(user_id: ObjectId, other_user_id: ObjectId, profile_id: ObjectId) -> tuple:
+        return (profile_id, *sorted((user_id, other_user_id)))
+
+    async def insert(self, message: dict):
+        message = self.messages[message["_id"]] = dict(message)
+        insort(self.threads[self._thread(message["senderId"], message["receiverId"], message["profileId"])],
+               (message["createdAt"], message["_id"]))
+        if not message["isRead"]:
+            self.unread[message["receiverId"]][message["_id"]] = message
+
+    async def conversation(self, user_id: ObjectId, other_user_id: ObjectId, profile_id: ObjectId,
+                           skip: int, limit: int) -> List[dict]:
+        messages = []
+        for _, message_id in reversed(self.threads.get(self._thread(user_id, other_user_id, profile_id), [])):
+            message = self.messages[message_id]
+            if message["isDeleted"]:
+                continue
+            if skip:
+                skip -= 1
+                continue
+            if len(messages) == limit:
+                break
+            messages.append(dict(message))
+        return messages
+
+    async def mark_read(self, user_id: ObjectId, other_user_id: ObjectId, profile_id: ObjectId) -> int:
+        read_at = datetime.utcnow()
+        unread = self.unread.get(user_id, {})
+        read = [
+            message for message in unread.values()
+            if message["senderId"] == other_user_id and message["profileId"] == profile_id
+        ]
+        for message in read:
+            message.update(isRead=True, readAt=read_at)
+            del unread[message["_id"]]
+        return len(read)
+
+    async def unread_count(self, user_id: ObjectId) -> int:
+        return sum(1 for message in self.unread.get(user_id, {}).values() if not message["isDeleted"])
+
+    async def summaries(self) -> AsyncIterator[dict]:
+        summaries: Dict[Tuple[ObjectId, ObjectId, ObjectId], dict] = {}
+        for message in sorted(self.messages.values(), key=lambda message: (message["createdAt"], message["_id"])):
+            if message["isDeleted"]:
+                continue
+            for key, unread in conversation_sides(message):
+                summary = summaries.setdefault(tuple(key.values()), {"_id": key, "unreadCount": 0})
+                summary.update(conversation_last(message))
+                if unread and not message["isRead"]:
+                    summary["unreadCount"] += 1
+        for summary in summaries.values():
+            yield summary
+
+class MemoryConversationRepository:
+    """Conversation summaries held in process.
+
+    `inboxes` holds each user's ascending sorted (lastMessageDate, _id) keys,
+    walked backwards from the cursor like MemoryStatusRepository.
+    """
+
+    def __init__(self):
+        self.rows: Dict[Tuple[ObjectId, ObjectId, ObjectId], dict] = {}
+        self.by_id: Dict[ObjectId, dict] = {}
+        self.inboxes: Dict[ObjectId, List[Tuple[datetime, ObjectId]]] = defaultdict(list)
+
+    async def ensure_indexes(self):
+        pass
+
+    def _row(self, key: dict) -> dict:
+        row = self.rows.get(tuple(key.values()))
+        if row is None:
+            row = {"_id": ObjectId(), **key, "lastMessageDate": EPOCH, "unreadCount": 0}
+            self.rows[tuple(key.values())] = self.by_id[row["_id"]] = row
+        return row
+
+    def _set_last(self, row: dict, last: dict):
+        inbox = self.inboxes[row["userId"]]
+        if row["lastMessageDate"] > EPOCH:
+            del inbox[bisect_left(inbox, (row["lastMessageDate"], row["_id"]))]
+        row.update(last)
+        insort(inbox, (row["lastMessageDate"], row["_id"]))
+
+    async def record(self, message: dict):
+        last = conversation_last(message)
+        for key, unread in conversation_sides(message):
+            row = self._row(key)
+            row["unreadCount"] += unread
+            if (row["lastMessageDate"], row.get("lastMessageId") or ObjectId("0" * 24)) < (
+                    last["lastMessageDate"], last["lastMessageId"]):
+                self._set_last(row, last)
+
+    async def mark_read(self, user_id: ObjectId, other_user_id: ObjectId, profile_id: ObjectId, count: int):
+        row = self.rows.get((user_id, other_user_id, profile_id))
+        if row is not None:
+            row["unreadCount"] -= count
+
+    async def page(self, user_id: ObjectId, after: Optional[Tuple[datetime, ObjectId]], limit: int) -> List[dict]:
+        inbox = self.inboxes.get(user_id, [])
+        end = len(inbox) if after is None else bisect_left(inbox, after)
+        return [dict(self.by_id[row_id]) for _, row_id in reversed(inbox[max(end - limit, 0):end])]
+
+    async def rebuild(self, summaries: AsyncIterator[dict], batch_size: int = 1000) -> int:
+        written = 0
+        async for summary in summaries:
+            row = self._row(summary.pop("_id"))
+            row["unreadCount"] = summary.pop("unreadCount")
+            self._set_last(row, summary)
+            written += 1
+        return written
+
+class MemoryBookingRepository:
+    """Bookings held in process, with each profile's ascending sorted
+    (date, _id) keys in `dates`: the {profileId, date} index.
+    """
+
+    def __init__(self):
+        self.bookings: Dict[ObjectId, dict] = {}
+        self.dates: Dict[ObjectId, List[Tuple[datetime, ObjectId]]] = defaultdict(list)
+
+    async def insert(self, booking: dict):
+        self.bookings[booking["_id"]] = dict(booking)
+        insort(self.dates[booking["profileId"]], (booking["date"], booking["_id"]))
+
+    async def get(self, booking_id: ObjectId) -> Optional[dict]:
+        booking = self.bookings.get(booking_id)
+        return None if booking is None else dict(booking)
+
+    async def delete(self, booking_id: ObjectId):
+        booking = self.bookings.pop(booking_id, None)
+        if booking is not None:
+            dates = self.dates[booking["profileId"]]
+            del dates[bisect_left(dates, (booking["date"], booking_id))]
+
+    async def holding(self, profile_id: ObjectId, since: datetime, until: Optional[datetime] = None) -> List[dict]:
+        dates = self.dates.get(profile_id, [])
+        # (date,) sorts before every (date, _id), so these bound the dates to [since, until)
+        start = bisect_left(dates, (since,))
+        end = len(dates) if until is None else bisect_left(dates, (until,))
+        bookings = (self.bookings[booking_id] for _, booking_id in dates[start:end])
+        return [project(booking, BOOKING_SLOT_PROJECTION) for booking in bookings
+                if booking["status"] in BOOKING_HOLDING_STATUSES]
+
+    async def transition(self, booking_id: ObjectId, current: str, fields: dict) -> Optional[dict]:
+        booking = self.bookings.get(booking_id)
+        if booking is None or booking["status"] != current:
+            return None
+        booking.update(fields)
+        return dict(booking)
+
+    async def rollups(self) -> AsyncIterator[dict]:
+        buckets: Dict[Tuple[str, ObjectId, datetime], dict] = {}
+        for booking in self.bookings.values():
+            for role, field in BOOKING_ROLES:
+                key = (role, booking[field], booking_day(booking))
+                bucket = buckets.setdefault(key, {
+                    "_id": {"role": role, "userId": booking[field], "day": key[2]}, "counts": {}, "revenue": {},
+                })
+                for name, delta in booking_deltas(booking, {booking["status"]: 1}).items():
+                    group, status = name.split(".", 1)
+                    bucket[group][status] = bucket[group].get(status, 0) + delta
+        for bucket in buckets.values():
+            yield bucket
+
+class MemoryBookingRollupRepository:
+    def __init__(self):
+        # (userId, role) -> day -> {"counts": ..., "revenue": ...}
+        self.buckets: Dict[Tuple[ObjectId, str], Dict[datetime, dict]] = defaultdict(dict)
+
+    async def ensure_indexes(self):
+        pass
+
+    async def add(self, booking: dict, changes: Dict[str, int]):
+        deltas = booking_deltas(booking, changes)
+        for role, field in BOOKING_ROLES:
+            if not deltas:
+                break
+            bucket = self.buckets[booking[field], role].setdefault(booking_day(booking), {"counts": {}, "revenue": {}})
+            for name, delta in deltas.items():
+                group, status = name.split(".", 1)
+                bucket[group][status] = bucket[group].get(status, 0) + delta
+
+    async def totals(self, role: str, user_id: ObjectId, since: Optional[datetime] = None,
+                     until: Optional[datetime] = None) -> Tuple[Dict[str, int], Dict[str, float]]:
+        counts: Dict[str, int] = defaultdict(int)
+        revenue: Dict[str, float] = defaultdict(float)
+        for day, bucket in self.buckets.get((user_id, role), {}).items():
+            if (since is None or day >= since) and (until is None or day < until):
+                for status, count in bucket["counts"].items():
+                    counts[status] += count
+                for status, amount in bucket["revenue"].items():
+                    revenue[status] += amount
+        return counts, revenue
+
+    async def rebuild(self, buckets: AsyncIterator[dict], batch_size: int = 1000) -> int:
+        written = 0
+        async for bucket in buckets:
+            key = bucket.pop("_id")
+            self.buckets[key["userId"], key["role"]][key["day"]] = {
+                "counts": dict(bucket["counts"]), "revenue": dict(bucket["revenue"]),
+            }
+            written += 1
+        return written
+
+class MemoryStorage:
+    def __init__(self):
+        self.status_checks = MemoryStatusRepository()
+        self.cache_generations = MemoryGenerationRepository()
+        self.profiles = MemoryProfileRepository()
+        self.users = MemoryUserRepository()
+        self.messages = MemoryMessageRepository()
+        self.conversations = MemoryConversationRepository()
+        self.bookings = MemoryBookingRepository()
+        self.booking_rollups = MemoryBookingRollupRepository()
+
+    async def ensure_indexes(self):
+        await asyncio.gather(
+            self.status_checks.ensure_indexes(), self.profiles.ensure_indexes(),
+            self.conversations.ensure_indexes(), self.booking_rollups.ensure_indexes(),
+        )
+
+    async def warm_up(self, connections: int):
+        pass
+
+    def close(self):
+        pass
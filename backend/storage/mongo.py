@@ -0,0 +1,416 @@
+"""Repositories over the MongoDB collections, through Motor"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from search.rates import rate_fields
+from .documents import (
+    BOOKING_HOLDING_STATUSES, BOOKING_ROLES, BOOKING_ROLLUP_PIPELINE, BOOKING_SLOT_PROJECTION, EPOCH, INBOX_REBUILD_PIPELINE,
+    INBOX_SORT, PROFILE_INDEX_PROJECTION, STATUS_PROJECTION, STATUS_SORT, booking_day, booking_deltas, conversation_key,
+    conversation_last, conversation_sides,
+)
+
+logger = logging.getLogger(__name__)
+
+class MotorStatusRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    @staticmethod
+    def _after(after: Optional[Tuple[datetime, str]]) -> dict:
+        if after is None:
+            return {}
+        timestamp, row_id = after
+        return {"$or": [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "id": {"$lt": row_id}},
+        ]}
+
+    async def ensure_indexes(self):
+        # The compound index serves the keyset sort and cursor predicate of GET /api/status
+        await asyncio.gather(
+            self.collection.create_index([("timestamp", -1), ("id", -1)], name="timestamp_id"),
+            self.collection.create_index("id", unique=True, name="id_unique"),
+        )
+
+    async def insert(self, document: dict):
+        await self.collection.insert_one(document)
+
+    async def insert_many(self, documents: List[dict]) -> Dict[int, str]:
+        """Unordered insert; returns the error message of each failed document by index"""
+        try:
+            await self.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            return {error["index"]: error["errmsg"] for error in e.details["writeErrors"]}
+        return {}
+
+    async def page(self, after: Optional[Tuple[datetime, str]], limit: int) -> List[dict]:
+        status_cursor = self.collection.find(self._after(after), STATUS_PROJECTION).sort(STATUS_SORT)
+        return await status_cursor.limit(limit).to_list(limit)
+
+    async def stream(self, after: Optional[Tuple[datetime, str]], limit: Optional[int], batch_size: int):
+        status_cursor = self.collection.find(self._after(after), STATUS_PROJECTION).sort(STATUS_SORT)
+        status_cursor = status_cursor.batch_size(batch_size)
+        if limit is not None:
+            status_cursor = status_cursor.limit(limit)
+        try:
+            async for row in status_cursor:
+                yield row
+        finally:
+            await status_cursor.close()
+
+class MotorGenerationRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, namespace: str) -> int:
+        doc = await self.collection.find_one({"_id": namespace})
+        return doc["generation"] if doc else 0
+
+    async def bump(self, namespace: str) -> int:
+        doc = await self.collection.find_one_and_update(
+            {"_id": namespace}, {"$inc": {"generation": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return doc["generation"]
+
+class MotorProfileRepository:
+    """The profiles collection owned by the Node API; written here only by rate backfills and view counts"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self):
+        # Delta sync polls on updatedAt, which mongoose's pre-save hook bumps on every save
+        await self.collection.create_index("updatedAt", name="updatedAt")
+
+    async def normalize_rates(self, batch_size: int = 1000) -> Tuple[int, int]:
+        """Backfill parsed rate fields wherever they are missing or stale; (scanned, updated).
+
+        Each update is conditional on the rate strings it was parsed from, so
+        a concurrent edit is never overwritten with numbers from the old text.
+        """
+        scanned = updated = 0
+        batch: List[UpdateOne] = []
+        profiles = self.collection.find({}, {"rates": 1, "priceCents": 1}).batch_size(batch_size)
+        async for profile in profiles:
+            scanned += 1
+            rates = profile.get("rates") or {}
+            fields = rate_fields(rates)
+            current = {"priceCents": profile.get("priceCents")}
+            current.update({f"rates.{name}": rates.get(name) for name in
+                            ("incallCents", "incallHours", "outcallCents", "outcallHours")})
+            if current != fields:
+                batch.append(UpdateOne(
+                    {"_id": profile["_id"], "rates.incall": rates.get("incall"), "rates.outcall": rates.get("outcall")},
+                    {"$set": fields},
+                ))
+            if len(batch) >= batch_size:
+                updated += (await self.collection.bulk_write(batch, ordered=False)).modified_count
+                batch = []
+        if batch:
+            updated += (await self.collection.bulk_write(batch, ordered=False)).modified_count
+        return scanned, updated
+
+    def find(self, since: Optional[datetime] = None):
+        """Profiles updated at or after `since`, or all of them"""
+        query = {} if since is None else {"updatedAt": {"$gte": since}}
+        return self.collection.find(query, PROFILE_INDEX_PROJECTION).batch_size(1000)
+
+    async def find_many(self, ids: Iterable[ObjectId], projection: dict) -> Dict[ObjectId, dict]:
+        profiles = self.collection.find({"_id": {"$in": list(set(ids))}}, projection)
+        return {profile["_id"]: profile async for profile in profiles}
+
+    async def insert(self, profile: dict):
+        await self.collection.insert_one(profile)
+
+    async def add_image(self, profile_id: ObjectId, image: dict) -> Optional[dict]:
+        """Append `image` unless the profile already has its file; returns the profile's entry for that file"""
+        profile = await self.collection.find_one_and_update(
+            {"_id": profile_id, "images.filename": {"$ne": image["filename"]}},
+            {"$push": {"images": image}, "$set": {"updatedAt": datetime.utcnow()}},
+            projection={"images": 1}, return_document=ReturnDocument.AFTER,
+        )
+        if profile is None:
+            profile = await self.collection.find_one({"_id": profile_id}, {"images": 1})
+        images = (profile or {}).get("images") or []
+        return next((entry for entry in images if entry.get("filename") == image["filename"]), None)
+
+    async def set_image_sizes(self, profile_id: ObjectId, filename: str, sizes: Dict[str, str]):
+        await self.collection.update_one(
+            {"_id": profile_id, "images.filename": filename},
+            {"$set": {"images.$.sizes": sizes, "updatedAt": datetime.utcnow()}},
+        )
+
+    async def add_views(self, views: Dict[ObjectId, int]):
+        """Add view counts in one unordered bulk, bumping updatedAt like incrementViews' save does"""
+        now = datetime.utcnow()
+        await self.collection.bulk_write([
+            UpdateOne(
+                {"_id": profile_id},
+                {"$inc": {"views.total": count, "views.thisWeek": count, "views.thisMonth": count}, "$set": {"updatedAt": now}},
+            )
+            for profile_id, count in views.items()
+        ], ordered=False)
+
+    async def change_stream_start(self):
+        """Cluster time to open a change stream from, or None on a standalone server without change streams"""
+        reply = await self.collection.database.command("ping")
+        return reply.get("operationTime")
+
+    async def changes(self, start_at) -> AsyncIterator[Tuple[str, Any]]:
+        """("upsert", profile) and ("delete", profile id) events since `start_at`"""
+        change_stream = self.collection.watch(full_document="updateLookup", start_at_operation_time=start_at)
+        async with change_stream as stream:
+            async for change in stream:
+                if change["operationType"] == "delete":
+                    yield "delete", change["documentKey"]["_id"]
+                elif change.get("fullDocument") is not None:
+                    yield "upsert", change["fullDocument"]
+
+class MotorUserRepository:
+    """The users collection owned by the Node API"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def find_many(self, ids: Iterable[ObjectId], projection: dict) -> Dict[ObjectId, dict]:
+        users = self.collection.find({"_id": {"$in": list(set(ids))}}, projection)
+        return {user["_id"]: user async for user in users}
+
+    async def get(self, user_id: ObjectId) -> Optional[dict]:
+        return await self.collection.find_one({"_id": user_id})
+
+    async def find_by_email(self, email: str) -> Optional[dict]:
+        return await self.collection.find_one({"email": email.lower()})
+
+    async def insert(self, user: dict):
+        """Raises DuplicateKeyError on an email that is already registered"""
+        await self.collection.insert_one(user)
+
+    async def record_login(self, user_id: ObjectId, when: datetime) -> Optional[dict]:
+        return await self.collection.find_one_and_update(
+            {"_id": user_id}, {"$set": {"lastLogin": when, "updatedAt": when}}, return_document=ReturnDocument.AFTER,
+        )
+
+class MotorMessageRepository:
+    """The messages collection, in the shape of models/Message.js"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def insert(self, message: dict):
+        await self.collection.insert_one(message)
+
+    async def conversation(self, user_id: ObjectId, other_user_id: ObjectId, profile_id: ObjectId,
+                           skip: int, limit: int) -> List[dict]:
+        """Newest first, like Message.getConversation"""
+        messages = self.collection.find({
+            "$or": [
+                {"senderId": user_id, "receiverId": other_user_id},
+                {"senderId": other_user_id, "receiverId": user_id},
+            ],
+            "profileId": profile_id,
+            "isDeleted": False,
+        }).sort("createdAt", -1).skip(skip).limit(limit)
+        return await messages.to_list(limit)
+
+    async def mark_read(self, user_id: ObjectId, other_user_id: ObjectId, profile_id: ObjectId) -> int:
+        """Mark what `other_user_id` sent `user_id` as read; returns how many messages flipped"""
+        result = await self.collection.update_many(
+            {"senderId": other_user_id, "receiverId": user_id, "profileId": profile_id, "isRead": False},
+            {"$set": {"isRead": True, "readAt": datetime.utcnow()}},
+        )
+        return result.modified_count
+
+    async def unread_count(self, user_id: ObjectId) -> int:
+        """Message.getUnreadCount"""
+        return await self.collection.count_documents({"receiverId": user_id, "isRead": False, "isDeleted": False})
+
+    def summaries(self) -> AsyncIterator[dict]:
+        """Conversation summaries computed from the raw messages"""
+        return self.collection.aggregate(INBOX_REBUILD_PIPELINE, allowDiskUse=True)
+
+class MotorConversationRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self):
+        await asyncio.gather(
+            self.collection.create_index(
+                [("userId", 1), ("otherUserId", 1), ("profileId", 1)], unique=True, name="conversation_unique"
+            ),
+            # Serves the keyset sort and cursor predicate of the inbox
+            self.collection.create_index([("userId", 1), ("lastMessageDate", -1), ("_id", -1)], name="inbox"),
+        )
+
+    async def record(self, message: dict):
+        """Fold a new message into both participants' summaries.
+
+        The counter is bumped unconditionally, but the last message only moves
+        forward in (createdAt, _id) order, so racing sends settle on the newest.
+        """
+        last = conversation_last(message)
+        newer = {"$or": [
+            {"lastMessageDate": {"$lt": last["lastMessageDate"]}},
+            {"lastMessageDate": last["lastMessageDate"], "lastMessageId": {"$lt": last["lastMessageId"]}},
+        ]}
+        operations = []
+        for key, unread in conversation_sides(message):
+            operations.append(UpdateOne(
+                key, {"$setOnInsert": {"lastMessageDate": EPOCH}, "$inc": {"unreadCount": unread}}, upsert=True
+            ))
+            operations.append(UpdateOne({**key, **newer}, {"$set": last}))
+        await self.collection.bulk_write(operations, ordered=True)
+
+    async def mark_read(self, user_id: ObjectId, other_user_id: ObjectId, profile_id: ObjectId, count: int):
+        if count:
+            await self.collection.update_one(
+                conversation_key(user_id, other_user_id, profile_id), {"$inc": {"unreadCount": -count}}
+            )
+
+    async def page(self, user_id: ObjectId, after: Optional[Tuple[datetime, ObjectId]], limit: int) -> List[dict]:
+        # Rows still at EPOCH are mid-insert and have no last message yet
+        query = {"userId": user_id, "lastMessageDate": {"$gt": EPOCH}}
+        if after is not None:
+            timestamp, row_id = after
+            query["$or"] = [
+                {"lastMessageDate": {"$lt": timestamp}},
+                {"lastMessageDate": timestamp, "_id": {"$lt": row_id}},
+            ]
+        return await self.collection.find(query).sort(INBOX_SORT).limit(limit).to_list(limit)
+
+    async def rebuild(self, summaries: AsyncIterator[dict], batch_size: int = 1000) -> int:
+        """Overwrite summaries with ones recomputed from the messages; returns how many were written.
+
+        Sends and reads that land while this runs can be overwritten by the
+        older snapshot, so run it while messaging is quiet.
+        """
+        written = 0
+        batch: List[ReplaceOne] = []
+        async for summary in summaries:
+            key = summary.pop("_id")
+            batch.append(ReplaceOne(key, {**key, **summary}, upsert=True))
+            if len(batch) >= batch_size:
+                await self.collection.bulk_write(batch, ordered=False)
+                written += len(batch)
+                batch = []
+        if batch:
+            await self.collection.bulk_write(batch, ordered=False)
+            written += len(batch)
+        return written
+
+class MotorBookingRepository:
+    """The bookings collection, in the shape of models/Booking.js"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def insert(self, booking: dict):
+        await self.collection.insert_one(booking)
+
+    async def get(self, booking_id: ObjectId) -> Optional[dict]:
+        return await self.collection.find_one({"_id": booking_id})
+
+    async def delete(self, booking_id: ObjectId):
+        await self.collection.delete_one({"_id": booking_id})
+
+    async def holding(self, profile_id: ObjectId, since: datetime, until: Optional[datetime] = None) -> List[dict]:
+        """Pending and confirmed bookings of a profile dated from `since` up to `until`, on the {profileId, date} index"""
+        query: Dict[str, Any] = {"profileId": profile_id, "status": {"$in": list(BOOKING_HOLDING_STATUSES)},
+                                 "date": {"$gte": since}}
+        if until is not None:
+            query["date"]["$lt"] = until
+        return await self.collection.find(query, BOOKING_SLOT_PROJECTION).to_list(None)
+
+    async def transition(self, booking_id: ObjectId, current: str, fields: dict) -> Optional[dict]:
+        """Apply `fields` if the booking is still in status `current`; the updated booking, else None"""
+        return await self.collection.find_one_and_update(
+            {"_id": booking_id, "status": current}, {"$set": fields}, return_document=ReturnDocument.AFTER
+        )
+
+    def rollups(self) -> AsyncIterator[dict]:
+        """Daily buckets computed from the raw bookings"""
+        return self.collection.aggregate(BOOKING_ROLLUP_PIPELINE, allowDiskUse=True)
+
+class MotorBookingRollupRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("userId", 1), ("role", 1), ("day", 1)], unique=True, name="user_role_day")
+
+    async def add(self, booking: dict, changes: Dict[str, int]):
+        """Move the counters of both participants' bucket for the booking's day"""
+        deltas = booking_deltas(booking, changes)
+        if deltas:
+            await self.collection.bulk_write([
+                UpdateOne({"userId": booking[field], "role": role, "day": booking_day(booking)}, {"$inc": deltas}, upsert=True)
+                for role, field in BOOKING_ROLES
+            ], ordered=False)
+
+    async def totals(self, role: str, user_id: ObjectId, since: Optional[datetime] = None,
+                     until: Optional[datetime] = None) -> Tuple[Dict[str, int], Dict[str, float]]:
+        """Summed (counts, revenue) by status over the buckets from `since` up to but excluding `until`"""
+        query: Dict[str, Any] = {"userId": user_id, "role": role}
+        if since is not None or until is not None:
+            query["day"] = {**({"$gte": since} if since else {}), **({"$lt": until} if until else {})}
+        counts: Dict[str, int] = defaultdict(int)
+        revenue: Dict[str, float] = defaultdict(float)
+        async for bucket in self.collection.find(query, {"_id": 0, "counts": 1, "revenue": 1}):
+            for status, count in (bucket.get("counts") or {}).items():
+                counts[status] += count
+            for status, amount in (bucket.get("revenue") or {}).items():
+                revenue[status] += amount
+        return counts, revenue
+
+    async def rebuild(self, buckets: AsyncIterator[dict], batch_size: int = 1000) -> int:
+        """Overwrite buckets with ones recomputed from the bookings; returns how many were written.
+
+        Creates and transitions that land while this runs can be overwritten by
+        the older snapshot, so run it off-peak.
+        """
+        written = 0
+        batch: List[ReplaceOne] = []
+        async for bucket in buckets:
+            key = bucket.pop("_id")
+            batch.append(ReplaceOne(key, {**key, **bucket}, upsert=True))
+            if len(batch) >= batch_size:
+                await self.collection.bulk_write(batch, ordered=False)
+                written += len(batch)
+                batch = []
+        if batch:
+            await self.collection.bulk_write(batch, ordered=False)
+            written += len(batch)
+        return written
+
+class MotorStorage:
+    def __init__(self, client, db):
+        self.client = client
+        self.db = db
+        self.status_checks = MotorStatusRepository(db.status_checks)
+        self.cache_generations = MotorGenerationRepository(db.cache_generations)
+        self.profiles = MotorProfileRepository(db.profiles)
+        self.users = MotorUserRepository(db.users)
+        self.messages = MotorMessageRepository(db.messages)
+        self.conversations = MotorConversationRepository(db.conversations)
+        self.bookings = MotorBookingRepository(db.bookings)
+        self.booking_rollups = MotorBookingRollupRepository(db.booking_rollups)
+
+    async def ensure_indexes(self):
+        await asyncio.gather(
+            self.status_checks.ensure_indexes(), self.profiles.ensure_indexes(),
+            self.conversations.ensure_indexes(), self.booking_rollups.ensure_indexes(),
+        )
+
+    async def warm_up(self, connections: int):
+        """Open `connections` pooled sockets up front with concurrent pings"""
+        await asyncio.gather(*(self.client.admin.command("ping") for _ in range(connections)))
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,216 @@
+"""Write-behind layers in front of the repositories: grouped status inserts and profile view counts"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, Optional, Tuple
+
+from bson import ObjectId
+
+from counters import CountersFull, LocalCounters
+
+logger = logging.getLogger(__name__)
+
+class WriteQueueFull(Exception):
+    pass
+
+class WriteCoalescer:
+    """Groups concurrent single-document inserts into one unordered insert_many.
+
+    The first queued document opens a window of `max_delay` seconds; everything
+    queued by then (up to `max_batch`) is committed together and each caller is
+    acknowledged when its batch commits. The queue is bounded so a stalled
+    database pushes back on callers instead of buffering without limit.
+    """
+
+    def __init__(self, repository, max_delay: float = 0.005, max_batch: int = 500, max_queue: int = 10000):
+        self.repository = repository
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._worker: Optional[asyncio.Task] = None
+        self._closed = False
+
+    async def insert(self, document: dict):
+        if self._closed:
+            raise RuntimeError("Write coalescer is closed")
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((document, future))
+        except asyncio.QueueFull:
+            raise WriteQueueFull()
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+        await future
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            if self.queue.qsize() < self.max_batch:
+                await asyncio.sleep(self.max_delay)
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await self._commit(batch)
+            except Exception as e:
+                logger.exception("Committing %d grouped status inserts failed", len(batch))
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _commit(self, batch):
+        try:
+            failed = await self.repository.insert_many([document for document, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            # Callers that gave up waiting (a cancelled request) have their futures cancelled already
+            for index, (_, future) in enumerate(batch):
+                if future.done():
+                    continue
+                if index in failed:
+                    future.set_exception(RuntimeError(failed[index]))
+                else:
+                    future.set_result(None)
+
+    async def close(self):
+        """Stop accepting writes and commit everything already queued"""
+        self._closed = True
+        if self._worker is not None:
+            await self.queue.join()
+            self._worker.cancel()
+
+class ViewCounter:
+    """Write-behind profile view counts.
+
+    Views are summed per profile in `counters` and written as one bulk of $inc
+    updates every `interval` seconds, or as soon as `max_pending` profiles are
+    waiting; stop() flushes whatever is left. Under `manage.py serve` the
+    counters are the workers' shared table, so pending views are the same
+    whichever worker is asked; each worker flushes the views it counted. A
+    flush moves counts to a "flushing" key until they are written, so they
+    stay in pending_views() meanwhile. With a `dedup_window`, repeat views of a
+    profile by the same viewer within it count once; that window is per worker.
+    """
+
+    PENDING = b"views:"
+    FLUSHING = b"flushing-views:"
+
+    def __init__(self, repository, counters=None, interval: float = 2.0, max_pending: int = 5000,
+                 dedup_window: float = 0.0, max_viewers: int = 100000):
+        self.repository = repository
+        self.counters = LocalCounters() if counters is None else counters
+        # Views that didn't fit in a full shared table, written with the next flush all the same
+        self.overflow = LocalCounters()
+        self.interval = interval
+        self.max_pending = max_pending
+        self.dedup_window = dedup_window
+        self.max_viewers = max_viewers
+        # (profile, viewer) -> when last counted, oldest first
+        self.recent: "OrderedDict[Tuple[ObjectId, str], float]" = OrderedDict()
+        self.flushed = 0
+        self.deduplicated = 0
+        self._added = 0
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, profile_id: ObjectId, viewer: Optional[str] = None) -> bool:
+        """Count a view; False when it repeats one by the same viewer inside the window"""
+        if self.dedup_window > 0 and viewer is not None:
+            now = time.monotonic()
+            while self.recent:
+                oldest = next(iter(self.recent.values()))
+                if now - oldest < self.dedup_window and len(self.recent) < self.max_viewers:
+                    break
+                self.recent.popitem(last=False)
+            key = (profile_id, viewer)
+            if key in self.recent:
+                self.deduplicated += 1
+                return False
+            self.recent[key] = now
+        key = self.PENDING + profile_id.binary
+        try:
+            added = self.counters.add(key, 1) == 1
+        except CountersFull:
+            added = self.overflow.add(key, 1) == 1
+            self._wakeup.set()
+        if added:
+            self._added += 1
+            if self._added >= self.max_pending:
+                self._wakeup.set()
+        return True
+
+    def pending_views(self, profile_id: ObjectId) -> int:
+        """Views of `profile_id` counted but not yet written"""
+        pending, flushing = self.PENDING + profile_id.binary, self.FLUSHING + profile_id.binary
+        return sum(counters.get(pending) + counters.get(flushing) for counters in (self.counters, self.overflow))
+
+    def pending_total(self) -> int:
+        return sum(
+            value for counters in (self.counters, self.overflow)
+            for prefix in (self.PENDING, self.FLUSHING) for _, value in counters.items(prefix)
+        )
+
+    async def start(self):
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Write the pending counts; returns how many profiles were updated"""
+        self._added = 0
+        # (counters holding the count under its "flushing" key, profile, count)
+        taken = []
+        for counters in (self.counters, self.overflow):
+            for key, _ in counters.own_items(self.PENDING):
+                profile_id = key[len(self.PENDING):]
+                try:
+                    count, holder = counters.move(key, self.FLUSHING + profile_id), counters
+                except CountersFull:
+                    # No room to mark them as being written; only this worker sees them meanwhile
+                    count, holder = counters.take(key), self.overflow
+                    self.overflow.add(self.FLUSHING + profile_id, count)
+                if count:
+                    taken.append((holder, profile_id, count))
+        if not taken:
+            return 0
+        views: Dict[ObjectId, int] = defaultdict(int)
+        for _, profile_id, count in taken:
+            views[ObjectId(profile_id)] += count
+        try:
+            await self.repository.add_views(views)
+        except Exception:
+            logger.exception("Flushing %d profile view counts failed, retrying with the next flush", len(views))
+            for holder, profile_id, count in taken:
+                holder.add(self.FLUSHING + profile_id, -count)
+                try:
+                    self.counters.add(self.PENDING + profile_id, count)
+                except CountersFull:
+                    self.overflow.add(self.PENDING + profile_id, count)
+            return 0
+        for holder, profile_id, count in taken:
+            holder.add(self.FLUSHING + profile_id, -count)
+        self.flushed += sum(views.values())
+        return len(views)
+
+    async def stop(self):
+        # Let a flush in progress finish rather than cancelling it half-written
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+        await self.flush()
@@ -0,0 +1,61 @@
+// Parsing of free-form rate strings such as "€180/h", "150 €", "1.200€ noche" or "300€/2h".
+// Mirrors parse_rate in search/rates.py, which backfills the same fields on existing profiles.
+// Both must agree to the cent, so the cases in rate_vectors.json are checked by both test suites.
+
+// \s is Unicode-aware in JavaScript but not in the Python regexes, so spaces are spelled out
+const SPACE = '[ \\t\\n\\r\\f\\v]';
+const AMOUNT = '(\\d{1,3}(?:[.\\u00a0\\u202f]\\d{3})+|\\d+)(?:[.,](\\d{1,2}))?(?!\\d)';
+const RATE_PRICE = new RegExp(`(?:€|eur\\w*)${SPACE}*${AMOUNT}|${AMOUNT}${SPACE}*(?:€|eur)`);
+const RATE_AMOUNT = new RegExp(AMOUNT);
+const RATE_DURATION = new RegExp(`(\\d+(?:[.,]\\d+)?)?${SPACE}*(media hora|horas?|hrs?|h|minutos?|mins?|noches?|dias?)\\b`);
+
+const UNIT_HOURS = {
+  h: 1, hr: 1, hrs: 1, hora: 1, horas: 1,
+  min: 1 / 60, mins: 1 / 60, minuto: 1 / 60, minutos: 1 / 60,
+  noche: 12, noches: 12,
+  dia: 24, dias: 24
+};
+
+// Compatibility-decompose, drop accents and lowercase, in that order like fold_rate
+const fold = (text) => text.normalize('NFKD').replace(/[\u0300-\u036f]/g, '').toLowerCase();
+
+// Returns { cents, hours } or null when the string has no price in it
+const parseRate = (rate) => {
+  if (typeof rate !== 'string') {
+    return null;
+  }
+
+  const text = fold(rate);
+  // Prefer the number next to a currency mark, so "2h 300€" is 300 for two hours
+  const price = text.match(RATE_PRICE) || text.match(RATE_AMOUNT);
+  if (!price) {
+    return null;
+  }
+
+  const whole = price[1] !== undefined ? price[1] : price[3];
+  const fraction = (price[1] !== undefined ? price[2] : price[4]) || '0';
+  const cents = parseInt(whole.replace(/\D/g, ''), 10) * 100 + parseInt(fraction.padEnd(2, '0'), 10);
+
+  let hours = 1;
+  const rest = text.slice(0, price.index) + ' ' + text.slice(price.index + price[0].length);
+  const duration = rest.match(RATE_DURATION);
+  if (duration) {
+    hours = duration[2] === 'media hora'
+      ? 0.5
+      : parseFloat((duration[1] || '1').replace(',', '.')) * UNIT_HOURS[duration[2]];
+  }
+
+  return hours > 0 ? { cents, hours } : null;
+};
+
+// Incall price per hour in cents, which the listing sorts and filters on.
+// Half a cent rounds up, the same as Math.floor(x + 0.5) in hourly_price.
+const hourlyPrice = (rate) => {
+  const parsed = parseRate(rate);
+  return parsed ? Math.floor(parsed.cents / parsed.hours + 0.5) : null;
+};
+
+module.exports = {
+  parseRate,
+  hourlyPrice
+};
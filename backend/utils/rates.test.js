@@ -0,0 +1,20 @@
+// Run with `npm test`. tests/test_rates.py checks search/rates.py against the same vectors.
+const test = require('node:test');
+const assert = require('node:assert');
+
+const { parseRate, hourlyPrice } = require('./rates');
+const vectors = require('./rate_vectors.json');
+
+test('parseRate and hourlyPrice agree with the shared vectors', () => {
+  for (const { rate, cents, hours, hourly } of vectors) {
+    const parsed = parseRate(rate);
+    assert.deepStrictEqual(parsed && [parsed.cents, parsed.hours], cents === null ? null : [cents, hours], String(rate));
+    assert.strictEqual(hourlyPrice(rate), hourly, String(rate));
+  }
+});
+
+test('half a cent rounds up', () => {
+  assert.strictEqual(hourlyPrice('1,01€ 2h'), 51);
+  assert.strictEqual(hourlyPrice('1,05€ 2h'), 53);
+});
+
@@ -5,14 +5,447 @@ Tests all endpoints with proper authentication flow and Spanish localization
 """
 
 import requests
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import hashlib
+import itertools
 import json
+import math
+import os
+import random
+import re
+import threading
 import time
 import sys
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from statistics import median
 import uuid
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+try:
+    import httpx
+except ImportError:  # only needed for --http2, and load mode falls back to threads
+    httpx = None
+
+try:
+    import pymongo
+    from bson import ObjectId
+except ImportError:  # only needed to generate scale-test data
+    pymongo = None
+
+DEFAULT_TIMEOUT = 10
+DEFAULT_POOL_SIZE = 10
+DEFAULT_WORKERS = 4
+SUPPORTED_METHODS = ("GET", "POST", "PUT", "PATCH", "DELETE")
+PROFILE_FILTER_PARAMS = "?location=Madrid&ethnicity=Europea&sortBy=featured"
+
+# Path segments that identify a document rather than a route (ObjectIds, UUIDs, numbers)
+ID_SEGMENT = re.compile(r"^(?:[0-9a-fA-F]{24}|[0-9a-fA-F-]{36}|\d+)$")
+
+# Exit codes: functional failures take precedence over performance regressions
+EXIT_FUNCTIONAL_FAILURE = 1
+EXIT_PERFORMANCE_REGRESSION = 2
+
+# Weighted virtual-user scenarios for --load, built from the functional test flows
+LOAD_SCENARIOS = {
+    "browse_and_message": (3, ("register", "login", "get_profiles", "send_message")),
+    "book": (1, ("login", "create_booking", "get_bookings")),
+    "browse": (2, ("get_profiles", "get_profiles"))
+}
+
+
+@dataclass
+class RequestTiming:
+    """Per-request timing breakdown in seconds"""
+    connect: float
+    ttfb: float
+    body: float
+    reused: bool
+
+    @property
+    def total(self):
+        return self.connect + self.ttfb + self.body
+
+
+# Connect (TCP + TLS) time of the current request, filled in by the pooled connections
+_connect_timing = threading.local()
+
+
+class _TimedConnectMixin:
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            elapsed = time.perf_counter() - start
+            _connect_timing.seconds = getattr(_connect_timing, "seconds", 0.0) + elapsed
+
+
+class _TimedHTTPConnection(_TimedConnectMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool
+        }
+
+
+class SessionTransport:
+    """Keep-alive HTTP/1.1 transport backed by a shared requests.Session"""
+
+    errors = (requests.exceptions.RequestException,)
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE):
+        self.session = requests.Session()
+        adapter = _TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # requests is blocking, so asyncio callers get one thread per pooled connection
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="transport")
+
+    def request(self, method, url, json=None, headers=None, timeout=DEFAULT_TIMEOUT):
+        _connect_timing.seconds = 0.0
+        response = self.session.request(
+            method, url, json=json, headers=headers, timeout=timeout, stream=True
+        )
+        connect = _connect_timing.seconds
+        headers_received = response.elapsed.total_seconds()
+
+        # Drain the body so the connection goes back to the pool
+        start = time.perf_counter()
+        response.content
+        body = time.perf_counter() - start
+
+        response.timing = RequestTiming(
+            connect=connect,
+            ttfb=max(headers_received - connect, 0.0),
+            body=body,
+            reused=connect == 0.0
+        )
+        return response
+
+    async def request_async(self, method, url, json=None, headers=None, timeout=DEFAULT_TIMEOUT):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            functools.partial(self.request, method, url, json=json, headers=headers, timeout=timeout)
+        )
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+
+class HttpxTransport:
+    """HTTP/2 or keep-alive HTTP/1.1 transport driving an httpx.AsyncClient on a background event loop.
+
+    Requests from asyncio callers are coroutines on that loop, so any number of
+    them can be in flight without a thread each.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, http2=True):
+        if httpx is None:
+            raise RuntimeError("The httpx transport requires httpx: pip install 'httpx[http2]'")
+
+        self.errors = (httpx.HTTPError,)
+        self.client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="httpx-transport", daemon=True)
+        self._thread.start()
+
+    async def arequest(self, method, url, json=None, headers=None, timeout=DEFAULT_TIMEOUT):
+        marks = {}
+
+        async def trace(event_name, info):
+            marks[event_name] = time.perf_counter()
+
+        request = self.client.build_request(
+            method, url, json=json, headers=headers, timeout=timeout,
+            extensions={"trace": trace}
+        )
+
+        start = time.perf_counter()
+        response = await self.client.send(request, stream=True)
+        headers_received = time.perf_counter()
+        try:
+            await response.aread()
+        finally:
+            await response.aclose()
+        body = time.perf_counter() - headers_received
+
+        connect = 0.0
+        if "connection.connect_tcp.started" in marks:
+            connected = marks.get("connection.start_tls.complete", marks.get("connection.connect_tcp.complete"))
+            if connected:
+                connect = connected - marks["connection.connect_tcp.started"]
+
+        response.timing = RequestTiming(
+            connect=connect,
+            ttfb=max(headers_received - start - connect, 0.0),
+            body=body,
+            reused=connect == 0.0
+        )
+        return response
+
+    def request(self, method, url, json=None, headers=None, timeout=DEFAULT_TIMEOUT):
+        future = asyncio.run_coroutine_threadsafe(
+            self.arequest(method, url, json=json, headers=headers, timeout=timeout), self.loop
+        )
+        return future.result()
+
+    async def request_async(self, method, url, json=None, headers=None, timeout=DEFAULT_TIMEOUT):
+        future = asyncio.run_coroutine_threadsafe(
+            self.arequest(method, url, json=json, headers=headers, timeout=timeout), self.loop
+        )
+        return await asyncio.wrap_future(future)
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.client.aclose(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+def route_template(method, endpoint):
+    """Normalize a request to its route, e.g. GET /profiles/:id"""
+    path = endpoint.split("?", 1)[0].rstrip("/") or "/"
+    segments = [":id" if ID_SEGMENT.match(segment) else segment for segment in path.split("/")]
+    return f"{method} {'/'.join(segments) or '/'}"
+
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram: ~1% relative error, at most ~900 buckets from 1µs to 60s"""
+
+    GROWTH = 1.02
+    MIN_VALUE = 1e-6
+    MAX_BUCKET = math.ceil(math.log(60.0 / MIN_VALUE, GROWTH))
 
-class VivastreetBackendTester:
     def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        if seconds <= self.MIN_VALUE:
+            index = 0
+        else:
+            index = min(int(math.log(seconds / self.MIN_VALUE, self.GROWTH)), self.MAX_BUCKET)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile (0-100), capped at the max"""
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * q / 100.0)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self.MIN_VALUE * self.GROWTH ** (index + 1), self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "max": self.max,
+            "buckets": {str(index): count for index, count in sorted(self.buckets.items())}
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        histogram.buckets = {int(index): count for index, count in data["buckets"].items()}
+        histogram.count = data["count"]
+        histogram.total = data["total"]
+        histogram.max = data["max"]
+        return histogram
+
+
+class LatencyRecorder:
+    """Per-route latency histograms, error counts and the observed traffic window"""
+
+    def __init__(self):
+        self.routes = {}
+        self.errors = {}
+        self.first = None
+        self.last = None
+        self._lock = threading.Lock()
+
+    def record(self, route, seconds, ok):
+        now = time.time()
+        with self._lock:
+            if route not in self.routes:
+                self.routes[route] = LatencyHistogram()
+                self.errors[route] = 0
+            self.routes[route].record(seconds)
+            if not ok:
+                self.errors[route] += 1
+            if self.first is None:
+                self.first = now - seconds
+            self.last = now
+
+    def window(self):
+        return (self.last - self.first) if self.first is not None else 0.0
+
+    def summary(self):
+        """Count, throughput, percentiles (ms) and error rate per route"""
+        window = max(self.window(), 1e-9)
+        with self._lock:
+            return {
+                route: {
+                    "count": histogram.count,
+                    "throughput": histogram.count / window,
+                    "mean_ms": histogram.total / histogram.count * 1000,
+                    "p50_ms": histogram.percentile(50) * 1000,
+                    "p90_ms": histogram.percentile(90) * 1000,
+                    "p95_ms": histogram.percentile(95) * 1000,
+                    "p99_ms": histogram.percentile(99) * 1000,
+                    "max_ms": histogram.max * 1000,
+                    "errors": self.errors[route],
+                    "error_rate": self.errors[route] / histogram.count
+                }
+                for route, histogram in sorted(self.routes.items())
+            }
+
+    def print_summary(self):
+        print("\n⏱️ LATENCY BY ROUTE")
+        print(f"   {'Route':<36} {'Count':>6} {'Req/s':>7} {'p50':>9} {'p90':>9} {'p99':>9} {'Max':>9} {'Errors':>7}")
+        for route, stats in self.summary().items():
+            print(
+                f"   {route:<36} {stats['count']:>6} {stats['throughput']:>7.1f} "
+                f"{stats['p50_ms']:>7.1f}ms {stats['p90_ms']:>7.1f}ms {stats['p99_ms']:>7.1f}ms "
+                f"{stats['max_ms']:>7.1f}ms {stats['error_rate'] * 100:>6.1f}%"
+            )
+
+    def to_dict(self):
+        with self._lock:
+            histograms = {route: histogram.to_dict() for route, histogram in self.routes.items()}
+        return {
+            "window": self.window(),
+            "routes": self.summary(),
+            "histograms": histograms
+        }
+
+    def export_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        print(f"💾 Latency report written to {path}")
+
+
+def requires(*needs, produces=()):
+    """Declare the shared state a test reads and the state it provides"""
+    def decorate(test):
+        test.needs = tuple(needs)
+        test.produces = tuple(produces)
+        return test
+    return decorate
+
+
+class DependencyScheduler:
+    """Runs tests on a worker pool as soon as the producers of their needs finish.
+
+    Dependencies only order the tests: a test still runs when a producer failed,
+    and is expected to report the missing state itself as before.
+    """
+
+    def __init__(self, tests, workers=DEFAULT_WORKERS):
+        self.tests = list(tests)
+        self.workers = max(1, workers)
+        self.durations = {}
+
+        producers = {}
+        for test in self.tests:
+            for resource in getattr(test, "produces", ()):
+                producers.setdefault(resource, []).append(test.__name__)
+
+        self.prerequisites = {}
+        for test in self.tests:
+            prerequisites = set()
+            for resource in getattr(test, "needs", ()):
+                if resource not in producers:
+                    raise ValueError(f"{test.__name__} needs '{resource}' but no test produces it")
+                prerequisites.update(producers[resource])
+            prerequisites.discard(test.__name__)
+            self.prerequisites[test.__name__] = prerequisites
+
+    def run(self, execute):
+        """Call execute(test) for every test, respecting declared dependencies"""
+        pending = list(self.tests)
+        finished = set()
+        running = {}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while pending or running:
+                # Submit in declaration order so a single worker reproduces the old sequence
+                for test in list(pending):
+                    if self.prerequisites[test.__name__] <= finished:
+                        pending.remove(test)
+                        running[pool.submit(self._timed, execute, test)] = test
+
+                if not running:
+                    names = ", ".join(test.__name__ for test in pending)
+                    raise RuntimeError(f"Dependency cycle between tests: {names}")
+
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    finished.add(running.pop(future).__name__)
+                    future.result()
+
+    def _timed(self, execute, test):
+        start = time.perf_counter()
+        try:
+            execute(test)
+        finally:
+            self.durations[test.__name__] = time.perf_counter() - start
+
+    def critical_path(self):
+        """Longest chain of measured test durations through the dependency graph"""
+        longest = {}
+        for test in self.tests:
+            name = test.__name__
+            longest[name] = self.durations.get(name, 0.0) + max(
+                (longest[dep] for dep in self.prerequisites[name] if dep in longest), default=0.0
+            )
+        return max(longest.values(), default=0.0)
+
+
+class VivastreetBackendTester:
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, http2=False, workers=DEFAULT_WORKERS, use_httpx=False):
         # Get backend URL from frontend .env
         with open('/app/frontend/.env', 'r') as f:
             for line in f:
@@ -22,6 +455,12 @@ class VivastreetBackendTester:
         
         print(f"🔗 Testing backend at: {self.base_url}")
         
+        # Shared keep-alive transport behind make_request
+        if http2 or use_httpx:
+            self.transport = HttpxTransport(pool_size, http2=http2)
+        else:
+            self.transport = SessionTransport(pool_size)
+        
         # Test data
         self.test_customer = {
             "name": "María García",
@@ -47,6 +486,14 @@ class VivastreetBackendTester:
         self.customer_data = None
         self.model_data = None
         self.profile_id = None
+        self.booking_id = None
+        
+        # Every request lands in a per-route latency histogram
+        self.latency = LatencyRecorder()
+        
+        # Tests run concurrently, so results are recorded under a lock
+        self.workers = workers
+        self._results_lock = threading.Lock()
         
         # Test results
         self.results = {
@@ -58,23 +505,70 @@ class VivastreetBackendTester:
     def log_test(self, test_name, passed, details=""):
         """Log test result"""
         status = "✅ PASS" if passed else "❌ FAIL"
-        print(f"{status}: {test_name}")
-        if details:
-            print(f"   Details: {details}")
-        
-        self.results["tests"].append({
-            "name": test_name,
-            "passed": passed,
-            "details": details
-        })
-        
-        if passed:
-            self.results["passed"] += 1
-        else:
-            self.results["failed"] += 1
+        with self._results_lock:
+            print(f"{status}: {test_name}")
+            if details:
+                print(f"   Details: {details}")
+            
+            self.results["tests"].append({
+                "name": test_name,
+                "passed": passed,
+                "details": details
+            })
+            
+            if passed:
+                self.results["passed"] += 1
+            else:
+                self.results["failed"] += 1
     
-    def make_request(self, method, endpoint, data=None, headers=None, token=None):
-        """Make HTTP request with proper error handling"""
+    def new_user_payload(self, template):
+        """Copy of a test user with a unique email, for flows that register many users"""
+        user = dict(template)
+        local, domain = template["email"].split("@")
+        user["email"] = f"{local}.{uuid.uuid4().hex[:8]}@{domain}"
+        return user
+    
+    def login_payload(self, user):
+        """Login body for a registered test user"""
+        return {
+            "email": user["email"],
+            "password": user["password"]
+        }
+    
+    def message_payload(self, receiver_id, profile_id):
+        """Message body sent from a customer to a model's profile"""
+        return {
+            "receiverId": receiver_id,
+            "profileId": profile_id,
+            "content": "Hola, me interesa conocer más sobre tus servicios. ¿Podrías darme más información?"
+        }
+    
+    def booking_payload(self, model_id, profile_id, date=None):
+        """Booking body for a model's profile, tomorrow unless a date is given"""
+        if date is None:
+            date = datetime.now() + timedelta(days=1)
+        
+        return {
+            "modelId": model_id,
+            "profileId": profile_id,
+            "date": date.isoformat(),
+            "time": "20:00",
+            "duration": 2,
+            "serviceType": "incall",
+            "services": ["Experiencia de Novia"],
+            "customerPhone": "+34 612 345 678",
+            "pricing": {
+                "hourlyRate": 180,
+                "totalAmount": 360
+            },
+            "location": {
+                "city": "Madrid",
+                "notes": "Hotel céntrico"
+            },
+            "customerNotes": "Primera vez, por favor ser discreta"
+        }
+    
+    def _prepare_request(self, method, endpoint, headers=None, token=None):
         url = f"{self.base_url}{endpoint}"
         
         # Set default headers
@@ -89,26 +583,51 @@ class VivastreetBackendTester:
         if token:
             request_headers["Authorization"] = f"Bearer {token}"
         
+        method = method.upper()
+        if method not in SUPPORTED_METHODS:
+            raise ValueError(f"Unsupported HTTP method: {method}")
+        
+        return method, url, request_headers
+    
+    def make_request(self, method, endpoint, data=None, headers=None, token=None):
+        """Make HTTP request with proper error handling"""
+        method, url, request_headers = self._prepare_request(method, endpoint, headers, token)
+        
+        start = time.perf_counter()
         try:
-            if method.upper() == "GET":
-                response = requests.get(url, headers=request_headers, timeout=10)
-            elif method.upper() == "POST":
-                response = requests.post(url, json=data, headers=request_headers, timeout=10)
-            elif method.upper() == "PUT":
-                response = requests.put(url, json=data, headers=request_headers, timeout=10)
-            elif method.upper() == "PATCH":
-                response = requests.patch(url, json=data, headers=request_headers, timeout=10)
-            elif method.upper() == "DELETE":
-                response = requests.delete(url, headers=request_headers, timeout=10)
-            else:
-                raise ValueError(f"Unsupported HTTP method: {method}")
-            
-            return response
+            response = self.transport.request(method, url, json=data, headers=request_headers, timeout=DEFAULT_TIMEOUT)
             
-        except requests.exceptions.RequestException as e:
+        except self.transport.errors as e:
             print(f"❌ Request failed: {e}")
-            return None
+            response = None
+        
+        self._record_latency(method, endpoint, response, time.perf_counter() - start)
+        return response
+    
+    async def amake_request(self, method, endpoint, data=None, headers=None, token=None):
+        """Asyncio counterpart of make_request, used by the load generator"""
+        method, url, request_headers = self._prepare_request(method, endpoint, headers, token)
+        
+        start = time.perf_counter()
+        try:
+            response = await self.transport.request_async(
+                method, url, json=data, headers=request_headers, timeout=DEFAULT_TIMEOUT
+            )
+            
+        except self.transport.errors:
+            response = None
+        
+        self._record_latency(method, endpoint, response, time.perf_counter() - start)
+        return response
     
+    def _record_latency(self, method, endpoint, response, elapsed):
+        # Prefer the transport's own timing, which leaves out client-side queueing
+        if response is not None:
+            self.latency.record(route_template(method, endpoint), response.timing.total, response.status_code < 400)
+        else:
+            self.latency.record(route_template(method, endpoint), elapsed, False)
+    
+    @requires()
     def test_health_check(self):
         """Test health check endpoint"""
         print("\n🏥 Testing Health Check...")
@@ -128,6 +647,7 @@ class VivastreetBackendTester:
         
         return False
     
+    @requires(produces=("customer_data",))
     def test_customer_registration(self):
         """Test customer registration"""
         print("\n👤 Testing Customer Registration...")
@@ -150,6 +670,7 @@ class VivastreetBackendTester:
         
         return False
     
+    @requires(produces=("model_data",))
     def test_model_registration(self):
         """Test model registration"""
         print("\n👩‍🦰 Testing Model Registration...")
@@ -172,14 +693,12 @@ class VivastreetBackendTester:
         
         return False
     
+    @requires("customer_data", produces=("customer_token",))
     def test_customer_login(self):
         """Test customer login"""
         print("\n🔐 Testing Customer Login...")
         
-        login_data = {
-            "email": self.test_customer["email"],
-            "password": self.test_customer["password"]
-        }
+        login_data = self.login_payload(self.test_customer)
         
         response = self.make_request("POST", "/auth/login", login_data)
         
@@ -199,14 +718,12 @@ class VivastreetBackendTester:
         
         return False
     
+    @requires("model_data", produces=("model_token",))
     def test_model_login(self):
         """Test model login"""
         print("\n🔐 Testing Model Login...")
         
-        login_data = {
-            "email": self.test_model["email"],
-            "password": self.test_model["password"]
-        }
+        login_data = self.login_payload(self.test_model)
         
         response = self.make_request("POST", "/auth/login", login_data)
         
@@ -226,6 +743,7 @@ class VivastreetBackendTester:
         
         return False
     
+    @requires("customer_token", "model_token")
     def test_get_current_user(self):
         """Test getting current user with token"""
         print("\n👤 Testing Get Current User...")
@@ -267,6 +785,7 @@ class VivastreetBackendTester:
         
         return False
     
+    @requires("model_data", produces=("profile_id",))
     def test_get_profiles(self):
         """Test getting all profiles with filtering"""
         print("\n📋 Testing Get Profiles...")
@@ -285,7 +804,7 @@ class VivastreetBackendTester:
                     self.profile_id = profiles[0]["id"]
                 
                 # Test with filters
-                filter_params = "?location=Madrid&ethnicity=Europea&sortBy=featured"
+                filter_params = PROFILE_FILTER_PARAMS
                 response = self.make_request("GET", f"/profiles{filter_params}")
                 
                 if response and response.status_code == 200:
@@ -305,6 +824,7 @@ class VivastreetBackendTester:
         
         return False
     
+    @requires("profile_id")
     def test_get_single_profile(self):
         """Test getting single profile by ID"""
         print("\n👤 Testing Get Single Profile...")
@@ -332,6 +852,7 @@ class VivastreetBackendTester:
         
         return False
     
+    @requires("profile_id", "model_token")
     def test_update_profile(self):
         """Test updating profile (model only)"""
         print("\n✏️ Testing Update Profile...")
@@ -365,6 +886,7 @@ class VivastreetBackendTester:
         
         return False
     
+    @requires("profile_id", "model_data", "customer_token", produces=("message",))
     def test_send_message(self):
         """Test sending messages"""
         print("\n💬 Testing Send Message...")
@@ -373,11 +895,7 @@ class VivastreetBackendTester:
             self.log_test("Send Message", False, "Missing profile ID or model data")
             return False
         
-        message_data = {
-            "receiverId": self.model_data["_id"],
-            "profileId": self.profile_id,
-            "content": "Hola, me interesa conocer más sobre tus servicios. ¿Podrías darme más información?"
-        }
+        message_data = self.message_payload(self.model_data["_id"], self.profile_id)
         
         response = self.make_request("POST", "/messages", message_data, token=self.customer_token)
         
@@ -395,6 +913,7 @@ class VivastreetBackendTester:
         
         return False
     
+    @requires("model_token", "message")
     def test_get_conversations(self):
         """Test getting conversations"""
         print("\n💬 Testing Get Conversations...")
@@ -415,6 +934,7 @@ class VivastreetBackendTester:
         
         return False
     
+    @requires("model_token", "message")
     def test_get_unread_count(self):
         """Test getting unread message count"""
         print("\n📬 Testing Get Unread Count...")
@@ -435,6 +955,7 @@ class VivastreetBackendTester:
         
         return False
     
+    @requires("profile_id", "model_data", "customer_token", produces=("booking_id",))
     def test_create_booking(self):
         """Test creating bookings"""
         print("\n📅 Testing Create Booking...")
@@ -443,28 +964,7 @@ class VivastreetBackendTester:
             self.log_test("Create Booking", False, "Missing profile ID or model data")
             return False
         
-        # Create booking for tomorrow
-        tomorrow = datetime.now() + timedelta(days=1)
-        
-        booking_data = {
-            "modelId": self.model_data["_id"],
-            "profileId": self.profile_id,
-            "date": tomorrow.isoformat(),
-            "time": "20:00",
-            "duration": 2,
-            "serviceType": "incall",
-            "services": ["Experiencia de Novia"],
-            "customerPhone": "+34 612 345 678",
-            "pricing": {
-                "hourlyRate": 180,
-                "totalAmount": 360
-            },
-            "location": {
-                "city": "Madrid",
-                "notes": "Hotel céntrico"
-            },
-            "customerNotes": "Primera vez, por favor ser discreta"
-        }
+        booking_data = self.booking_payload(self.model_data["_id"], self.profile_id)
         
         response = self.make_request("POST", "/bookings", booking_data, token=self.customer_token)
         
@@ -484,6 +984,7 @@ class VivastreetBackendTester:
         
         return False
     
+    @requires("customer_token", "model_token", "booking_id")
     def test_get_bookings(self):
         """Test getting bookings"""
         print("\n📅 Testing Get Bookings...")
@@ -519,6 +1020,7 @@ class VivastreetBackendTester:
         
         return False
     
+    @requires("model_token", "booking_id")
     def test_booking_stats(self):
         """Test booking statistics"""
         print("\n📊 Testing Booking Stats...")
@@ -539,6 +1041,7 @@ class VivastreetBackendTester:
         
         return False
     
+    @requires()
     def test_status_endpoints(self):
         """Test legacy status endpoints"""
         print("\n📊 Testing Status Endpoints...")
@@ -576,6 +1079,7 @@ class VivastreetBackendTester:
         
         return False
     
+    @requires()
     def test_cors_headers(self):
         """Test CORS headers"""
         print("\n🌐 Testing CORS Headers...")
@@ -601,30 +1105,30 @@ class VivastreetBackendTester:
         
         return False
     
+    @requires()
     def test_authentication_errors(self):
         """Test authentication error handling"""
         print("\n🔒 Testing Authentication Errors...")
         
         # Test without token
         try:
-            response = requests.get(f"{self.base_url}/auth/me", timeout=10)
-            if response and response.status_code == 401:
+            response = self.make_request("GET", "/auth/me")
+            if response is not None and response.status_code == 401:
                 data = response.json()
                 if not data.get("success") and "token" in data.get("message", "").lower():
                     self.log_test("No Token Error", True, "Proper 401 response for missing token")
                 else:
                     self.log_test("No Token Error", False, f"Unexpected error response: {data}")
             else:
-                status = response.status_code if response else "No response"
+                status = response.status_code if response is not None else "No response"
                 self.log_test("No Token Error", False, f"Expected 401, got: {status}")
         except Exception as e:
             self.log_test("No Token Error", False, f"Request failed: {e}")
         
         # Test with invalid token
         try:
-            headers = {"Authorization": "Bearer invalid-token"}
-            response = requests.get(f"{self.base_url}/auth/me", headers=headers, timeout=10)
-            if response and response.status_code == 403:
+            response = self.make_request("GET", "/auth/me", token="invalid-token")
+            if response is not None and response.status_code == 403:
                 data = response.json()
                 if not data.get("success") and "token" in data.get("message", "").lower():
                     self.log_test("Invalid Token Error", True, "Proper 403 response for invalid token")
@@ -632,15 +1136,22 @@ class VivastreetBackendTester:
                 else:
                     self.log_test("Invalid Token Error", False, f"Unexpected error response: {data}")
             else:
-                status = response.status_code if response else "No response"
+                status = response.status_code if response is not None else "No response"
                 self.log_test("Invalid Token Error", False, f"Expected 403, got: {status}")
         except Exception as e:
             self.log_test("Invalid Token Error", False, f"Request failed: {e}")
         
         return False
     
+    def run_test(self, test):
+        """Run a single test, recording a crash as a failure"""
+        try:
+            test()
+        except Exception as e:
+            self.log_test(test.__name__, False, f"Test crashed: {str(e)}")
+    
     def run_all_tests(self):
-        """Run all tests in sequence"""
+        """Run all tests, in parallel where their dependencies allow"""
         print("🚀 Starting Vivastreet Node.js Backend API Tests")
         print("=" * 60)
         
@@ -666,21 +1177,22 @@ class VivastreetBackendTester:
             self.test_authentication_errors
         ]
         
-        for test in tests:
-            try:
-                test()
-                time.sleep(0.5)  # Small delay between tests
-            except Exception as e:
-                self.log_test(test.__name__, False, f"Test crashed: {str(e)}")
+        scheduler = DependencyScheduler(tests, workers=self.workers)
+        start = time.perf_counter()
+        scheduler.run(self.run_test)
+        wall_time = time.perf_counter() - start
         
         # Print summary
         print("\n" + "=" * 60)
         print("📊 TEST SUMMARY")
         print("=" * 60)
+        print(f"⏱️ Wall time: {wall_time:.2f}s (critical path: {scheduler.critical_path():.2f}s, {scheduler.workers} workers)")
         print(f"✅ Passed: {self.results['passed']}")
         print(f"❌ Failed: {self.results['failed']}")
         print(f"📈 Success Rate: {(self.results['passed'] / (self.results['passed'] + self.results['failed']) * 100):.1f}%")
         
+        self.latency.print_summary()
+        
         # Show failed tests
         failed_tests = [test for test in self.results["tests"] if not test["passed"]]
         if failed_tests:
@@ -720,9 +1232,713 @@ class VivastreetBackendTester:
         
         return self.results["failed"] == 0
 
+class VirtualUser:
+    """Per-session state of one simulated user"""
+    def __init__(self, account=None):
+        self.account = account
+        self.token = None
+
+
+class LoadGenerator:
+    """Drives weighted user scenarios from an asyncio event loop.
+
+    With a target rate, arrivals are open-model (Poisson, ramped linearly up to
+    the rate) and `users` caps the sessions in flight; arrivals beyond the cap
+    are dropped and counted. Without a rate, `users` closed-loop users run
+    scenarios back to back, their starts staggered over the ramp-up.
+    """
+
+    def __init__(self, tester, users=10, duration=60.0, max_requests=None, ramp_up=0.0,
+                 rate=None, scenarios=None, seed=None):
+        self.tester = tester
+        self.users = users
+        self.duration = duration
+        self.max_requests = max_requests
+        self.ramp_up = ramp_up
+        self.rate = rate
+        self.scenarios = scenarios or LOAD_SCENARIOS
+        self.random = random.Random(seed)
+
+        self.accounts = []
+        self.model_data = None
+        self.profile_id = None
+
+        self.requests_sent = 0
+        self.errors = 0
+        self.dropped = 0
+        self.scenario_results = {name: {"completed": 0, "failed": 0} for name in self.scenarios}
+
+    async def setup(self):
+        """Register the target model and a pool of customers for login-only scenarios"""
+        model = self.tester.new_user_payload(self.tester.test_model)
+        response = await self._request("POST", "/auth/register", model)
+        if response is None:
+            return False
+        self.model_data = response.json()["data"]["user"]
+
+        response = await self._request("GET", "/profiles?sortBy=newest&limit=1")
+        profiles = response.json()["data"]["profiles"] if response is not None else []
+        if not profiles:
+            return False
+        self.profile_id = profiles[0]["id"]
+
+        customers = [self.tester.new_user_payload(self.tester.test_customer) for _ in range(min(self.users, 20))]
+        responses = await asyncio.gather(*(self._request("POST", "/auth/register", c) for c in customers))
+        self.accounts = [c for c, r in zip(customers, responses) if r is not None]
+        return bool(self.accounts)
+
+    async def run(self):
+        """Run the load test, returning False if setup failed"""
+        loop = asyncio.get_running_loop()
+        print("🏗️ Preparing load test accounts...")
+        if not await self.setup():
+            print("❌ Load test setup failed")
+            return False
+
+        # Setup traffic doesn't count towards the run
+        self.requests_sent = self.errors = 0
+        self.tester.latency = LatencyRecorder()
+        self.started = loop.time()
+        if self.rate:
+            await self._open_model()
+        else:
+            await self._closed_model()
+        self.elapsed = loop.time() - self.started
+        return True
+
+    def _stopped(self):
+        if self.max_requests is not None and self.requests_sent >= self.max_requests:
+            return True
+        if self.duration is not None and asyncio.get_running_loop().time() - self.started >= self.duration:
+            return True
+        return False
+
+    async def _closed_model(self):
+        async def user_loop(index):
+            await asyncio.sleep(self.ramp_up * index / self.users)
+            while not self._stopped():
+                await self._run_scenario()
+
+        await asyncio.gather(*(user_loop(i) for i in range(self.users)))
+
+    async def _open_model(self):
+        loop = asyncio.get_running_loop()
+        in_flight = set()
+
+        while not self._stopped():
+            elapsed = loop.time() - self.started
+            rate = self.rate * min(1.0, elapsed / self.ramp_up) if self.ramp_up else self.rate
+            await asyncio.sleep(self.random.expovariate(max(rate, self.rate / 100)))
+            if self._stopped():
+                break
+
+            if len(in_flight) >= self.users:
+                self.dropped += 1
+                continue
+            task = asyncio.ensure_future(self._run_scenario())
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+
+        if in_flight:
+            await asyncio.gather(*in_flight)
+
+    async def _run_scenario(self):
+        names = list(self.scenarios)
+        name = self.random.choices(names, weights=[self.scenarios[n][0] for n in names])[0]
+        user = VirtualUser()
+
+        for step in self.scenarios[name][1]:
+            if self._stopped():
+                return
+            if not await getattr(self, f"step_{step}")(user):
+                self.scenario_results[name]["failed"] += 1
+                return
+
+        self.scenario_results[name]["completed"] += 1
+
+    async def _request(self, method, endpoint, data=None, token=None):
+        self.requests_sent += 1
+        response = await self.tester.amake_request(method, endpoint, data, token=token)
+        if response is None or response.status_code >= 400:
+            self.errors += 1
+            return None
+        return response
+
+    async def step_register(self, user):
+        user.account = self.tester.new_user_payload(self.tester.test_customer)
+        response = await self._request("POST", "/auth/register", user.account)
+        return response is not None
+
+    async def step_login(self, user):
+        if user.account is None:
+            user.account = self.random.choice(self.accounts)
+        response = await self._request("POST", "/auth/login", self.tester.login_payload(user.account))
+        if response is None:
+            return False
+        user.token = response.json()["data"]["token"]
+        return True
+
+    async def step_get_profiles(self, user):
+        params = self.random.choice(("", PROFILE_FILTER_PARAMS))
+        return await self._request("GET", f"/profiles{params}", token=user.token) is not None
+
+    async def step_send_message(self, user):
+        message = self.tester.message_payload(self.model_data["_id"], self.profile_id)
+        return await self._request("POST", "/messages", message, token=user.token) is not None
+
+    async def step_create_booking(self, user):
+        # Spread dates so concurrent users don't collide on the same-date conflict check
+        date = datetime.now() + timedelta(days=self.random.randint(1, 365), minutes=self.random.randint(0, 1439))
+        booking = self.tester.booking_payload(self.model_data["_id"], self.profile_id, date=date)
+        return await self._request("POST", "/bookings", booking, token=user.token) is not None
+
+    async def step_get_bookings(self, user):
+        return await self._request("GET", "/bookings", token=user.token) is not None
+
+    def print_summary(self):
+        print("\n" + "=" * 60)
+        print("📈 LOAD TEST SUMMARY")
+        print("=" * 60)
+        mode = f"open model at {self.rate}/s" if self.rate else "closed model"
+        print(f"👥 Users: {self.users} ({mode}, ramp-up {self.ramp_up}s)")
+        print(f"⏱️ Duration: {self.elapsed:.1f}s")
+        print(f"📨 Requests: {self.requests_sent} ({self.requests_sent / max(self.elapsed, 1e-9):.1f} req/s)")
+        print(f"❌ Errors: {self.errors}")
+        if self.rate:
+            print(f"🚫 Dropped arrivals: {self.dropped}")
+        for name, result in self.scenario_results.items():
+            print(f"   • {name}: {result['completed']} completed, {result['failed']} failed")
+        
+        self.tester.latency.print_summary()
+
+
+def parse_scenarios(specs):
+    """Apply NAME=WEIGHT overrides to the default load scenarios"""
+    scenarios = dict(LOAD_SCENARIOS)
+    for spec in specs or ():
+        name, _, weight = spec.partition("=")
+        if name not in scenarios:
+            raise SystemExit(f"Unknown scenario '{name}', expected one of: {', '.join(scenarios)}")
+        scenarios[name] = (float(weight), scenarios[name][1])
+    return {name: scenario for name, scenario in scenarios.items() if scenario[0] > 0}
+
+
+def mann_whitney_greater(sample, reference):
+    """One-sided Mann-Whitney U p-value that `sample` tends to be larger than `reference`.
+
+    Exact permutation distribution for small samples, normal approximation with
+    tie correction otherwise.
+    """
+    n1, n2 = len(sample), len(reference)
+    if not n1 or not n2:
+        return 1.0
+
+    def u_statistic(values, others):
+        return sum(1.0 if a > b else 0.5 if a == b else 0.0 for a in values for b in others)
+
+    observed = u_statistic(sample, reference)
+
+    if math.comb(n1 + n2, n1) <= 20000:
+        pooled = list(sample) + list(reference)
+        as_extreme = total = 0
+        for chosen in itertools.combinations(range(n1 + n2), n1):
+            chosen_set = set(chosen)
+            values = [pooled[i] for i in chosen]
+            others = [pooled[i] for i in range(n1 + n2) if i not in chosen_set]
+            total += 1
+            if u_statistic(values, others) >= observed:
+                as_extreme += 1
+        return as_extreme / total
+
+    n = n1 + n2
+    tie_counts = [len(list(group)) for _, group in itertools.groupby(sorted(list(sample) + list(reference)))]
+    tie_term = sum(t ** 3 - t for t in tie_counts) / (n * (n - 1))
+    sigma = math.sqrt(n1 * n2 / 12.0 * ((n + 1) - tie_term))
+    if sigma == 0:
+        return 1.0
+    z = (observed - n1 * n2 / 2.0 - 0.5) / sigma
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+class BenchmarkSuite:
+    """Repeated latency/throughput rounds over the read endpoints the tests cover.
+
+    Each round sends `iterations` requests per endpoint across the worker pool and
+    keeps that round's p95 and throughput, so baselines hold a sample per round
+    rather than a single number.
+    """
+
+    def __init__(self, tester, rounds=5, iterations=20):
+        self.tester = tester
+        self.rounds = rounds
+        self.iterations = iterations
+        self.results = {}
+
+    def endpoints(self):
+        """(label, endpoint, token) for every benchmark whose test state exists"""
+        tester = self.tester
+        endpoints = [
+            ("GET /profiles", "/profiles", None),
+            ("GET /profiles (filtered)", f"/profiles{PROFILE_FILTER_PARAMS}", None),
+            ("GET /status", "/status", None)
+        ]
+        if tester.profile_id:
+            endpoints.append(("GET /profiles/:id", f"/profiles/{tester.profile_id}", None))
+        if tester.customer_token:
+            endpoints.append(("GET /auth/me", "/auth/me", tester.customer_token))
+            endpoints.append(("GET /bookings (customer)", "/bookings", tester.customer_token))
+        if tester.model_token:
+            endpoints.append(("GET /messages/conversations", "/messages/conversations", tester.model_token))
+            endpoints.append(("GET /messages/unread-count", "/messages/unread-count", tester.model_token))
+            endpoints.append(("GET /bookings/stats/overview", "/bookings/stats/overview", tester.model_token))
+        return endpoints
+
+    def run(self):
+        print("\n🏁 Running benchmarks...")
+        endpoints = self.endpoints()
+        self.results = {label: {"p95_ms": [], "throughput": [], "errors": 0} for label, _, _ in endpoints}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.tester.workers) as pool:
+            for _ in range(self.rounds):
+                for label, endpoint, token in endpoints:
+                    histogram = LatencyHistogram()
+                    start = time.perf_counter()
+                    responses = list(pool.map(
+                        lambda _: self.tester.make_request("GET", endpoint, token=token),
+                        range(self.iterations)
+                    ))
+                    elapsed = time.perf_counter() - start
+
+                    for response in responses:
+                        if response is None or response.status_code >= 400:
+                            self.results[label]["errors"] += 1
+                        else:
+                            histogram.record(response.timing.total)
+
+                    self.results[label]["p95_ms"].append(histogram.percentile(95) * 1000)
+                    self.results[label]["throughput"].append(self.iterations / elapsed)
+
+        for label, result in self.results.items():
+            print(
+                f"   • {label}: p95 {median(result['p95_ms']):.1f}ms, "
+                f"{median(result['throughput']):.1f} req/s, {result['errors']} errors"
+            )
+        return self.results
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({
+                "created": datetime.now().isoformat(),
+                "base_url": self.tester.base_url,
+                "rounds": self.rounds,
+                "iterations": self.iterations,
+                "endpoints": self.results
+            }, f, indent=2)
+        print(f"💾 Baseline saved to {path}")
+
+    @staticmethod
+    def load_baseline(path):
+        """The per-endpoint samples of a saved baseline; exits with the reason when it can't be used"""
+        try:
+            with open(path) as f:
+                endpoints = json.load(f)["endpoints"]
+            for label, samples in endpoints.items():
+                if not all(samples[key] and all(isinstance(value, (int, float)) for value in samples[key])
+                           for key in ("p95_ms", "throughput")):
+                    raise ValueError(f"no samples for {label}")
+        except FileNotFoundError:
+            raise SystemExit(f"Baseline {path} does not exist; create it first with --save-baseline")
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            raise SystemExit(f"Baseline {path} is not a saved benchmark baseline ({type(e).__name__}: {e})")
+        return endpoints
+
+    def compare(self, baseline, path, max_regression=15.0, alpha=0.05):
+        """Return the endpoints whose p95 rose or throughput fell past the threshold, significantly"""
+        print(f"\n📐 COMPARISON WITH {path} (threshold {max_regression:.0f}%, alpha {alpha})")
+        regressions = []
+        for label, result in self.results.items():
+            if label not in baseline:
+                print(f"   ➕ {label}: not in baseline")
+                continue
+            reference = baseline[label]
+
+            p95_change = _relative_change(median(reference["p95_ms"]), median(result["p95_ms"]))
+            p95_p = mann_whitney_greater(result["p95_ms"], reference["p95_ms"])
+            throughput_change = _relative_change(median(reference["throughput"]), median(result["throughput"]))
+            throughput_p = mann_whitney_greater(reference["throughput"], result["throughput"])
+
+            problems = []
+            if p95_change > max_regression and p95_p < alpha:
+                problems.append(f"p95 +{p95_change:.1f}% (p={p95_p:.3f})")
+            if -throughput_change > max_regression and throughput_p < alpha:
+                problems.append(f"throughput {throughput_change:.1f}% (p={throughput_p:.3f})")
+
+            if problems:
+                regressions.append((label, problems))
+                print(f"   ❌ {label}: {', '.join(problems)}")
+            else:
+                print(f"   ✅ {label}: p95 {p95_change:+.1f}%, throughput {throughput_change:+.1f}%")
+
+        return regressions
+
+
+def _relative_change(before, after):
+    return (after - before) / before * 100 if before else 0.0
+
+
+# Value sets mirrored from backend/utils/constants.js and the mongoose schemas
+ETHNICITIES = ["Europea", "Asiática", "Latina", "Africana", "Mixta", "Árabe", "India"]
+CATEGORIES = ["Independiente", "Agencia"]
+SPANISH_CITIES = [
+    "Madrid", "Barcelona", "Valencia", "Sevilla", "Bilbao", "Málaga", "Zaragoza", "Murcia",
+    "Palma de Mallorca", "Las Palmas", "Córdoba", "Alicante", "Santander", "Granada",
+    "Valladolid", "Vitoria-Gasteiz", "A Coruña", "Pamplona", "Toledo", "Burgos"
+]
+SERVICES_SPANISH = [
+    "Experiencia de Novia", "Cenas", "Acompañante de Viaje", "Acompañante de Fiestas", "Masajes",
+    "Juegos de Rol", "Eventos de Negocios", "Acompañante Social", "Masaje Erótico", "Masaje Relajante"
+]
+FIRST_NAMES = [
+    "María", "Lucía", "Sofía", "Valentina", "Isabella", "Carmen", "Elena", "Paula", "Daniela", "Martina",
+    "Alba", "Julia", "Sara", "Claudia", "Irene", "Noa", "Carla", "Andrea", "Natalia", "Laura",
+    "Javier", "Carlos", "Miguel", "Alejandro", "David", "Pablo", "Sergio", "Jorge", "Manuel", "Antonio"
+]
+LAST_NAMES = [
+    "García", "Rodríguez", "González", "Fernández", "López", "Martínez", "Sánchez", "Pérez", "Gómez",
+    "Martín", "Jiménez", "Ruiz", "Hernández", "Díaz", "Moreno", "Muñoz", "Álvarez", "Romero", "Navarro", "Torres"
+]
+DESCRIPTION_PHRASES = [
+    "Acompañante profesional y discreta.", "Servicios de alta calidad.", "Trato cercano y elegante.",
+    "Disponible para cenas y eventos.", "Me encanta viajar y conocer gente nueva.",
+    "Ambiente relajado y privado.", "Hablo español e inglés.", "Ideal para ejecutivos exigentes."
+]
+MESSAGE_PHRASES = [
+    "Hola, me interesa conocer más sobre tus servicios.", "¿Estás disponible este fin de semana?",
+    "¿Cuál es tu tarifa para dos horas?", "Perfecto, nos vemos a las 20:00.", "Gracias por tu respuesta.",
+    "¿Podrías darme más información?", "Sí, estoy disponible el viernes.", "Te confirmo la reserva mañana."
+]
+DEFAULT_AVAILABILITY = {
+    day: {"start": "10:00", "end": "22:00", "available": day != "sunday"}
+    for day in ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+}
+
+# bcrypt hash of "password123", so every generated user can log in without hashing per user
+SEEDED_PASSWORD_HASH = "$2b$12$Fq8RjzVLZAUSWUZVabnAMOOXC0R3/z85C2kjzqZeDO4v8tR27Vlr2"
+MESSAGES_PER_THREAD = 6
+
+
+def read_backend_env(path="/app/backend/.env"):
+    """MONGO_URL and DB_NAME the Node backend connects with"""
+    env = {}
+    with open(path, "r") as f:
+        for line in f:
+            key, sep, value = line.strip().partition("=")
+            if sep:
+                env[key] = value.strip().strip('"')
+    return env
+
+
+class DataSeeder:
+    """Generates production-sized users, profiles, message threads and bookings.
+
+    Every document is derived from (seed, kind, index), so a given seed always
+    produces the same ids and content however the batches are split, with dates
+    relative to the day of the run; re-running skips documents that already
+    exist. Batches are built and written with unordered insert_many on a thread
+    pool, overlapping generation with I/O.
+    """
+
+    def __init__(self, mongo_url, db_name, seed=0, batch_size=1000, workers=4):
+        if pymongo is None:
+            raise RuntimeError("Data generation requires pymongo: pip install pymongo")
+        self.client = pymongo.MongoClient(mongo_url, maxPoolSize=workers)
+        self.db = self.client[db_name]
+        self.seed = seed
+        self.batch_size = batch_size
+        self.workers = workers
+        self.now = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def _rng(self, kind, index):
+        return random.Random(f"{self.seed}:{kind}:{index}")
+
+    def _object_id(self, kind, index):
+        return ObjectId(hashlib.blake2b(f"{self.seed}:{kind}:{index}".encode(), digest_size=12).digest())
+
+    def _created_at(self, kind, index, max_days=730):
+        seconds = self._rng(f"{kind}-created", index).randrange(max_days * 86400)
+        return self.now - timedelta(seconds=seconds)
+
+    def model_id(self, index):
+        return self._object_id("model", index)
+
+    def customer_id(self, index):
+        return self._object_id("customer", index)
+
+    def profile_id(self, index):
+        return self._object_id("profile", index)
+
+    def incall_rate(self, index):
+        return self._rng("rate", index).randrange(80, 401, 10)
+
+    def _user(self, kind, index):
+        rng = self._rng(kind, index)
+        created_at = self._created_at(kind, index)
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        ascii_name = f"{first}.{last}".lower().encode("ascii", "ignore").decode()
+        return {
+            "_id": self._object_id(kind, index),
+            "name": f"{first} {last}",
+            "email": f"{ascii_name}.{kind}{index}.s{self.seed}@seed.es",
+            "password": SEEDED_PASSWORD_HASH,
+            "phone": f"+34 6{rng.randrange(10, 100)} {rng.randrange(100, 1000)} {rng.randrange(100, 1000)}",
+            "age": rng.randint(18, 45) if kind == "model" else rng.randint(18, 70),
+            "userType": kind,
+            "isActive": rng.random() < 0.97,
+            "isVerified": rng.random() < 0.6,
+            "lastLogin": created_at + timedelta(days=rng.randrange(max((self.now - created_at).days, 1))),
+            "createdAt": created_at,
+            "updatedAt": created_at,
+            "__v": 0
+        }
+
+    def _profile(self, index):
+        rng = self._rng("profile", index)
+        user = self._user("model", index)
+        incall = self.incall_rate(index)
+        views = int(rng.paretovariate(1.2) * 50)
+        return {
+            "_id": self.profile_id(index),
+            "userId": user["_id"],
+            "name": user["name"],
+            "age": user["age"],
+            # Skew towards the big cities, like real listings
+            "location": rng.choices(SPANISH_CITIES, weights=range(len(SPANISH_CITIES), 0, -1))[0],
+            "description": " ".join(rng.sample(DESCRIPTION_PHRASES, rng.randint(2, 5))),
+            "images": [],
+            "services": rng.sample(SERVICES_SPANISH, rng.randint(1, 5)),
+            "ethnicity": rng.choice(ETHNICITIES),
+            "category": "Independiente" if rng.random() < 0.8 else "Agencia",
+            "rates": {"incall": f"€{incall}/h", "outcall": f"€{incall + rng.randrange(20, 101, 10)}/h"},
+            "availability": DEFAULT_AVAILABILITY,
+            "isVerified": user["isVerified"],
+            "isFeatured": rng.random() < 0.1,
+            "isOnline": rng.random() < 0.2,
+            "rating": {"average": round(rng.uniform(3.0, 5.0), 1), "count": rng.randrange(0, 200)},
+            "views": {"total": views, "thisWeek": views // 20, "thisMonth": views // 5},
+            "favorites": rng.randrange(0, 100),
+            "lastActive": user["lastLogin"],
+            "isActive": rng.random() < 0.95,
+            "createdAt": user["createdAt"],
+            "updatedAt": user["createdAt"],
+            "__v": 0
+        }
+
+    def _thread(self, index, profiles, customers):
+        """One customer/model conversation about a profile, oldest message first"""
+        rng = self._rng("thread", index)
+        profile = rng.randrange(profiles)
+        customer_id, model_id = self.customer_id(rng.randrange(customers)), self.model_id(profile)
+        sent_at = self.now - timedelta(seconds=rng.randrange(365 * 86400))
+        length = rng.randint(1, 2 * MESSAGES_PER_THREAD - 1)
+
+        messages = []
+        for position in range(length):
+            from_customer = position % 2 == 0
+            sent_at += timedelta(minutes=rng.randrange(1, 720))
+            messages.append({
+                "_id": self._object_id("message", index * 2 * MESSAGES_PER_THREAD + position),
+                "senderId": customer_id if from_customer else model_id,
+                "receiverId": model_id if from_customer else customer_id,
+                "profileId": self.profile_id(profile),
+                "content": rng.choice(MESSAGE_PHRASES),
+                "messageType": "text",
+                # Only the tail of a conversation is still unread
+                "isRead": position < length - 2 or rng.random() < 0.5,
+                "isDeleted": rng.random() < 0.01,
+                "attachments": [],
+                "createdAt": sent_at,
+                "updatedAt": sent_at,
+                "__v": 0
+            })
+        return messages
+
+    def _booking(self, index, profiles, customers):
+        rng = self._rng("booking", index)
+        profile = rng.randrange(profiles)
+        date = (self.now + timedelta(days=rng.randrange(-365, 60))).replace(hour=0, minute=0, second=0)
+        created_at = min(date - timedelta(days=rng.randrange(1, 30)), self.now)
+        duration = rng.randint(1, 4)
+        rate = self.incall_rate(profile)
+        if date < self.now:
+            status = rng.choices(["completed", "cancelled", "no-show"], weights=[80, 15, 5])[0]
+        else:
+            status = rng.choices(["pending", "confirmed", "cancelled"], weights=[40, 50, 10])[0]
+        return {
+            "_id": self._object_id("booking", index),
+            "customerId": self.customer_id(rng.randrange(customers)),
+            "modelId": self.model_id(profile),
+            "profileId": self.profile_id(profile),
+            "date": date,
+            "time": f"{rng.randrange(10, 24):02d}:00",
+            "duration": duration,
+            "serviceType": rng.choice(["incall", "outcall"]),
+            "services": rng.sample(SERVICES_SPANISH, rng.randint(1, 3)),
+            "location": {"city": rng.choice(SPANISH_CITIES), "notes": ""},
+            "pricing": {"hourlyRate": rate, "totalAmount": rate * duration, "currency": "EUR"},
+            "status": status,
+            "customerNotes": "",
+            "customerPhone": f"+34 6{rng.randrange(10, 100)} {rng.randrange(100, 1000)} {rng.randrange(100, 1000)}",
+            "paymentStatus": "paid" if status == "completed" else "pending",
+            "paymentMethod": rng.choice(["cash", "card", "transfer"]),
+            "confirmationCode": f"VV{index:08d}S{self.seed % 1000:03d}",
+            "createdAt": created_at,
+            "updatedAt": created_at,
+            "__v": 0
+        }
+
+    def _insert_batch(self, collection, documents):
+        try:
+            return len(self.db[collection].insert_many(documents, ordered=False).inserted_ids)
+        except pymongo.errors.BulkWriteError as e:
+            # Documents from an earlier run with the same seed already exist
+            duplicates = [error for error in e.details["writeErrors"] if error["code"] == 11000]
+            if len(duplicates) != len(e.details["writeErrors"]):
+                raise
+            return e.details["nInserted"]
+
+    def _populate(self, collection, total, build):
+        """Insert `total` generated items in parallel batches; build(index) returns a list of documents"""
+        start = time.perf_counter()
+        batches = range(0, total, self.batch_size)
+
+        def run_batch(first):
+            documents = []
+            for index in range(first, min(first + self.batch_size, total)):
+                documents.extend(build(index))
+            return self._insert_batch(collection, documents) if documents else 0
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            inserted = sum(pool.map(run_batch, batches))
+
+        elapsed = time.perf_counter() - start
+        print(f"   • {collection}: {inserted} inserted in {elapsed:.1f}s ({inserted / max(elapsed, 1e-9):.0f} docs/s)")
+        return inserted
+
+    def populate(self, profiles, customers, messages, bookings):
+        print(f"🌱 Generating data (seed {self.seed}, batches of {self.batch_size}, {self.workers} workers)...")
+        self._populate("users", profiles, lambda i: [self._user("model", i)])
+        self._populate("users", customers, lambda i: [self._user("customer", i)])
+        self._populate("profiles", profiles, lambda i: [self._profile(i)])
+        self._populate("messages", messages // MESSAGES_PER_THREAD, lambda i: self._thread(i, profiles, customers))
+        self._populate("bookings", bookings, lambda i: [self._booking(i, profiles, customers)])
+        self.client.close()
+
+
 if __name__ == "__main__":
-    tester = VivastreetBackendTester()
-    success = tester.run_all_tests()
+    parser = argparse.ArgumentParser(description="Vivastreet backend API tests")
+    parser.add_argument("--pool-size", type=int, default=DEFAULT_POOL_SIZE,
+                        help="keep-alive connections kept per host")
+    parser.add_argument("--http2", action="store_true",
+                        help="use the HTTP/2 transport (requires httpx[http2])")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="tests run concurrently once their dependencies finish (1 = sequential)")
+    
+    parser.add_argument("--json-report", metavar="PATH",
+                        help="write per-route latency histograms and percentiles as JSON")
+    
+    bench = parser.add_argument_group("benchmarks")
+    bench.add_argument("--bench", action="store_true", help="benchmark read endpoints after the tests")
+    bench.add_argument("--bench-rounds", type=int, default=5, help="samples per endpoint for the significance test")
+    bench.add_argument("--bench-iterations", type=int, default=20, help="requests per endpoint per round")
+    bench.add_argument("--save-baseline", metavar="NAME", help="save benchmark results as a named baseline")
+    bench.add_argument("--compare-baseline", metavar="NAME",
+                       help=f"fail with exit code {EXIT_PERFORMANCE_REGRESSION} on a significant regression against NAME")
+    bench.add_argument("--baseline-dir", default=".benchmarks", help="directory holding baselines")
+    bench.add_argument("--max-regression", type=float, default=15.0,
+                       help="allowed p95 increase / throughput drop, in percent")
+    bench.add_argument("--alpha", type=float, default=0.05, help="significance level for regressions")
+    
+    load = parser.add_argument_group("load mode")
+    load.add_argument("--load", action="store_true", help="run weighted user scenarios instead of the tests")
+    load.add_argument("--users", type=int, default=10,
+                      help="concurrent virtual users (one thread each if httpx is not installed)")
+    load.add_argument("--duration", type=float, help="seconds to run for (default 60 unless --requests is given)")
+    load.add_argument("--requests", type=int, help="stop after this many requests")
+    load.add_argument("--ramp-up", type=float, default=0.0, help="seconds to reach full load")
+    load.add_argument("--rate", type=float, help="target arrivals per second (open model)")
+    load.add_argument("--scenario", action="append", metavar="NAME=WEIGHT",
+                      help=f"override a scenario weight, 0 disables it ({', '.join(LOAD_SCENARIOS)})")
+    load.add_argument("--seed", type=int, help="random seed for scenario selection and generated data")
+    
+    data = parser.add_argument_group("scale-test data")
+    data.add_argument("--populate", type=int, metavar="PROFILES",
+                      help="bulk-insert this many model users and profiles, then exit")
+    data.add_argument("--customers", type=int, help="customer users to generate (default 2x profiles)")
+    data.add_argument("--messages", type=int, help="messages to generate, in threads (default 10x profiles)")
+    data.add_argument("--bookings", type=int, help="bookings to generate (default 3x profiles)")
+    data.add_argument("--batch-size", type=int, default=1000, help="documents per insert_many")
+    data.add_argument("--insert-workers", type=int, default=4, help="batches written in parallel")
+    args = parser.parse_args()
+    
+    if args.populate:
+        env = read_backend_env()
+        seeder = DataSeeder(
+            env["MONGO_URL"], env["DB_NAME"], seed=args.seed or 0,
+            batch_size=args.batch_size, workers=args.insert_workers
+        )
+        seeder.populate(
+            profiles=args.populate,
+            customers=args.customers or 2 * args.populate,
+            messages=args.messages if args.messages is not None else 10 * args.populate,
+            bookings=args.bookings if args.bookings is not None else 3 * args.populate
+        )
+        sys.exit(0)
+    
+    # Load mode keeps one pooled connection per virtual user, and drives them all from the
+    # httpx client's event loop rather than from SessionTransport's thread per connection
+    pool_size = max(args.pool_size, args.users) if args.load else args.pool_size
+    use_httpx = args.load and httpx is not None
+    if args.load and not use_httpx:
+        print(f"⚠️ httpx is not installed: load requests run on {pool_size} blocking threads")
+    duration = args.duration if args.duration is not None or args.requests else 60.0
+    # Checked before the tests run, rather than failing on a missing file after the benchmark
+    baseline_path = args.compare_baseline and os.path.join(args.baseline_dir, f"{args.compare_baseline}.json")
+    baseline = BenchmarkSuite.load_baseline(baseline_path) if baseline_path and not args.load else None
+    tester = VivastreetBackendTester(pool_size=pool_size, http2=args.http2, workers=args.workers, use_httpx=use_httpx)
+    regressions = []
+    try:
+        if args.load:
+            generator = LoadGenerator(
+                tester, users=args.users, duration=duration, max_requests=args.requests,
+                ramp_up=args.ramp_up, rate=args.rate, scenarios=parse_scenarios(args.scenario),
+                seed=args.seed
+            )
+            success = asyncio.run(generator.run())
+            if success:
+                generator.print_summary()
+        else:
+            success = tester.run_all_tests()
+            
+            if args.bench or args.save_baseline or args.compare_baseline:
+                suite = BenchmarkSuite(tester, rounds=args.bench_rounds, iterations=args.bench_iterations)
+                suite.run()
+                if baseline is not None:
+                    regressions = suite.compare(
+                        baseline, baseline_path, max_regression=args.max_regression, alpha=args.alpha
+                    )
+                if args.save_baseline:
+                    suite.save(os.path.join(args.baseline_dir, f"{args.save_baseline}.json"))
+        
+        if args.json_report:
+            tester.latency.export_json(args.json_report)
+    finally:
+        tester.transport.close()
     
     # Exit with appropriate code
-    sys.exit(0 if success else 1)
\ No newline at end of file
+    if not success:
+        sys.exit(EXIT_FUNCTIONAL_FAILURE)
+    if regressions:
+        print(f"\n❌ PERFORMANCE REGRESSIONS: {len(regressions)}")
+        sys.exit(EXIT_PERFORMANCE_REGRESSION)
+    sys.exit(0)
\ No newline at end of file
@@ -0,0 +1,57 @@
+import itertools
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Settings are read when the service modules are imported, so they are fixed here first
+os.environ["STORAGE_ENGINE"] = "memory"
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="vivastreet-uploads-"))
+os.environ.setdefault("PASSWORD_HASH_ROUNDS", "4")
+
+from launcher import load_server  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    """The service module, with a fresh in-memory storage backend and layers over it"""
+    module = load_server()
+    module.configure_storage("memory")
+    return module
+
+
+@pytest.fixture
+def client(server):
+    from fastapi.testclient import TestClient
+
+    with TestClient(server.app) as client:
+        yield client
+
+
+@pytest.fixture
+def register(client, server):
+    """Signs up users through the API: their public fields, Authorization headers and, for models, profile id"""
+    count = itertools.count()
+
+    def register(user_type="customer"):
+        index = next(count)
+        response = client.post("/api/auth/register", json={
+            "name": f"User {index}", "email": f"user{index}@example.com", "password": "secreto1",
+            "phone": "600000000", "age": 30, "userType": user_type,
+        })
+        assert response.status_code == 201
+        data = response.json()["data"]
+        user = {**data["user"], "headers": {"Authorization": f"Bearer {data['token']}"}, "token": data["token"]}
+        if user_type == "model":
+            user["profileId"] = next(
+                str(profile["_id"]) for profile in server.storage.profiles.profiles.values()
+                if str(profile["userId"]) == user["_id"]
+            )
+        return user
+
+    return register
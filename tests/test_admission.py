@@ -0,0 +1,148 @@
+import asyncio
+from collections import defaultdict
+
+import pytest
+
+from admission import AdaptiveLimiter, AdmissionMiddleware, Overloaded, admission_class
+
+
+def test_fast_completions_grow_the_limit_while_it_is_in_use():
+    async def main():
+        limiter = AdaptiveLimiter(4, min_limit=2, max_limit=5, target=1)
+        for _ in range(4):
+            await limiter.acquire()
+        limits = []
+        for _ in range(2):
+            limiter.release(0.01, False)
+            limits.append(limiter.limit)
+        # Only one of four slots busy: no evidence the limit is what holds requests back
+        limiter.release(0.01, False)
+        limits.append(limiter.limit)
+        for _ in range(40):
+            await limiter.acquire()
+            await limiter.acquire()
+            await limiter.acquire()
+            limiter.release(0.01, False)
+            limiter.release(0.01, False)
+            limiter.release(0.01, False)
+        return limits, limiter.limit
+
+    limits, final = asyncio.run(main())
+    assert limits == [4.25, 4.25 + 1 / 4.25, 4.25 + 1 / 4.25]
+    assert final == 5
+
+
+def test_slow_or_failed_completions_cut_the_limit_once_per_target():
+    async def main():
+        limiter = AdaptiveLimiter(10, min_limit=8, max_limit=20, target=0.05)
+        for _ in range(4):
+            await limiter.acquire()
+        limiter.release(0.06, False)
+        limiter.release(0.01, True)
+        cut = limiter.limit
+        await asyncio.sleep(0.06)
+        limiter.release(0.01, True)
+        await asyncio.sleep(0.06)
+        limiter.release(0.07, False)
+        return cut, limiter.limit
+
+    assert asyncio.run(main()) == (9.0, 8)
+
+
+def test_requests_over_the_limit_queue_then_shed():
+    async def main():
+        limiter = AdaptiveLimiter(1, min_limit=1, max_limit=1, target=1, max_queue=2, max_wait=0.05)
+        await limiter.acquire()
+        first = asyncio.create_task(limiter.acquire())
+        second = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            await limiter.acquire()
+        limiter.release(0.01, False)
+        await first
+        with pytest.raises(Overloaded):
+            await second
+        return dict(limiter.shed), limiter.in_flight, len(limiter.waiters)
+
+    assert asyncio.run(main()) == ({"queue_full": 1, "timeout": 1}, 1, 0)
+
+
+def test_cancelled_waiter_passes_its_slot_on():
+    async def main():
+        limiter = AdaptiveLimiter(1, min_limit=1, max_limit=1, target=1)
+        await limiter.acquire()
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        limiter.release(0.01, False)
+        return limiter.in_flight, len(limiter.waiters)
+
+    assert asyncio.run(main()) == (0, 0)
+
+
+def test_route_classes():
+    assert admission_class("GET", "/api/health") is None
+    assert admission_class("GET", "/api/messages/events") is None
+    assert admission_class("GET", "/api/profiles") == "list"
+    assert admission_class("GET", "/api/profiles/{profile_id}") == "read"
+    assert admission_class("POST", "/api/messages") == "write"
+    assert admission_class("POST", "/api/auth/login") == "auth"
+    assert admission_class("POST", "/api/auth/register") == "auth"
+    assert admission_class("POST", "/api/profiles/{profile_id}/images") is None
+
+
+def test_latency_is_measured_to_the_response_start(monkeypatch):
+    monkeypatch.setattr("admission.route_template", lambda scope: scope["path"])
+    released = []
+
+    class RecordingLimiter(AdaptiveLimiter):
+        def release(self, latency, failed):
+            released.append((round(latency, 1), failed))
+            super().release(latency, failed)
+
+    async def streaming(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await asyncio.sleep(0.2)
+        await send({"type": "http.response.body", "body": b""})
+
+    async def failing(scope, receive, send):
+        await asyncio.sleep(0.1)
+        raise RuntimeError("boom")
+
+    async def main():
+        limiter = RecordingLimiter(4, min_limit=2, max_limit=8, target=0.1)
+        for app in (streaming, failing):
+            middleware = AdmissionMiddleware(app, {"read": limiter})
+            sent = []
+
+            async def send(message):
+                sent.append(message)
+
+            try:
+                await middleware({"type": "http", "method": "GET", "path": "/api/status/x"}, None, send)
+            except RuntimeError:
+                pass
+        return limiter.limit, limiter.in_flight
+
+    assert asyncio.run(main()) == (4 * 0.9, 0)
+    assert released == [(0.0, False), (0.1, True)]
+
+
+def test_overloaded_class_is_shed_with_retry_after(client, server, monkeypatch):
+    # The limiters live as long as the module, so the overload is undone after the test
+    limiter = server.admission_limiters["list"]
+    monkeypatch.setattr(limiter, "in_flight", int(limiter.limit))
+    monkeypatch.setattr(limiter, "max_queue", 0)
+    monkeypatch.setattr(limiter, "shed", defaultdict(int))
+    response = client.get("/api/status", headers={"Origin": "http://localhost:3000"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert response.headers["access-control-allow-origin"] == "*"
+    assert response.json() == {"detail": "Servidor ocupado, inténtalo de nuevo"}
+
+    # Other classes and the probes still answer
+    assert client.get("/api/").status_code == 200
+    assert client.post("/api/auth/login", json={"email": "nadie@example.com", "password": "x"}).status_code == 401
+    assert client.get("/api/health").status_code == 200
+    assert 'admission_shed_total{class="list",reason="queue_full"} 1' in client.get("/api/metrics").text
@@ -0,0 +1,63 @@
+import asyncio
+
+import bcrypt
+import pytest
+
+import auth
+from auth import DUMMY_PASSWORD_HASH, PasswordHasher
+
+USER = {
+    "name": "Ana", "email": "ana@example.com", "password": "secreto1", "phone": "600000000", "age": 30,
+    "userType": "customer",
+}
+
+
+@pytest.fixture
+def checked(monkeypatch):
+    """The hashes bcrypt.checkpw is asked to check"""
+    hashes = []
+    checkpw = bcrypt.checkpw
+
+    def recording_checkpw(password, hashed):
+        hashes.append(hashed)
+        return checkpw(password, hashed)
+
+    monkeypatch.setattr(auth.bcrypt, "checkpw", recording_checkpw)
+    return hashes
+
+
+def test_dummy_hash_costs_as_much_as_a_stored_one():
+    assert DUMMY_PASSWORD_HASH.startswith("$2a$12$")
+    assert bcrypt.checkpw(b"", DUMMY_PASSWORD_HASH.encode()) is False
+
+
+def test_verify_without_a_hash_still_runs_bcrypt(checked):
+    hasher = PasswordHasher(workers=1, rounds=4)
+
+    async def main():
+        hashed = await hasher.hash("secreto1")
+        return hashed, [
+            await hasher.verify("secreto1", None), await hasher.verify("secreto1", ""),
+            await hasher.verify("secreto1", hashed), await hasher.verify("otro", hashed),
+        ]
+
+    try:
+        hashed, results = asyncio.run(main())
+    finally:
+        hasher.close()
+    assert results == [False, False, True, False]
+    assert checked == [DUMMY_PASSWORD_HASH.encode()] * 2 + [hashed.encode()] * 2
+
+
+def test_login_with_an_unknown_email_checks_a_hash_too(client, checked):
+    assert client.post("/api/auth/register", json=USER).status_code == 201
+    checked.clear()
+
+    assert client.post("/api/auth/login", json={"email": "nadie@example.com", "password": "secreto1"}).status_code == 401
+    assert checked == [DUMMY_PASSWORD_HASH.encode()]
+
+    assert client.post("/api/auth/login", json={"email": USER["email"], "password": "otro"}).status_code == 401
+    response = client.post("/api/auth/login", json={"email": USER["email"], "password": USER["password"]})
+    assert response.status_code == 200
+    assert response.json()["data"]["user"]["email"] == USER["email"]
+    assert len(checked) == 3 and checked[1] == checked[2] != checked[0]
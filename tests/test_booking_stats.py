@@ -0,0 +1,76 @@
+import asyncio
+from datetime import datetime, timedelta
+
+
+def book(client, customer, model, hour, amount):
+    # Next week's Monday: a future day the default availability keeps open
+    today = datetime.utcnow().date()
+    day = today + timedelta(days=7 - today.weekday())
+    response = client.post("/api/bookings", headers=customer["headers"], json={
+        "modelId": model["_id"], "profileId": model["profileId"], "date": f"{day.isoformat()}T12:00:00.000Z",
+        "time": f"{hour}:00", "duration": 1, "serviceType": "incall", "services": ["Cena"],
+        "customerPhone": "600000000", "pricing": {"hourlyRate": amount, "totalAmount": amount},
+    })
+    assert response.status_code == 201, response.text
+    return response.json()["data"]["booking"]["_id"]
+
+
+def set_status(client, user, booking_id, status):
+    response = client.patch(f"/api/bookings/{booking_id}/status", headers=user["headers"], json={"status": status})
+    assert response.status_code == 200, response.text
+
+
+def stats(client, user, **params):
+    response = client.get("/api/bookings/stats/overview", headers=user["headers"], params=params)
+    assert response.status_code == 200
+    return response.json()["data"]
+
+
+def test_rollups_follow_creates_and_status_changes(client, register):
+    model, ana, bea = register("model"), register(), register()
+    first = book(client, ana, model, 10, 150)
+    second = book(client, ana, model, 12, 200)
+    third = book(client, bea, model, 14, 99.99)
+
+    assert stats(client, model) == {
+        "stats": {"total": 3, "pending": 3, "confirmed": 0, "completed": 0, "cancelled": 0},
+        "revenue": {"total": 449.99, "pending": 449.99},
+    }
+    assert stats(client, ana)["stats"]["pending"] == 2
+
+    set_status(client, model, first, "confirmed")
+    set_status(client, model, first, "completed")
+    set_status(client, ana, second, "cancelled")
+    # A change to the status the booking already has moves no counter
+    set_status(client, model, third, "confirmed")
+    set_status(client, model, third, "confirmed")
+
+    assert stats(client, model) == {
+        "stats": {"total": 3, "pending": 0, "confirmed": 1, "completed": 1, "cancelled": 1},
+        "revenue": {"total": 449.99, "confirmed": 99.99, "completed": 150.0, "cancelled": 200.0},
+    }
+    assert stats(client, ana)["stats"] == {"total": 2, "pending": 0, "confirmed": 0, "completed": 1, "cancelled": 1}
+    assert stats(client, bea)["stats"] == {"total": 1, "pending": 0, "confirmed": 1, "completed": 0, "cancelled": 0}
+
+
+def test_stats_are_filtered_by_day_of_creation(client, register):
+    model, ana = register("model"), register()
+    book(client, ana, model, 10, 150)
+    today = datetime.utcnow().date()
+    tomorrow = (today + timedelta(days=1)).isoformat()
+    assert stats(client, model, **{"from": today.isoformat(), "to": tomorrow})["stats"]["total"] == 1
+    assert stats(client, model, **{"from": tomorrow})["stats"]["total"] == 0
+    assert stats(client, model, to=today.isoformat())["stats"]["total"] == 0
+
+
+def test_rebuild_reproduces_the_maintained_rollups(client, server, register):
+    model, ana, bea = register("model"), register(), register()
+    set_status(client, model, book(client, ana, model, 10, 150), "confirmed")
+    set_status(client, bea, book(client, bea, model, 12, 80), "cancelled")
+    book(client, ana, model, 16, 120)
+    maintained = [stats(client, user) for user in (model, ana, bea)]
+
+    storage = server.storage
+    storage.booking_rollups.buckets.clear()
+    asyncio.run(storage.booking_rollups.rebuild(storage.bookings.rollups()))
+    assert [stats(client, user) for user in (model, ana, bea)] == maintained
@@ -0,0 +1,206 @@
+import asyncio
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from bookings import (
+    BookingSlots, IntervalTree, SlotTaken, SlotUnavailable, WEEKDAYS, availability_windows, parse_time_of_day, to_utc,
+)
+from storage.memory import MemoryBookingRepository
+
+START = datetime(2024, 1, 8)  # a Monday; Europe/Madrid is UTC+1 all of January
+CLOSED = {day: {"available": False} for day in WEEKDAYS}
+
+
+def hours(first, last):
+    return START + timedelta(hours=first), START + timedelta(hours=last)
+
+
+def test_adjacent_intervals_do_not_overlap():
+    tree = IntervalTree()
+    tree.add(*hours(10, 11), "a")
+    tree.add(*hours(12, 13), "b")
+    assert not tree.overlaps(*hours(11, 12))
+    assert tree.overlapping(*hours(11, 12)) == []
+    assert tree.overlaps(*hours(10.5, 12))
+    assert [key for _, _, key in tree.overlapping(*hours(10.5, 12.5))] == ["a", "b"]
+    assert not tree.overlaps(*hours(9, 10))
+    assert not tree.overlaps(*hours(13, 14))
+
+
+def test_interval_tree_against_brute_force():
+    rng = random.Random(20)
+    tree, intervals = IntervalTree(), {}
+    for key in range(2000):
+        if intervals and rng.random() < 0.3:
+            removed = rng.choice(list(intervals))
+            assert tree.remove(intervals.pop(removed)[0], removed)
+        else:
+            start = rng.randint(0, 500)
+            intervals[key] = hours(start, start + rng.randint(1, 12))
+            tree.add(*intervals[key], key)
+        low = rng.randint(0, 520)
+        query = hours(low, low + rng.randint(1, 10))
+        expected = [
+            (start, end, key) for key, (start, end) in sorted(intervals.items(), key=lambda item: (item[1][0], item[0]))
+            if start < query[1] and end > query[0]
+        ]
+        assert tree.overlapping(*query) == expected
+        assert tree.overlaps(*query) == bool(expected)
+    assert len(tree) == len(intervals)
+    assert not tree.remove(START, -1)
+
+
+@pytest.mark.parametrize("value,offset", [
+    ("20:00", timedelta(hours=20)), ("9.30", timedelta(hours=9, minutes=30)), ("21h", timedelta(hours=21)),
+    ("7h15", timedelta(hours=7, minutes=15)), ("24:00", timedelta(days=1)), ("25:00", None), ("10:75", None),
+    ("mañana", None), (None, None),
+])
+def test_parse_time_of_day(value, offset):
+    assert parse_time_of_day(value) == offset
+
+
+def test_missing_hours_default_to_all_day_except_sunday():
+    # Saturday to Monday: Friday and Saturday merge into one window, Sunday is closed
+    windows = availability_windows({}, date(2024, 1, 6), date(2024, 1, 8))
+    assert windows == [
+        (datetime(2024, 1, 4, 23), datetime(2024, 1, 6, 23)),
+        (datetime(2024, 1, 7, 23), datetime(2024, 1, 8, 23)),
+    ]
+    opened = availability_windows({"availability": {"sunday": {"available": True}}}, date(2024, 1, 7), date(2024, 1, 7))
+    assert opened == [(datetime(2024, 1, 5, 23), datetime(2024, 1, 7, 23))]
+
+
+def test_windows_past_midnight_reach_into_the_next_day():
+    profile = {"availability": {**CLOSED, "friday": {"available": True, "start": "22:00", "end": "03:00"}}}
+    friday_night = (datetime(2024, 1, 5, 21), datetime(2024, 1, 6, 2))
+    # Asked about Saturday only, Friday's window still holds its early hours
+    assert availability_windows(profile, date(2024, 1, 6), date(2024, 1, 6)) == [friday_night]
+    assert availability_windows(profile, date(2024, 1, 5), date(2024, 1, 5)) == [friday_night]
+    assert availability_windows(profile, date(2024, 1, 7), date(2024, 1, 11)) == []
+
+    until_midnight = {"availability": {**CLOSED, "friday": {"available": True, "start": "18:00", "end": "24:00"}}}
+    assert availability_windows(until_midnight, date(2024, 1, 5), date(2024, 1, 5)) == [
+        (datetime(2024, 1, 5, 17), datetime(2024, 1, 5, 23))
+    ]
+
+
+def booking(profile_id, first, last):
+    starts_at, ends_at = hours(first, last)
+    return {
+        "_id": ObjectId(), "profileId": profile_id, "date": START, "time": None, "duration": last - first,
+        "startsAt": starts_at, "endsAt": ends_at, "status": "pending",
+    }
+
+
+class YieldingBookings(MemoryBookingRepository):
+    """Gives way to other tasks on every call, as a real database round trip would"""
+
+    async def insert(self, booking):
+        await asyncio.sleep(0)
+        await super().insert(booking)
+
+    async def holding(self, profile_id, since, until=None):
+        await asyncio.sleep(0)
+        return await super().holding(profile_id, since, until)
+
+
+WINDOWS = [hours(0, 24)]
+
+
+def test_reserve_checks_windows_and_overlaps():
+    async def main():
+        bookings = MemoryBookingRepository()
+        slots = BookingSlots(bookings)
+        profile_id = ObjectId()
+        await slots.reserve(booking(profile_id, 10, 11), WINDOWS)
+        # Back to back with an existing booking is fine
+        await slots.reserve(booking(profile_id, 11, 12), WINDOWS)
+        with pytest.raises(SlotTaken):
+            await slots.reserve(booking(profile_id, 11.5, 13), WINDOWS)
+        with pytest.raises(SlotUnavailable):
+            await slots.reserve(booking(profile_id, 9, 10), [hours(9.5, 12)])
+        await slots.reserve(booking(ObjectId(), 10, 11), WINDOWS)
+        return len(bookings.bookings)
+
+    assert asyncio.run(main()) == 3
+
+
+def test_concurrent_reservations_on_one_worker():
+    async def main():
+        bookings = YieldingBookings()
+        slots = BookingSlots(bookings)
+        profile_id = ObjectId()
+        results = await asyncio.gather(
+            *(slots.reserve(booking(profile_id, 10, 12), WINDOWS) for _ in range(5)), return_exceptions=True
+        )
+        return results, list(bookings.bookings.values())
+
+    results, stored = asyncio.run(main())
+    assert results.count(None) == 1
+    assert all(isinstance(result, SlotTaken) for result in results if result is not None)
+    assert len(stored) == 1
+
+
+def test_concurrent_reservations_across_workers_are_never_both_accepted():
+    async def main():
+        bookings = YieldingBookings()
+        profile_id = ObjectId()
+        workers = [BookingSlots(bookings), BookingSlots(bookings)]
+        # Both trees are loaded while the slot is still free
+        for worker in workers:
+            await worker.free_slots(profile_id, WINDOWS, timedelta(hours=1))
+        first, second = booking(profile_id, 10, 12), booking(profile_id, 11, 13)
+        results = await asyncio.gather(
+            workers[0].reserve(first, WINDOWS), workers[1].reserve(second, WINDOWS), return_exceptions=True
+        )
+        stored = list(bookings.bookings)
+        # A worker that backed out reloads its tree, so the slot is judged by what was stored
+        retried = await asyncio.gather(
+            workers[0].reserve(booking(profile_id, 10, 12), WINDOWS),
+            workers[1].reserve(booking(profile_id, 11, 13), WINDOWS),
+            return_exceptions=True,
+        )
+        return results, stored, retried, list(bookings.bookings)
+
+    results, stored, retried, final = asyncio.run(main())
+    assert all(result is None or isinstance(result, SlotTaken) for result in results + retried)
+    assert len(stored) == results.count(None) <= 1
+    # Both retries overlap whatever was kept, and are refused once the trees are reloaded
+    assert retried.count(None) == 0 or not stored
+    assert len(final) == len(stored) + retried.count(None) <= 1
+
+
+def test_release_and_hold_keep_the_tree_current():
+    async def main():
+        slots = BookingSlots(MemoryBookingRepository())
+        profile_id = ObjectId()
+        held = booking(profile_id, 10, 12)
+        await slots.reserve(held, WINDOWS)
+        free = await slots.free_slots(profile_id, [hours(8, 16)], timedelta(hours=2))
+        slots.release(held)
+        released = await slots.free_slots(profile_id, [hours(8, 16)], timedelta(hours=2))
+        slots.hold(held)
+        return free, released, await slots.free_slots(profile_id, [hours(8, 16)], timedelta(hours=2))
+
+    free, released, held = asyncio.run(main())
+    assert free == held == [hours(8, 10), hours(12, 16)]
+    assert released == [hours(8, 16)]
+
+
+def test_free_slots_drop_short_gaps():
+    async def main():
+        slots = BookingSlots(MemoryBookingRepository())
+        profile_id = ObjectId()
+        for first, last in ((9, 10), (11, 12), (12, 13), (14.5, 16)):
+            await slots.reserve(booking(profile_id, first, last), WINDOWS)
+        return await slots.free_slots(profile_id, [hours(8, 17), hours(20, 21)], timedelta(hours=1))
+
+    assert asyncio.run(main()) == [hours(8, 9), hours(10, 11), hours(13, 14.5), hours(16, 17), hours(20, 21)]
+
+
+def test_to_utc_follows_daylight_saving():
+    assert to_utc(datetime(2024, 1, 8, 12)) == datetime(2024, 1, 8, 11)
+    assert to_utc(datetime(2024, 7, 8, 12)) == datetime(2024, 7, 8, 10)
@@ -0,0 +1,86 @@
+import asyncio
+
+from cache import ResponseCache
+from storage.memory import MemoryGenerationRepository
+
+
+class SlowGenerations(MemoryGenerationRepository):
+    """Holds every bump until released, counting the round trips"""
+
+    def __init__(self):
+        super().__init__()
+        self.bumps = 0
+        self.release = asyncio.Event()
+        self.failures = 0
+
+    async def bump(self, namespace):
+        self.bumps += 1
+        await self.release.wait()
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("down")
+        return await super().bump(namespace)
+
+
+def build(body):
+    async def build():
+        return body, {}
+    return build
+
+
+def test_invalidate_drops_local_entries_without_waiting_for_the_bump():
+    async def main():
+        generations = SlowGenerations()
+        cache = ResponseCache(generations)
+        await cache.fetch("status_checks", "all", build(b"old"))
+        cache.invalidate("status_checks")
+        served = (await cache.fetch("status_checks", "all", build(b"new"))).body
+        generations.release.set()
+        await cache.close()
+        return served, generations.generations
+
+    assert asyncio.run(main()) == (b"new", {"status_checks": 1})
+
+
+def test_writes_during_a_bump_share_one_follow_up_bump():
+    async def main():
+        generations = SlowGenerations()
+        cache = ResponseCache(generations)
+        for _ in range(100):
+            cache.invalidate("status_checks")
+            await asyncio.sleep(0)
+        cache.invalidate("root")
+        generations.release.set()
+        await cache.close()
+        return generations.bumps, generations.generations
+
+    assert asyncio.run(main()) == (3, {"status_checks": 2, "root": 1})
+
+
+def test_failed_bumps_are_retried_on_close():
+    async def main():
+        generations = SlowGenerations()
+        generations.failures = 1
+        generations.release.set()
+        cache = ResponseCache(generations)
+        cache.invalidate("status_checks")
+        await asyncio.sleep(0.01)
+        failed = generations.generations.get("status_checks", 0)
+        await cache.close()
+        return failed, generations.generations["status_checks"]
+
+    assert asyncio.run(main()) == (0, 1)
+
+
+def test_other_workers_see_the_published_generation():
+    async def main():
+        generations = SlowGenerations()
+        generations.release.set()
+        writer = ResponseCache(generations, sync_interval=0)
+        reader = ResponseCache(generations, sync_interval=0)
+        await reader.fetch("status_checks", "all", build(b"old"))
+        writer.invalidate("status_checks")
+        await writer.close()
+        return (await reader.fetch("status_checks", "all", build(b"new"))).body
+
+    assert asyncio.run(main()) == b"new"
@@ -0,0 +1,222 @@
+import asyncio
+import multiprocessing
+import random
+import struct
+
+import pytest
+from bson import ObjectId
+
+from counters import CountersFull, LocalCounters, SharedCounters
+from storage import MemoryStorage, ViewCounter
+
+
+@pytest.fixture
+def shared():
+    counters = SharedCounters.create(64, 6)
+    yield counters
+    counters.close()
+    counters.memory.unlink()
+
+
+def attach(counters, stripe):
+    return SharedCounters.attach(counters.memory.name, stripe)
+
+
+def test_shared_table_matches_local_counters(shared):
+    # Few keys and a small table, so probe runs wrap around and deletions shift them back
+    rng = random.Random(25)
+    local = LocalCounters()
+    keys = [f"key-{i}".encode() for i in range(50)]
+    for _ in range(5000):
+        key = rng.choice(keys)
+        if rng.random() < 0.05:
+            assert shared.take(key) == local.take(key)
+        elif rng.random() < 0.2:
+            other = rng.choice(keys)
+            try:
+                moved = shared.move(key, other)
+            except CountersFull:
+                continue
+            assert moved == local.move(key, other)
+        else:
+            delta = rng.choice([-2, -1, 1, 1, 3])
+            try:
+                value = shared.add(key, delta)
+            except CountersFull:
+                assert key not in local.values
+                continue
+            assert value == local.add(key, delta)
+        assert len(shared) == len(local)
+    assert sorted(shared.items()) == sorted(local.items())
+    for key in keys:
+        assert shared.get(key) == local.get(key)
+
+
+def test_counters_at_zero_are_deleted(shared):
+    shared.add(b"a", 2)
+    shared.add(b"a", -2)
+    assert len(shared) == 0
+    assert shared.items() == []
+    assert shared.add(b"b", 0) == 0
+    assert len(shared) == 0
+
+
+def test_full_table_refuses_new_keys_only(shared):
+    added = 0
+    with pytest.raises(CountersFull):
+        while True:
+            shared.add(b"key-%d" % added, 1)
+            added += 1
+    assert added == int(shared.capacity * SharedCounters.MAX_LOAD)
+    assert shared.add(b"key-0", 1) == 2
+    shared.add(b"key-0", -2)
+    assert shared.add(b"key-new", 1) == 1
+    with pytest.raises(ValueError):
+        shared.add(b"x" * (SharedCounters.KEY_SIZE + 1), 1)
+
+
+def test_prefixes_select_items(shared):
+    shared.add(b"views:a", 1)
+    shared.add(b"views:b", 2)
+    shared.add(b"requests:a", 3)
+    assert sorted(shared.items(b"views:")) == [(b"views:a", 1), (b"views:b", 2)]
+
+
+def test_stripes_are_written_apart_and_summed_on_read(shared):
+    first, second = attach(shared, 1), attach(shared, 2)
+    first.add(b"a", 2)
+    second.add(b"a", 3)
+    second.add(b"b", 1)
+    assert shared.get(b"a") == first.get(b"a") == 5
+    assert sorted(shared.items()) == [(b"a", 5), (b"b", 1)]
+    assert first.own_items() == [(b"a", 2)]
+    assert (first.take(b"a"), first.move(b"b", b"c")) == (2, 0)
+    assert sorted(second.items()) == [(b"a", 3), (b"b", 1)]
+    # Counts that cancel out over the stripes are left out
+    first.add(b"b", -1)
+    assert shared.items() == [(b"a", 3)]
+
+
+def test_recovered_stripe_is_readable_again(shared):
+    attach(shared, 1).add(b"a", 1)
+    # A writer killed halfway through a change leaves its sequence odd
+    struct.pack_into("<Q", shared.memory.buf, shared._header_offset(1), 7)
+    shared.recover(1)
+    assert shared.get(b"a") == 1
+    shared.recover(1)
+    assert struct.unpack_from("<Q", shared.memory.buf, shared._header_offset(1)) == (8,)
+
+
+def _count(name, stripe, keys, times):
+    counters = SharedCounters.attach(name, stripe)
+    for _ in range(times):
+        for key in keys:
+            counters.add(key, 1)
+    counters.close()
+
+
+def _read(name, keys, times, totals):
+    counters = SharedCounters.attach(name, 0)
+    last = 0
+    for _ in range(times):
+        total = sum(counters.get(key) for key in keys)
+        # Every add is seen whole and none goes missing, however the stripes shift meanwhile
+        if total < last:
+            raise AssertionError(f"{total} after {last}")
+        last = total
+    totals.put(last)
+    counters.close()
+
+
+def test_processes_share_one_table(shared):
+    keys = [b"shared", b"other"] + [b"key-%d" % i for i in range(20)]
+    context = multiprocessing.get_context("fork")
+    totals = context.Queue()
+    processes = [
+        context.Process(target=_count, args=(shared.memory.name, stripe, keys, 200)) for stripe in range(1, 5)
+    ] + [context.Process(target=_read, args=(shared.memory.name, keys, 500, totals))]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+    assert [process.exitcode for process in processes] == [0] * 5
+    assert totals.get(timeout=1) <= 4 * 200 * len(keys)
+    assert attach(shared, 5).get(b"shared") == shared.get(b"other") == 800
+    assert len(shared.items()) == len(keys)
+
+
+def test_views_are_pending_on_every_worker_and_flushed_once(shared):
+    storage = MemoryStorage()
+
+    async def main():
+        profile = await storage.profiles.save({"_id": ObjectId(), "name": "Ana", "views": {"total": 10}})
+        workers = [ViewCounter(storage.profiles, counters=attach(shared, stripe)) for stripe in (1, 2)]
+        for worker in (0, 1, 1, 0, 1):
+            workers[worker].record(profile["_id"])
+        pending = [worker.pending_views(profile["_id"]) for worker in workers]
+        flushed = await asyncio.gather(workers[0].flush(), workers[1].flush())
+        stored = (await storage.profiles.find_many([profile["_id"]], {"views": 1}))[profile["_id"]]
+        return pending, flushed, stored["views"]["total"], [worker.pending_total() for worker in workers]
+
+    pending, flushed, total, left = asyncio.run(main())
+    assert pending == [5, 5]
+    # Each worker writes the views it counted
+    assert flushed == [1, 1]
+    assert total == 15
+    assert left == [0, 0]
+
+
+def test_views_being_written_stay_pending_and_return_on_failure(shared):
+    class SlowProfiles:
+        def __init__(self):
+            self.started = asyncio.Event()
+            self.result = asyncio.get_running_loop().create_future()
+
+        async def add_views(self, views):
+            self.started.set()
+            await self.result
+
+    async def main():
+        profiles = SlowProfiles()
+        counter = ViewCounter(profiles, counters=shared)
+        profile_id = ObjectId()
+        for _ in range(3):
+            counter.record(profile_id)
+        flush = asyncio.create_task(counter.flush())
+        await profiles.started.wait()
+        during = counter.pending_views(profile_id), len(shared.items(ViewCounter.PENDING))
+        profiles.result.set_exception(RuntimeError("down"))
+        await flush
+        return during, counter.pending_views(profile_id), shared.items(ViewCounter.FLUSHING), counter.flushed
+
+    (during, pending_keys), after, flushing, flushed = asyncio.run(main())
+    assert (during, pending_keys) == (3, 0)
+    assert (after, flushing, flushed) == (3, [], 0)
+
+
+def test_views_beyond_a_full_table_are_still_written():
+    counters = SharedCounters.create(4, 1)
+    storage = MemoryStorage()
+
+    async def main():
+        ids = [(await storage.profiles.save({"_id": ObjectId(), "name": f"p{i}"}))["_id"] for i in range(6)]
+        counter = ViewCounter(storage.profiles, counters=counters)
+        for profile_id in ids:
+            counter.record(profile_id)
+        pending = [counter.pending_views(profile_id) for profile_id in ids]
+        await counter.flush()
+        found = await storage.profiles.find_many(ids, {"views": 1})
+        return pending, [found[profile_id]["views"]["total"] for profile_id in ids], counter.pending_total()
+
+    try:
+        assert asyncio.run(main()) == ([1] * 6, [1] * 6, 0)
+    finally:
+        counters.close()
+        counters.memory.unlink()
+
+
+def test_profile_views_include_unflushed_views(client, server):
+    profile = asyncio.run(server.storage.profiles.save({"_id": ObjectId(), "name": "Ana", "views": {"total": 10}}))
+    path = f"/api/profiles/{profile['_id']}"
+    assert [client.get(path).json()["data"]["profile"]["views"] for _ in range(3)] == [11, 12, 13]
+    assert server.view_counter.pending_views(profile["_id"]) == 3
@@ -0,0 +1,61 @@
+import json
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+import pytest
+from bson import ObjectId
+from pydantic import TypeAdapter
+
+import encoding
+from encoding import encode_json
+
+ROWS = [
+    {"id": "a", "client_name": "plain", "timestamp": datetime(2026, 1, 2, 3, 4, 5)},
+    {"id": "b", "client_name": "millis", "timestamp": datetime(2026, 1, 2, 3, 4, 5, 120000)},
+    {"id": "c", "client_name": "ñandú \"quoted\"  ", "timestamp": datetime(2026, 12, 31, 23, 59, 59, 999999)},
+]
+
+
+@pytest.fixture(params=["orjson", "json"])
+def backend(request, monkeypatch):
+    """Runs a test with orjson and again with the stdlib fallback"""
+    if request.param == "json":
+        monkeypatch.setattr(encoding, "orjson", None)
+    elif encoding.orjson is None:
+        pytest.skip("orjson is not installed")
+    return request.param
+
+
+def test_rows_encode_like_the_pydantic_response_model(backend, server):
+    expected = TypeAdapter(List[server.StatusCheck]).dump_json([server.StatusCheck(**row) for row in ROWS])
+    assert json.loads(encode_json(ROWS)) == json.loads(expected)
+
+
+def test_datetimes_encode_like_to_iso_string(backend):
+    madrid = timezone(timedelta(hours=2))
+    assert json.loads(encode_json([row["timestamp"] for row in ROWS] + [datetime(2026, 6, 1, 2, 0, 0, 1500, madrid)])) == [
+        "2026-01-02T03:04:05.000Z", "2026-01-02T03:04:05.120Z", "2026-12-31T23:59:59.999Z", "2026-06-01T00:00:00.001Z",
+    ]
+
+
+def test_object_ids_encode_as_hex(backend):
+    object_id = ObjectId()
+    assert json.loads(encode_json({"_id": object_id, "nested": [object_id]})) == {
+        "_id": str(object_id), "nested": [str(object_id)],
+    }
+
+
+def test_other_types_are_rejected(backend):
+    with pytest.raises(TypeError):
+        encode_json({"value": object()})
+
+
+def test_status_listing_matches_the_pydantic_encoding(client, server):
+    for index in range(3):
+        client.post("/api/status", json={"client_name": f"client_{index}"})
+    created = client.post("/api/status", json={"client_name": "client_3"}).json()
+    assert created["timestamp"].endswith("Z") and len(created["timestamp"]) == len("2026-01-02T03:04:05.000Z")
+    rows = client.get("/api/status").json()
+    assert created in rows
+    validated = TypeAdapter(List[server.StatusCheck]).validate_python(rows)
+    assert rows == json.loads(TypeAdapter(List[server.StatusCheck]).dump_json(validated))
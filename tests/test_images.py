@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import io
+import os
+import random
+import time
+
+import httpx
+from bson import ObjectId
+from PIL import Image
+
+import images
+from images import IMAGE_SIZES, UPLOAD_DIR, ImageDerivatives, derivative_name, render_derivatives
+
+
+def picture(width=800, height=600, format="PNG"):
+    """A noisy image, different on every call so uploads never share a content hash"""
+    image = Image.frombytes("RGB", (width, height), random.randbytes(width * height * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format)
+    return buffer.getvalue()
+
+
+def upload(client, model, content, field="image", filename="foto.png"):
+    return client.post(
+        f"/api/profiles/{model['profileId']}/images", headers=model["headers"],
+        files={field: (filename, content, "image/png")},
+    )
+
+
+def test_upload_is_stored_under_its_content_hash_once(client, register):
+    model = register("model")
+    content = picture()
+    first = upload(client, model, content)
+    assert first.status_code == 201
+    image = first.json()["data"]["image"]
+    filename = f"{hashlib.sha256(content).hexdigest()}.png"
+    assert image["filename"] == filename and image["url"] == f"/api/uploads/{filename}"
+    assert image["isMain"] is True
+    assert (UPLOAD_DIR / filename).read_bytes() == content
+    assert client.get(image["url"]).content == content
+
+    again = upload(client, model, content, filename="copia.png")
+    assert again.status_code == 201
+    assert again.json()["data"]["image"]["_id"] == image["_id"]
+    assert os.listdir(UPLOAD_DIR / ".incoming") == []
+
+
+def test_uploads_are_validated(client, register, monkeypatch):
+    model, customer = register("model"), register()
+    assert upload(client, model, b"GIF89a" + bytes(100)).status_code == 400
+    assert upload(client, model, picture(), field="other").status_code == 400
+    assert upload(client, {**customer, "profileId": model["profileId"]}, picture()).status_code == 403
+    monkeypatch.setattr(images, "UPLOAD_MAX_BYTES", 1000)
+    assert upload(client, model, picture()).status_code == 413
+    assert os.listdir(UPLOAD_DIR / ".incoming") == []
+
+
+def test_body_split_into_small_chunks_is_reassembled(server, register):
+    model = register("model")
+    content = picture(64, 64)
+    request = httpx.Request(
+        "POST", f"http://test/api/profiles/{model['profileId']}/images", headers=model["headers"],
+        files={"image": ("foto.png", content, "image/png")},
+    )
+    body = request.read()
+
+    async def chunks():
+        for start in range(0, len(body), 7):
+            yield body[start:start + 7]
+
+    async def main():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(request.url.path, headers={
+                "Authorization": model["headers"]["Authorization"], "Content-Type": request.headers["Content-Type"],
+            }, content=chunks())
+
+    response = asyncio.run(main())
+    assert response.status_code == 201
+    assert response.json()["data"]["image"]["filename"] == f"{hashlib.sha256(content).hexdigest()}.png"
+
+
+def test_derivatives_fill_the_card_and_fit_the_large_size(tmp_path):
+    source = tmp_path / "original.jpg"
+    source.write_bytes(picture(3000, 2000, "JPEG"))
+    assert render_derivatives(str(source)) == list(IMAGE_SIZES)
+    with Image.open(tmp_path / derivative_name(source.name, "card")) as card:
+        assert card.size == (400, 500)
+    with Image.open(tmp_path / derivative_name(source.name, "large")) as large:
+        assert large.size == (1200, 800)
+
+
+def test_jobs_for_one_file_share_a_render(tmp_path):
+    (tmp_path / "a.png").write_bytes(picture(200, 100))
+    (tmp_path / "broken.png").write_bytes(b"\x89PNG\r\n\x1a\n" + bytes(20))
+
+    async def main():
+        derivatives = ImageDerivatives(tmp_path, workers=1)
+        done = asyncio.Event()
+        recorded = []
+
+        async def record(urls):
+            recorded.append(urls)
+            if len(recorded) == 2:
+                done.set()
+
+        try:
+            assert derivatives.submit("a.png", record) and derivatives.submit("a.png", record)
+            derivatives.submit("broken.png", record)
+            await asyncio.wait_for(done.wait(), 60)
+            await asyncio.wait_for(derivatives.queue.join(), 60)
+        finally:
+            derivatives.stop()
+        return recorded, derivatives.rendered, derivatives.failed
+
+    recorded, rendered, failed = asyncio.run(main())
+    assert recorded == [{size: f"/api/uploads/a-{size}.jpg" for size in IMAGE_SIZES}] * 2
+    assert (rendered, failed) == (1, 1)
+    assert ImageDerivatives(tmp_path).existing("a.png") == recorded[0]
+    assert ImageDerivatives(tmp_path).existing("broken.png") is None
+
+
+def test_full_queue_drops_the_job(tmp_path):
+    async def main():
+        derivatives = ImageDerivatives(tmp_path, max_queue=1)
+        derivatives.queue.put_nowait("queued.png")
+
+        async def record(urls):
+            pass
+
+        return derivatives.submit("a.png", record), derivatives.dropped
+
+    assert asyncio.run(main()) == (False, 1)
+
+
+def test_uploaded_image_gets_its_derivatives(client, server, register):
+    model = register("model")
+    image = upload(client, model, picture()).json()["data"]["image"]
+    assert "sizes" not in image
+    profile_id = ObjectId(model["profileId"])
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        stored = server.storage.profiles.profiles[profile_id]["images"][0]
+        if "sizes" in stored:
+            break
+        time.sleep(0.05)
+    assert stored["sizes"] == {size: f"/api/uploads/{derivative_name(image['filename'], size)}" for size in IMAGE_SIZES}
+    for url in stored["sizes"].values():
+        assert client.get(url).headers["content-type"] == "image/jpeg"
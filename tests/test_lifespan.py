@@ -0,0 +1,55 @@
+import asyncio
+
+import httpx
+from fastapi.testclient import TestClient
+
+
+def test_ready_only_inside_the_lifespan(server):
+    client = TestClient(server.app)
+    assert client.get("/api/ready").status_code == 503
+    with client:
+        response = client.get("/api/ready")
+        assert response.status_code == 200
+        assert response.json()["status"] == "ready"
+        assert response.json()["warmup_seconds"] >= 0
+    assert client.get("/api/ready").status_code == 503
+    assert client.get("/api/health").status_code == 200
+
+
+def test_ready_waits_for_indexes_and_the_pool_warm_up(server):
+    calls = []
+    release = asyncio.Event()
+    ensure_indexes = server.storage.ensure_indexes
+
+    async def recording_ensure_indexes():
+        calls.append("ensure_indexes")
+        await ensure_indexes()
+
+    async def blocking_warm_up(connections):
+        calls.append(("warm_up", connections))
+        await release.wait()
+
+    server.storage.ensure_indexes = recording_ensure_indexes
+    server.storage.warm_up = blocking_warm_up
+
+    async def main():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            lifespan = server.lifespan(server.app)
+            starting = asyncio.create_task(lifespan.__aenter__())
+            await asyncio.sleep(0.01)
+            during = (await client.get("/api/ready")).status_code, (await client.get("/api/health")).status_code
+            release.set()
+            await starting
+            after = (await client.get("/api/ready")).status_code
+            await lifespan.__aexit__(None, None, None)
+            stopped = (await client.get("/api/ready")).status_code
+        return during, after, stopped
+
+    assert asyncio.run(main()) == ((503, 200), 200, 503)
+    assert calls == ["ensure_indexes", ("warm_up", server.MONGO_MIN_POOL_SIZE)]
+
+
+def test_warm_up_time_is_exported(client):
+    warmup = client.get("/api/ready").json()["warmup_seconds"]
+    assert f"app_warmup_seconds {warmup}\n" in client.get("/api/metrics").text
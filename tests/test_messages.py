@@ -0,0 +1,94 @@
+import asyncio
+import itertools
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def clock(server, monkeypatch):
+    """One millisecond per write, so no two messages tie on createdAt"""
+    ticks = itertools.count()
+    monkeypatch.setattr(server, "_bson_now", lambda: datetime(2026, 1, 1) + timedelta(milliseconds=next(ticks)))
+
+
+def send(client, sender, receiver, profile_id, content):
+    response = client.post("/api/messages", headers=sender["headers"], json={
+        "receiverId": receiver["_id"], "profileId": profile_id, "content": content,
+    })
+    assert response.status_code == 201
+    return response.json()["data"]["message"]
+
+
+def inbox(client, user, **params):
+    return client.get("/api/messages/conversations", headers=user["headers"], params=params)
+
+
+def summaries(client, user):
+    return [
+        (conversation["otherUserId"], conversation["lastMessage"], conversation["unreadCount"])
+        for conversation in inbox(client, user).json()["data"]["conversations"]
+    ]
+
+
+def unread(client, user):
+    return client.get("/api/messages/unread-count", headers=user["headers"]).json()["data"]["unreadCount"]
+
+
+def test_summaries_follow_sends_and_reads(client, register):
+    model, ana, bea = register("model"), register(), register()
+    profile_id = model["profileId"]
+    for content in ("hola", "¿estás libre?", "¿mañana?"):
+        send(client, ana, model, profile_id, content)
+    send(client, bea, model, profile_id, "buenas")
+
+    assert summaries(client, model) == [(bea["_id"], "buenas", 1), (ana["_id"], "¿mañana?", 3)]
+    assert summaries(client, ana) == [(model["_id"], "¿mañana?", 0)]
+    assert unread(client, model) == 4
+
+    thread = client.get(f"/api/messages/conversation/{ana['_id']}/{profile_id}", headers=model["headers"])
+    assert [message["content"] for message in thread.json()["data"]["messages"]] == ["hola", "¿estás libre?", "¿mañana?"]
+    assert summaries(client, model) == [(bea["_id"], "buenas", 1), (ana["_id"], "¿mañana?", 0)]
+    assert unread(client, model) == 1
+
+    send(client, model, ana, profile_id, "sí, a las 10")
+    assert summaries(client, model)[0] == (ana["_id"], "sí, a las 10", 0)
+    assert summaries(client, ana) == [(model["_id"], "sí, a las 10", 1)]
+    assert unread(client, ana) == 1
+
+    # Reading again flips nothing, so the count stays put
+    client.get(f"/api/messages/conversation/{ana['_id']}/{profile_id}", headers=model["headers"])
+    assert summaries(client, model)[1] == (bea["_id"], "buenas", 1)
+
+
+def test_inbox_pages_with_a_cursor(client, register):
+    model = register("model")
+    customers = [register() for _ in range(5)]
+    for customer in customers:
+        send(client, customer, model, model["profileId"], f"de {customer['name']}")
+
+    pages, cursor = [], None
+    while True:
+        response = inbox(client, model, limit=2, **({"cursor": cursor} if cursor else {}))
+        pages.append([conversation["otherUserId"] for conversation in response.json()["data"]["conversations"]])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert pages == [
+        [customers[4]["_id"], customers[3]["_id"]], [customers[2]["_id"], customers[1]["_id"]], [customers[0]["_id"]],
+    ]
+    assert inbox(client, model, cursor="not-a-cursor").status_code == 400
+
+
+def test_rebuild_reproduces_the_maintained_summaries(client, server, register):
+    model, ana, bea = register("model"), register(), register()
+    send(client, ana, model, model["profileId"], "hola")
+    send(client, model, ana, model["profileId"], "hola, Ana")
+    send(client, bea, model, model["profileId"], "buenas")
+    send(client, ana, model, model["profileId"], "¿mañana?")
+    client.get(f"/api/messages/conversation/{bea['_id']}/{model['profileId']}", headers=model["headers"])
+    maintained = [summaries(client, user) for user in (model, ana, bea)]
+
+    storage = server.storage
+    asyncio.run(storage.conversations.rebuild(storage.messages.summaries()))
+    assert [summaries(client, user) for user in (model, ana, bea)] == maintained
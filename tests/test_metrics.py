@@ -0,0 +1,71 @@
+from metrics import merge_metrics, with_label
+
+WORKER_1 = """# TYPE http_request_duration_seconds histogram
+http_request_duration_seconds_bucket{route="/api/health",le="0.005"} 3
+http_request_duration_seconds_bucket{route="/api/health",le="+Inf"} 4
+http_request_duration_seconds_sum{route="/api/health"} 0.5
+http_request_duration_seconds_count{route="/api/health"} 4
+# TYPE admission_limit gauge
+admission_limit{class="read"} 64.00
+# TYPE event_loop_lag_last_seconds gauge
+event_loop_lag_last_seconds 0.002
+# TYPE push_resyncs_total counter
+push_resyncs_total 2
+"""
+
+WORKER_2 = """# TYPE http_request_duration_seconds histogram
+http_request_duration_seconds_bucket{route="/api/health",le="0.005"} 1
+http_request_duration_seconds_bucket{route="/api/health",le="+Inf"} 1
+http_request_duration_seconds_sum{route="/api/health"} 0.001
+http_request_duration_seconds_count{route="/api/health"} 1
+# TYPE admission_limit gauge
+admission_limit{class="read"} 48.50
+# TYPE event_loop_lag_last_seconds gauge
+event_loop_lag_last_seconds 0.001
+# TYPE push_resyncs_total counter
+push_resyncs_total 1
+"""
+
+
+def parse(text):
+    return dict(line.rsplit(" ", 1) for line in text.splitlines() if line and not line.startswith("#"))
+
+
+def test_counters_and_histograms_are_summed():
+    merged = parse(merge_metrics([("1", WORKER_1), ("2", WORKER_2)]))
+    assert merged['http_request_duration_seconds_bucket{route="/api/health",le="0.005"}'] == "4"
+    assert merged['http_request_duration_seconds_count{route="/api/health"}'] == "5"
+    assert merged['http_request_duration_seconds_sum{route="/api/health"}'] == "0.501"
+    assert merged["push_resyncs_total"] == "3"
+
+
+def test_gauges_are_kept_per_worker():
+    merged = parse(merge_metrics([("1", WORKER_1), ("2", WORKER_2)]))
+    assert merged['admission_limit{class="read",worker="1"}'] == "64"
+    assert merged['admission_limit{class="read",worker="2"}'] == "48.5"
+    assert merged['event_loop_lag_last_seconds{worker="1"}'] == "0.002"
+    assert 'admission_limit{class="read"}' not in merged
+
+
+def test_kinds_keep_only_the_families_asked_for():
+    retired = merge_metrics([("retired", WORKER_1), ("3", WORKER_2)], kinds=("counter", "histogram"))
+    assert "gauge" not in retired
+    # Folding the retired render again with a later worker keeps summing
+    again = parse(merge_metrics([("retired", retired), ("4", WORKER_2)], kinds=("counter", "histogram")))
+    assert again["push_resyncs_total"] == "4"
+    assert merge_metrics([]) == ""
+
+
+def test_with_label():
+    assert with_label("up", "worker", "1") == 'up{worker="1"}'
+    assert with_label('up{a="b"}', "worker", "1") == 'up{a="b",worker="1"}'
+
+
+def test_request_counts_are_rendered_once(client):
+    key = 'http_requests_total{method="GET",route="/api/health",status="200"}'
+    before = int(parse(client.get("/api/metrics").text).get(key, 0))
+    for _ in range(3):
+        client.get("/api/health")
+    metrics = client.get("/api/metrics").text
+    assert metrics.count("# TYPE http_requests_total counter") == 1
+    assert int(parse(metrics)[key]) == before + 3
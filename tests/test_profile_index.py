@@ -0,0 +1,304 @@
+import asyncio
+import json
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from search import ProfileIndex, ProfileIndexSync, hourly_price, tokenize
+from search.text import SEARCH_FIELDS, SEARCH_MIN_PREFIX
+from storage import MemoryStorage
+
+LOCATIONS = ["Madrid", "Barcelona", "Valencia", "Sevilla", "Málaga"]
+ETHNICITIES = ["Europea", "Asiática", "Latina", "Africana"]
+CATEGORIES = ["Independiente", "Agencia"]
+WORDS = ["simpática", "elegante", "discreta", "cariñosa", "divertida", "morena", "rubia", "masaje", "cena", "viajes"]
+RATES = ["€180/h", "150 €", "1.200€ noche", "300€/2h", "180,50 EUR/hora", "90€ 30 min", "a consultar", None]
+START = datetime(2024, 1, 1)
+
+
+def profile(rng, **fields):
+    doc = {
+        "_id": ObjectId(),
+        "name": f"{rng.choice(['Ana', 'Lucía', 'Sofía', 'Nuria', 'Mar'])} {rng.randint(1, 99)}",
+        "age": rng.choice([None] + list(range(18, 40))),
+        "location": rng.choice(LOCATIONS),
+        "ethnicity": rng.choice(ETHNICITIES),
+        "category": rng.choice(CATEGORIES),
+        "description": " ".join(rng.sample(WORDS, rng.randint(0, 4))),
+        "services": rng.sample(WORDS, rng.randint(0, 2)),
+        "rates": {"incall": rng.choice(RATES), "outcall": rng.choice(RATES)},
+        "isFeatured": rng.random() < 0.3,
+        "isActive": rng.random() < 0.9,
+        "views": {"total": rng.randint(0, 50)},
+        "createdAt": rng.choice([None, START + timedelta(minutes=rng.randint(0, 10 ** 5))]),
+    }
+    doc.update(fields)
+    return doc
+
+
+def ids(rows):
+    return [json.loads(row)["id"] for row in rows]
+
+
+def brute_force(index, docs, location=None, ethnicity=None, category=None, min_age=None, max_age=None,
+                min_price=None, max_price=None, search=None, sort="featured", skip=0, limit=20):
+    """The listing as a Mongo find() with the same filter, sort, skip and limit would return it"""
+    tokens = tokenize(search or "")
+
+    def matches(doc):
+        if not doc.get("isActive", True):
+            return False
+        for field, value in (("location", location), ("ethnicity", ethnicity), ("category", category)):
+            if value is not None and doc.get(field) != value:
+                return False
+        age = doc.get("age")
+        if (min_age is not None or max_age is not None) and age is None:
+            return False
+        if min_age is not None and age < min_age or max_age is not None and age > max_age:
+            return False
+        price = hourly_price((doc.get("rates") or {}).get("incall"))
+        if (min_price is not None or max_price is not None) and price is None:
+            return False
+        if min_price is not None and price < min_price or max_price is not None and price > max_price:
+            return False
+        terms = set()
+        for field in SEARCH_FIELDS:
+            value = doc.get(field) or ""
+            terms.update(tokenize(" ".join(value) if isinstance(value, list) else str(value)))
+        for token in tokens:
+            if len(token) < SEARCH_MIN_PREFIX:
+                if token not in terms:
+                    return False
+            elif not any(term.startswith(token) for term in terms):
+                return False
+        return True
+
+    def key(doc):
+        created = doc.get("createdAt")
+        newest = -(created - START).total_seconds() if created else float("inf")
+        price = hourly_price((doc.get("rates") or {}).get("incall"))
+        # Mongo leaves ties in storage order; the index breaks them by slot
+        tiebreak = index.slots[doc["_id"]]
+        if sort in ("featured", "relevance"):
+            return (not doc.get("isFeatured"), newest, tiebreak)
+        if sort == "newest":
+            return (newest, tiebreak)
+        if sort == "price-low":
+            return (price is None, price or 0, tiebreak)
+        if sort == "price-high":
+            return (price is None, -(price or 0), tiebreak)
+        return (-(doc.get("views") or {}).get("total", 0), tiebreak)
+
+    found = sorted((doc for doc in docs if matches(doc)), key=key)
+    return len(found), [str(doc["_id"]) for doc in found[skip:skip + limit]]
+
+
+def check(index, docs, **query):
+    total, rows = index.query(**query)
+    assert (total, ids(rows)) == brute_force(index, docs, **query), query
+
+
+@pytest.fixture
+def catalogue():
+    rng = random.Random(14)
+    docs = [profile(rng) for _ in range(200)]
+    index = ProfileIndex()
+    index.rebuild(docs)
+    return index, docs
+
+
+def test_inactive_profiles_are_not_indexed(catalogue):
+    index, docs = catalogue
+    assert len(index) == sum(doc["isActive"] for doc in docs)
+    assert index.query(limit=1000)[0] == len(index)
+
+
+@pytest.mark.parametrize("field,values", [
+    ("location", LOCATIONS + ["Bilbao"]), ("ethnicity", ETHNICITIES), ("category", CATEGORIES),
+])
+def test_facet_filters(catalogue, field, values):
+    index, docs = catalogue
+    for value in values:
+        check(index, docs, **{field: value})
+
+
+def test_combined_facets_and_age_range(catalogue):
+    index, docs = catalogue
+    check(index, docs, location="Madrid", category="Agencia", min_age=20, max_age=30, limit=50)
+    check(index, docs, min_age=25)
+    check(index, docs, max_age=22)
+    check(index, docs, min_age=30, max_age=25)
+
+
+def test_price_range_is_exact_at_cent_bounds(catalogue):
+    index, docs = catalogue
+    # 180,50 EUR/hora and 300€/2h land inside buckets; 150 € and €180/h on their bounds
+    for low, high in [(15000, 18000), (15001, 18049), (18050, 18050), (None, 15000), (18001, None), (0, 10 ** 6)]:
+        check(index, docs, min_price=low, max_price=high, limit=200)
+        check(index, docs, min_price=low, max_price=high, sort="price-low", limit=200)
+        check(index, docs, min_price=low, max_price=high, sort="price-high", limit=200)
+
+
+@pytest.mark.parametrize("sort", ["featured", "newest", "price-low", "price-high", "popular"])
+def test_sorts_with_skip_and_limit(catalogue, sort):
+    index, docs = catalogue
+    for skip, limit in [(0, 20), (20, 20), (7, 3), (150, 50), (1000, 20)]:
+        check(index, docs, sort=sort, skip=skip, limit=limit)
+
+
+def test_unpriced_profiles_sort_last_both_ways(catalogue):
+    index, docs = catalogue
+    for sort in ("price-low", "price-high"):
+        total, rows = index.query(sort=sort, limit=1000)
+        prices = [json.loads(row)["incall"] for row in rows]
+        parsed = [hourly_price(rate) for rate in prices]
+        priced = [price for price in parsed if price is not None]
+        assert parsed[:len(priced)] == priced
+        assert priced == sorted(priced, reverse=sort == "price-high")
+
+
+def test_search_matches_word_prefixes_across_fields(catalogue):
+    index, docs = catalogue
+    for search in ["mad", "MÁLAGA", "cariñ", "latina", "masaje madrid", "ana", "zz", "a", "de la"]:
+        check(index, docs, search=search, limit=200)
+
+
+def test_upserts_and_removals_match_a_rebuild():
+    rng = random.Random(140)
+    docs = {doc["_id"]: doc for doc in (profile(rng) for _ in range(100))}
+    index = ProfileIndex()
+    for doc in docs.values():
+        index.upsert(doc)
+    for _ in range(300):
+        doc = rng.choice(list(docs.values()))
+        action = rng.random()
+        if action < 0.1:
+            index.remove(doc["_id"])
+            del docs[doc["_id"]]
+        else:
+            changed = profile(rng, _id=doc["_id"]) if action < 0.6 else {**doc, "views": {"total": rng.randint(0, 50)}}
+            docs[doc["_id"]] = changed
+            index.upsert(changed)
+        if len(docs) < 50:
+            new = profile(rng)
+            docs[new["_id"]] = new
+            index.upsert(new)
+    docs = list(docs.values())
+    assert len(index) == sum(doc["isActive"] for doc in docs)
+    for sort in ("featured", "newest", "price-low", "price-high", "popular"):
+        check(index, docs, sort=sort, limit=200)
+    check(index, docs, location="Madrid", min_price=10000, max_price=20000, limit=200)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_fuzz_against_brute_force(seed):
+    rng = random.Random(seed)
+    docs = [profile(rng) for _ in range(rng.randint(50, 400))]
+    index = ProfileIndex()
+    index.rebuild(docs)
+    for _ in range(60):
+        query = {"sort": rng.choice(["featured", "newest", "price-low", "price-high", "popular", "relevance"])}
+        for field, values in (("location", LOCATIONS), ("ethnicity", ETHNICITIES), ("category", CATEGORIES)):
+            if rng.random() < 0.3:
+                query[field] = rng.choice(values)
+        if rng.random() < 0.3:
+            query["min_age"] = rng.randint(18, 40)
+        if rng.random() < 0.3:
+            query["max_age"] = rng.randint(18, 40)
+        if rng.random() < 0.3:
+            query["min_price"] = rng.randint(0, 30000)
+        if rng.random() < 0.3:
+            query["max_price"] = rng.randint(0, 30000)
+        if rng.random() < 0.3 and query["sort"] != "relevance":
+            query["search"] = " ".join(rng.choice(WORDS + LOCATIONS)[:rng.randint(1, 6)] for _ in range(rng.randint(1, 2)))
+        query["skip"] = rng.choice([0, 0, 5, 20, 100])
+        query["limit"] = rng.choice([1, 20, 50])
+        check(index, docs, **query)
+
+
+def run_sync(repository, scenario, poll_interval=0.01, overlap=0.05):
+    async def main():
+        index = ProfileIndex()
+        sync = ProfileIndexSync(repository, index, poll_interval=poll_interval, overlap=overlap)
+        await sync.start()
+        try:
+            return await scenario(index, sync)
+        finally:
+            sync.stop()
+    return asyncio.run(main())
+
+
+def test_delta_sync_follows_updated_at():
+    storage = MemoryStorage()
+    rng = random.Random(1)
+
+    async def scenario(index, sync):
+        assert sync._start_at is None
+        first = await storage.profiles.save(profile(rng, isActive=True, location="Madrid", views={"total": 3}))
+        await asyncio.sleep(0.1)
+        assert index.query(location="Madrid")[0] == 1
+
+        await storage.profiles.save({**first, "location": "Sevilla"})
+        second = await storage.profiles.save(profile(rng, isActive=True, location="Sevilla", views={"total": 0}))
+        await asyncio.sleep(0.1)
+        assert index.query(location="Madrid")[0] == 0
+        assert index.query(location="Sevilla")[0] == 2
+
+        await storage.profiles.add_views({second["_id"]: 5})
+        await asyncio.sleep(0.1)
+        assert ids(index.query(sort="popular", limit=1)[1]) == [str(second["_id"])]
+
+        await storage.profiles.save({**second, "isActive": False})
+        await asyncio.sleep(0.1)
+        return len(index), sync.high_water
+
+    assert run_sync(storage.profiles, scenario)[0] == 1
+
+
+def test_delta_sync_loads_existing_profiles_first():
+    storage = MemoryStorage()
+    rng = random.Random(2)
+
+    async def scenario(index, sync):
+        return len(index)
+
+    async def seed():
+        for _ in range(10):
+            await storage.profiles.save(profile(rng, isActive=True))
+    asyncio.run(seed())
+    assert run_sync(storage.profiles, scenario, poll_interval=60) == 10
+
+
+def test_change_feed_is_followed_when_the_repository_has_one():
+    storage = MemoryStorage()
+    rng = random.Random(3)
+
+    class FeedRepository(type(storage.profiles)):
+        def __init__(self):
+            super().__init__()
+            self.feed = asyncio.Queue()
+
+        async def change_stream_start(self):
+            return "token"
+
+        async def changes(self, start_at):
+            assert start_at == "token"
+            while True:
+                yield await self.feed.get()
+
+    repository = FeedRepository()
+
+    async def scenario(index, sync):
+        assert sync._start_at == "token"
+        doc = profile(rng, isActive=True)
+        # Written straight to the feed: polling would never see it, since the repository is empty
+        repository.feed.put_nowait(("upsert", doc))
+        await asyncio.sleep(0.05)
+        assert len(index) == 1
+        repository.feed.put_nowait(("delete", doc["_id"]))
+        await asyncio.sleep(0.05)
+        return len(index)
+
+    assert run_sync(repository, scenario) == 0
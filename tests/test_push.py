@@ -0,0 +1,140 @@
+import asyncio
+import json
+
+import pytest
+from bson import ObjectId
+from starlette.websockets import WebSocketDisconnect
+
+from push import LocalBroker, MessageHub
+from storage.memory import MemoryMessageRepository
+
+
+def decoded(events):
+    return [json.loads(event) for event in events]
+
+
+def message_event(sender, receiver, content):
+    return {"type": "message", "senderId": sender, "receiverId": receiver, "message": {"content": content}}
+
+
+def unread_message(sender, receiver):
+    return {
+        "_id": ObjectId(), "senderId": sender, "receiverId": receiver, "profileId": ObjectId(), "content": "hola",
+        "isRead": False, "isDeleted": False, "createdAt": None,
+    }
+
+
+def test_hub_delivers_to_both_participants_and_counts_unread():
+    ana, bea, other = ObjectId(), ObjectId(), ObjectId()
+
+    async def main():
+        messages = MemoryMessageRepository()
+        await messages.insert(unread_message(bea, ana))
+        hub = MessageHub(messages, LocalBroker())
+        await hub.start()
+        inbox, outbox, bystander = await hub.subscribe(ana), await hub.subscribe(bea), await hub.subscribe(other)
+        seeded = decoded(await inbox.next_batch(1)), decoded(await outbox.next_batch(1))
+        await bystander.next_batch(1)
+        await hub.broker.publish(message_event(bea, ana, "uno"))
+        await hub.broker.publish(message_event(bea, ana, "dos"))
+        await hub.broker.publish({"type": "read", "userId": ana, "count": 2})
+        await asyncio.sleep(0)
+        delivered = decoded(await inbox.next_batch(1)), decoded(await outbox.next_batch(1))
+        idle = await bystander.next_batch(0.01)
+        hub.stop()
+        return seeded, delivered, idle, hub.unread
+
+    seeded, delivered, idle, unread = asyncio.run(main())
+    assert seeded == ([{"type": "unread", "unreadCount": 1}], [{"type": "unread", "unreadCount": 0}])
+    messages = [{"type": "message", "message": {"content": "uno"}}, {"type": "message", "message": {"content": "dos"}}]
+    # Unread counts coalesce to the latest one: +1, +1, then -2 for the read
+    assert delivered == (messages + [{"type": "unread", "unreadCount": 1}], messages)
+    assert idle == []
+    assert unread == {ana: 1, bea: 0, other: 0}
+
+
+def test_overflowing_subscriber_gets_one_resync_instead_of_the_backlog():
+    ana, bea = ObjectId(), ObjectId()
+
+    async def main():
+        hub = MessageHub(MemoryMessageRepository(), LocalBroker(), max_pending=3)
+        slow, fast = await hub.subscribe(ana), await hub.subscribe(ana)
+        for subscriber in (slow, fast):
+            await subscriber.next_batch(1)
+        batches = []
+        for index in range(5):
+            hub.deliver(message_event(bea, ana, str(index)))
+            batches.append(decoded(await fast.next_batch(1)))
+        overflowed = decoded(await slow.next_batch(1))
+        hub.deliver(message_event(bea, ana, "after"))
+        recovered = decoded(await slow.next_batch(1))
+        return batches, overflowed, recovered, hub.resyncs
+
+    batches, overflowed, recovered, resyncs = asyncio.run(main())
+    # A connection that keeps up gets every event
+    assert [event["type"] for batch in batches for event in batch] == ["message", "unread"] * 5
+    assert overflowed == [{"type": "resync"}, {"type": "unread", "unreadCount": 5}]
+    assert recovered == [{"type": "message", "message": {"content": "after"}}, {"type": "unread", "unreadCount": 6}]
+    assert resyncs == 1
+
+
+def test_unsubscribing_the_last_connection_drops_the_counter():
+    ana = ObjectId()
+
+    async def main():
+        hub = MessageHub(MemoryMessageRepository(), LocalBroker())
+        first, second = await hub.subscribe(ana), await hub.subscribe(ana)
+        hub.unsubscribe(ana, first)
+        kept = dict(hub.unread), len(hub)
+        hub.unsubscribe(ana, second)
+        return kept, hub.unread, len(hub)
+
+    assert asyncio.run(main()) == (({ana: 0}, 1), {}, 0)
+
+
+def test_websocket_pushes_messages_and_unread_counts(client, register):
+    model, ana = register("model"), register()
+    with client.websocket_connect(f"/api/messages/ws?token={model['token']}") as websocket:
+        assert websocket.receive_json() == {"type": "unread", "unreadCount": 0}
+        response = client.post("/api/messages", headers=ana["headers"], json={
+            "receiverId": model["_id"], "profileId": model["profileId"], "content": "hola",
+        })
+        assert response.status_code == 201
+        pushed = websocket.receive_json()
+        assert pushed["type"] == "message"
+        assert pushed["message"]["content"] == "hola"
+        assert pushed["message"]["senderId"]["name"] == ana["name"]
+        assert websocket.receive_json() == {"type": "unread", "unreadCount": 1}
+
+        client.get(f"/api/messages/conversation/{ana['_id']}/{model['profileId']}", headers=model["headers"])
+        assert websocket.receive_json() == {"type": "unread", "unreadCount": 0}
+
+
+def test_websocket_without_a_valid_token_is_closed(client):
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect("/api/messages/ws?token=nope") as websocket:
+            websocket.receive_json()
+    assert closed.value.code == 1008
+
+
+def test_event_stream_frames_events_and_heartbeats(server, monkeypatch):
+    monkeypatch.setattr(server, "PUSH_HEARTBEAT_SECONDS", 0.01)
+    user_id = ObjectId()
+
+    async def main():
+        await server.message_hub.start()
+        stream = server.stream_push_events(user_id)
+        frames = [await anext(stream), await anext(stream), await anext(stream)]
+        await server.message_hub.broker.publish(message_event(ObjectId(), user_id, "hola"))
+        frames.append(await anext(stream))
+        await stream.aclose()
+        server.message_hub.stop()
+        return frames, len(server.message_hub)
+
+    frames, connections = asyncio.run(main())
+    assert frames[:3] == [b"retry: 5000\n\n", b'data: {"type":"unread","unreadCount":0}\n\n', b": ping\n\n"]
+    assert frames[3] == (
+        b'data: {"type":"message","message":{"content":"hola"}}\n\n'
+        b'data: {"type":"unread","unreadCount":1}\n\n'
+    )
+    assert connections == 0
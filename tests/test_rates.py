@@ -0,0 +1,70 @@
+import json
+import random
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from search.rates import hourly_price, parse_rate, rate_fields
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+VECTORS = json.loads((BACKEND_DIR / "utils" / "rate_vectors.json").read_text(encoding="utf-8"))
+
+# Reads rate strings as JSON lines and prints what utils/rates.js makes of each
+NODE_PARSER = """
+const { parseRate, hourlyPrice } = require(process.argv[1]);
+const lines = require('fs').readFileSync(0, 'utf8').split('\\n').filter(Boolean);
+for (const line of lines) {
+  const rate = JSON.parse(line);
+  const parsed = parseRate(rate);
+  console.log(JSON.stringify(parsed ? [parsed.cents, parsed.hours, hourlyPrice(rate)] : null));
+}
+"""
+
+
+@pytest.mark.parametrize("vector", VECTORS, ids=lambda vector: repr(vector["rate"]))
+def test_shared_vectors(vector):
+    parsed = parse_rate(vector["rate"])
+    assert parsed == (None if vector["cents"] is None else (vector["cents"], vector["hours"]))
+    assert hourly_price(vector["rate"]) == vector["hourly"]
+
+
+def test_half_a_cent_rounds_up():
+    # round() would give 50 and 52, rounding half to even
+    assert hourly_price("1,01€ 2h") == 51
+    assert hourly_price("1,05€ 2h") == 53
+
+
+def test_rate_fields():
+    assert rate_fields({"incall": "300€/2h", "outcall": "a consultar"}) == {
+        "rates.incallCents": 30000, "rates.incallHours": 2.0, "rates.outcallCents": None, "rates.outcallHours": None,
+        "priceCents": 15000,
+    }
+
+
+def random_rate(rng):
+    amount = rng.choice(["1", "15", "150", "1.200", "99,9", "180,50", "0,01", "1,01", "12.345", "7,5"])
+    currency = rng.choice(["€", "EUR", "Eur", "euros", "ÉUR", "", "€"])
+    duration = rng.choice([
+        "", "/h", "/2h", " 3h", " hora", " HÓRA", " 1,5 horas", " media hora", " 45 minutos", " 20 min", " noche",
+        " 2 noches", " día", " 0h", "/2hrs",
+    ])
+    space = rng.choice(["", " ", " ", " ", " ", "\t"])
+    parts = [amount + space + currency, duration] if rng.random() < 0.7 else [duration, currency + space + amount]
+    return rng.choice(["", "Desde ", "desde ", "Precio: "]) + "".join(parts) + rng.choice(["", " ", " ✨", "!"])
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+def test_node_parser_agrees_on_random_rates():
+    rng = random.Random(16)
+    rates = [vector["rate"] for vector in VECTORS] + [random_rate(rng) for _ in range(2000)]
+    result = subprocess.run(
+        ["node", "-e", NODE_PARSER, str(BACKEND_DIR / "utils" / "rates.js")],
+        input="".join(json.dumps(rate) + "\n" for rate in rates), capture_output=True, text=True, check=True,
+    )
+    node = [json.loads(line) for line in result.stdout.splitlines()]
+    python = [[*parsed, hourly_price(rate)] if (parsed := parse_rate(rate)) else None for rate in rates]
+    mismatches = [(rate, a, b) for rate, a, b in zip(rates, python, node) if a != b]
+    assert len(node) == len(rates)
+    assert mismatches == []
@@ -0,0 +1,138 @@
+import json
+import random
+
+import pytest
+from bson import ObjectId
+
+from search import ProfileIndex, fold, tokenize
+from search.bitmaps import bitmap_of, bitmap_slots
+from search.text import SEARCH_DENSE_POSTINGS, SEARCH_RANK_ALL
+
+WORDS = [
+    "masaje", "masajista", "madrid", "maduro", "malaga", "morena", "rubia", "cena", "cariñosa", "elegante",
+    "discreta", "divertida", "viajes", "fiestas", "simpática", "natural", "relajante", "mar", "marbella", "mañana",
+]
+# Each in few enough profiles to stay under SEARCH_DENSE_POSTINGS, so prefixes mix bitmaps and postings
+RARE_WORDS = ["mallorca", "manzanilla", "maquillaje", "mate", "cala", "dinero"]
+
+
+def profile(rng, **fields):
+    doc = {
+        "_id": ObjectId(),
+        "name": " ".join(rng.choices(WORDS, k=rng.randint(1, 2))),
+        "location": rng.choice(["Madrid", "Málaga", "Marbella", "Sevilla"]),
+        "services": rng.sample(WORDS, rng.randint(0, 3)),
+        "description": " ".join(rng.choices(WORDS, k=rng.randint(0, 12)) + rng.sample(RARE_WORDS, rng.randint(0, 1))),
+    }
+    doc.update(fields)
+    return doc
+
+
+def full_scoring(index, search, matched=None):
+    """Every match scored directly, best first, ties to the lowest slot as top() breaks them"""
+    expansions = [index.search.expand(token) for token in tokenize(search)]
+    if matched is None:
+        matched = index.search.match(expansions)
+    scored = [
+        (sum(index.search.token_score(terms, slot) for terms in expansions), -slot) for slot in bitmap_slots(matched)
+    ]
+    return [-slot for _, slot in sorted(scored, reverse=True)]
+
+
+def threshold_top(index, search, wanted, matched=None):
+    expansions = [index.search.expand(token) for token in tokenize(search)]
+    if matched is None:
+        matched = index.search.match(expansions)
+    return index.search.top(expansions, matched, matched.bit_count(), index.size, wanted)
+
+
+@pytest.fixture(scope="module")
+def large():
+    rng = random.Random(15)
+    docs = [profile(rng) for _ in range(1500)]
+    index = ProfileIndex()
+    index.rebuild(docs)
+    return index
+
+
+@pytest.mark.parametrize("search", ["ma", "masa", "masaje", "madrid morena", "ca", "m", "mar mañana", "di el"])
+@pytest.mark.parametrize("wanted", [1, 10, 50, 300])
+def test_threshold_top_k_equals_full_scoring(large, search, wanted):
+    expected = full_scoring(large, search)
+    # The threshold path only runs past SEARCH_RANK_ALL matches
+    assert len(expected) > SEARCH_RANK_ALL or search == "m"
+    assert threshold_top(large, search, wanted) == expected[:wanted]
+
+
+def test_dense_and_rare_terms_are_both_exercised(large):
+    terms = large.search.expand("ma")
+    assert any(len(large.search.postings[term]) > SEARCH_DENSE_POSTINGS for term in terms)
+    assert any(len(large.search.postings[term]) <= SEARCH_DENSE_POSTINGS for term in terms)
+
+
+def test_threshold_top_k_under_a_selective_filter(large):
+    rng = random.Random(150)
+    for fraction in (0.02, 0.2, 0.8):
+        mask = bitmap_of((slot for slot in range(large.size) if rng.random() < fraction), large.size)
+        matched = large.search.match([large.search.expand(token) for token in tokenize("ma")]) & mask
+        if matched.bit_count() <= SEARCH_RANK_ALL:
+            continue
+        assert threshold_top(large, "ma", 25, matched) == full_scoring(large, "ma", matched)[:25]
+
+
+def test_threshold_top_k_after_edits():
+    rng = random.Random(151)
+    docs = {doc["_id"]: doc for doc in (profile(rng) for _ in range(600))}
+    index = ProfileIndex()
+    index.rebuild(docs.values())
+    threshold_top(index, "ma", 20)
+    for _ in range(400):
+        doc = rng.choice(list(docs.values()))
+        if rng.random() < 0.2:
+            index.remove(doc["_id"])
+            del docs[doc["_id"]]
+        else:
+            # Longer descriptions move the average length, which rescales the cached ranked postings
+            changed = profile(rng, _id=doc["_id"], description=" ".join(rng.choices(WORDS, k=rng.randint(10, 30))))
+            docs[doc["_id"]] = changed
+            index.upsert(changed)
+    for search in ("ma", "masaje", "cena viajes"):
+        assert threshold_top(index, search, 40) == full_scoring(index, search)[:40]
+
+
+def test_relevance_sort_pages_follow_the_ranking(large):
+    ranked = full_scoring(large, "masaje madrid")
+    total, rows = large.query(search="masaje madrid", sort="relevance", skip=10, limit=30)
+    assert total == len(ranked)
+    assert rows == [large.entries[slot].encoded for slot in ranked[10:40]]
+
+
+@pytest.mark.parametrize("text,folded", [
+    ("ASIÁTICA", "asiatica"), ("Asiática", "asiatica"), ("asiatica", "asiatica"),
+    ("Señora", "senora"), ("NIÑA", "nina"), ("Málaga", "malaga"), ("pingüino", "pinguino"), ("Straße", "strasse"),
+])
+def test_fold_strips_case_and_accents(text, folded):
+    assert fold(text) == folded
+
+
+def test_tokenize_folds_and_drops_stopwords():
+    assert tokenize("Masajista ASIÁTICA en la Costa del Sol") == ["masajista", "asiatica", "costa", "sol"]
+    assert tokenize("Cariñosa, y de MÁLAGA!") == ["carinosa", "malaga"]
+
+
+def test_search_matches_regardless_of_accents_and_case():
+    docs = [
+        profile(random.Random(0), name="Mei", description="Masajista ASIÁTICA", services=[]),
+        profile(random.Random(1), name="Nuria", description="Señorita cariñosa", services=[]),
+        profile(random.Random(2), name="Ana", description="rubia", services=[], location="Sevilla"),
+    ]
+    index = ProfileIndex()
+    index.rebuild(docs)
+
+    def found(search):
+        return [json.loads(row)["name"] for row in index.query(search=search)[1]]
+
+    for search in ("asiática", "ASIATICA", "asiatica", "Asiat"):
+        assert found(search) == ["Mei"]
+    for search in ("senorita", "SEÑORITA", "carinosa", "cariñ"):
+        assert found(search) == ["Nuria"]
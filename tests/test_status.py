@@ -0,0 +1,177 @@
+import asyncio
+import json
+from datetime import datetime
+
+import httpx
+
+from storage import WriteCoalescer
+from storage.memory import MemoryStatusRepository
+
+
+def seed(client, count):
+    for i in range(count):
+        assert client.post("/api/status", json={"client_name": f"client_{i}"}).status_code == 200
+
+
+def test_keyset_pages_cover_the_full_listing_once(client):
+    seed(client, 7)
+    client.post("/api/status", json={"client_name": "single"})
+    full = client.get("/api/status").json()
+    assert len(full) == 8
+    assert [(row["timestamp"], row["id"]) for row in full] == sorted(
+        ((row["timestamp"], row["id"]) for row in full), reverse=True
+    )
+
+    paged, cursor = [], None
+    while True:
+        response = client.get("/api/status", params={"limit": 3, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page) <= 3
+        paged.extend(page)
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert paged == full
+
+
+def test_last_full_page_has_no_cursor(client):
+    seed(client, 4)
+    response = client.get("/api/status", params={"limit": 4})
+    assert len(response.json()) == 4
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_invalid_cursor_is_a_400(client):
+    for cursor in ("not-a-cursor", "W10", "bm90IGpzb24"):
+        response = client.get("/api/status", params={"cursor": cursor})
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Invalid cursor"}
+
+
+def test_ndjson_stream_ends_with_next_cursor(client):
+    seed(client, 5)
+    full = client.get("/api/status").json()
+
+    response = client.get("/api/status", params={"format": "ndjson", "limit": 2})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[:2] == full[:2]
+    assert list(lines[2]) == ["next_cursor"]
+
+    rest = client.get("/api/status", params={"format": "ndjson", "cursor": lines[2]["next_cursor"]})
+    assert [json.loads(line) for line in rest.text.splitlines()] == full[2:]
+
+
+def test_ndjson_by_accept_header(client):
+    seed(client, 2)
+    response = client.get("/api/status", headers={"Accept": "application/x-ndjson"})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == client.get("/api/status").json()
+    assert "ETag" not in response.headers
+
+
+def test_batch_returns_created_rows(client):
+    response = client.post("/api/status/batch", json=[{"client_name": f"client_{i}"} for i in range(3)])
+    assert response.status_code == 200
+    rows = response.json()
+    assert [row["client_name"] for row in rows] == ["client_0", "client_1", "client_2"]
+    assert len({row["id"] for row in rows}) == 3
+    assert client.post("/api/status/batch", json=[]).json() == []
+
+
+def test_batch_over_limit_is_rejected(client, server):
+    response = client.post("/api/status/batch", json=[{"client_name": "x"}] * (server.STATUS_BATCH_MAX + 1))
+    assert response.status_code == 413
+    assert client.get("/api/status").json() == []
+
+
+def test_group_commit_batches_concurrent_inserts(server, monkeypatch):
+    monkeypatch.setenv("STATUS_WRITE_COALESCING", "1")
+    monkeypatch.setenv("STATUS_COALESCE_MS", "20")
+    server.configure_storage("memory")
+    assert server.status_writer is not None
+
+    batches = []
+    insert_many = server.storage.status_checks.insert_many
+
+    async def recording_insert_many(documents):
+        batches.append(len(documents))
+        return await insert_many(documents)
+
+    server.storage.status_checks.insert_many = recording_insert_many
+
+    async def post_concurrently():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            responses = await asyncio.gather(*(
+                client.post("/api/status", json={"client_name": f"c{i}"}) for i in range(20)
+            ))
+            listed = (await client.get("/api/status")).json()
+        await server.status_writer.close()
+        return responses, listed
+
+    responses, listed = asyncio.run(post_concurrently())
+    assert all(response.status_code == 200 for response in responses)
+    assert sum(batches) == 20
+    assert len(batches) < 20
+    assert sorted(row["id"] for row in listed) == sorted(response.json()["id"] for response in responses)
+
+
+def test_etag_revalidation(client):
+    seed(client, 2)
+    first = client.get("/api/status")
+    etag = first.headers["ETag"]
+
+    unchanged = client.get("/api/status", headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304
+    assert unchanged.content == b""
+    assert unchanged.headers["ETag"] == etag
+    assert client.get("/api/status", headers={"If-None-Match": f'W/{etag}, "other"'}).status_code == 304
+
+    client.post("/api/status", json={"client_name": "new"})
+    changed = client.get("/api/status", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert len(changed.json()) == 3
+
+
+def row(name):
+    return {"id": name, "client_name": name, "timestamp": datetime.utcnow()}
+
+
+def test_cancelled_insert_does_not_stop_the_coalescer():
+    async def main():
+        repository = MemoryStatusRepository()
+        writer = WriteCoalescer(repository, max_delay=0.01)
+        cancelled = asyncio.create_task(writer.insert(row("cancelled")))
+        kept = asyncio.create_task(writer.insert(row("kept")))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.wait_for(kept, 1)
+        await asyncio.wait_for(writer.insert(row("later")), 1)
+        await asyncio.wait_for(writer.close(), 1)
+        return cancelled.cancelled(), sorted(repository.rows)
+
+    assert asyncio.run(main()) == (True, ["cancelled", "kept", "later"])
+
+
+def test_failed_commit_fails_its_callers_and_later_inserts_still_commit():
+    class FlakyRepository(MemoryStatusRepository):
+        failures = 1
+
+        async def insert_many(self, documents):
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("down")
+            return await super().insert_many(documents)
+
+    async def main():
+        repository = FlakyRepository()
+        writer = WriteCoalescer(repository, max_delay=0.01)
+        failed = await asyncio.gather(writer.insert(row("a")), writer.insert(row("b")), return_exceptions=True)
+        await asyncio.wait_for(writer.insert(row("c")), 1)
+        await asyncio.wait_for(writer.close(), 1)
+        return [str(error) for error in failed], sorted(repository.rows)
+
+    assert asyncio.run(main()) == (["down", "down"], ["c"])
@@ -0,0 +1,132 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from storage import MemoryStorage, MotorStorage
+
+START = datetime(2026, 1, 1)
+
+
+def storages():
+    """The memory engine and the Motor one over an in-process mock of MongoDB"""
+    client = AsyncMongoMockClient()
+    return MemoryStorage(), MotorStorage(client, client["test"])
+
+
+def status_row(index, rng):
+    # Few distinct timestamps, so pages split runs of equal timestamps on the id
+    return {"id": f"{rng.randrange(10 ** 6):06d}-{index}", "client_name": f"client_{index}",
+            "timestamp": START + timedelta(seconds=rng.randrange(5))}
+
+
+async def status_pages(repository, limit):
+    pages, after = [], None
+    while True:
+        page = await repository.page(after, limit)
+        if not page:
+            return pages
+        pages.append(page)
+        after = (page[-1]["timestamp"], page[-1]["id"])
+
+
+def test_status_repositories_agree():
+    async def run(storage, rng):
+        repository = storage.status_checks
+        await repository.ensure_indexes()
+        rows = [status_row(index, rng) for index in range(40)]
+        for row in rows[:10]:
+            await repository.insert(dict(row))
+        failed = await repository.insert_many([dict(row) for row in rows[10:] + rows[:2]])
+        streamed = [row async for row in repository.stream((START + timedelta(seconds=3), "5"), 7, 3)]
+        return sorted(failed), [await status_pages(repository, limit) for limit in (1, 4, 50)], streamed
+
+    memory, motor = storages()
+    assert asyncio.run(run(memory, random.Random(13))) == asyncio.run(run(motor, random.Random(13)))
+
+
+def message(rng, users, profiles, when):
+    sender, receiver = rng.sample(users, 2)
+    return {
+        "_id": ObjectId(), "senderId": sender, "receiverId": receiver, "profileId": rng.choice(profiles),
+        "content": f"hola {rng.randrange(1000)}", "messageType": "text", "isRead": False, "isDeleted": False,
+        "attachments": [], "createdAt": when, "updatedAt": when,
+    }
+
+
+def test_message_and_conversation_repositories_agree():
+    users = [ObjectId() for _ in range(4)]
+    profiles = [ObjectId() for _ in range(2)]
+    rng = random.Random(13)
+    # Shared by both runs, so messages carry the same ids
+    script = []
+    for step in range(150):
+        if rng.random() < 0.2:
+            script.append(("read", *rng.sample(users, 2), rng.choice(profiles)))
+        else:
+            script.append(("send", message(rng, users, profiles, START + timedelta(milliseconds=step))))
+
+    async def run(storage):
+        await storage.ensure_indexes()
+        read = []
+        for action, *args in script:
+            if action == "send":
+                await storage.messages.insert(dict(args[0]))
+                await storage.conversations.record(dict(args[0]))
+            else:
+                flipped = await storage.messages.mark_read(*args)
+                await storage.conversations.mark_read(*args, flipped)
+                read.append(flipped)
+        result = {"read": read, "unread": [await storage.messages.unread_count(user) for user in users]}
+        result["threads"] = [
+            [(row["_id"], row["isRead"]) for row in await storage.messages.conversation(user, other, profile, 2, 5)]
+            for user in users for other in users for profile in profiles
+        ]
+        result["inboxes"] = {}
+        for user in users:
+            pages, after = [], None
+            while page := await storage.conversations.page(user, after, 3):
+                pages.append([{key: value for key, value in row.items() if key != "_id"} for row in page])
+                after = (page[-1]["lastMessageDate"], page[-1]["_id"])
+            result["inboxes"][user] = pages
+        return result
+
+    memory, motor = storages()
+    memory_result, motor_result = asyncio.run(run(memory)), asyncio.run(run(motor))
+    assert memory_result == motor_result
+    assert any(memory_result["read"]) and any(memory_result["unread"])
+
+
+def test_booking_and_user_repositories_agree():
+    profiles = [ObjectId() for _ in range(3)]
+    rng = random.Random(13)
+    bookings = [
+        {"_id": ObjectId(), "profileId": rng.choice(profiles), "date": START + timedelta(days=rng.randrange(10)),
+         "time": "10:00", "duration": 1, "status": rng.choice(["pending", "confirmed", "cancelled"])}
+        for _ in range(60)
+    ]
+    users = [{"_id": ObjectId(), "email": f"user{index}@example.com", "name": f"User {index}"} for index in range(5)]
+
+    async def run(storage):
+        for booking in bookings:
+            await storage.bookings.insert(dict(booking))
+        for booking in bookings[:10]:
+            await storage.bookings.delete(booking["_id"])
+        for booking in bookings[10:20]:
+            await storage.bookings.transition(booking["_id"], "pending", {"status": "cancelled"})
+        for user in users:
+            await storage.users.insert(dict(user))
+        holding = [
+            sorted(row["_id"] for row in await storage.bookings.holding(profile, START + timedelta(days=since), until))
+            for profile in profiles for since in (0, 3, 9)
+            for until in (None, START + timedelta(days=3), START + timedelta(days=7))
+        ]
+        found = [await storage.users.find_by_email(email) for email in ("USER3@example.com", "nobody@example.com")]
+        return holding, found
+
+    memory, motor = storages()
+    memory_result, motor_result = asyncio.run(run(memory)), asyncio.run(run(motor))
+    assert memory_result == motor_result
+    assert any(memory_result[0]) and memory_result[1][0]["name"] == "User 3"